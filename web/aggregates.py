@@ -0,0 +1,137 @@
+"""
+Maintenance of the coin_totals summary table.
+Every write path adds its rows to coin_totals in the same transaction, and
+rebuild/verify reconcile the table against investments.
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import case, delete, func, insert, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import CoinTotal, Investment
+
+# Relative tolerance when comparing float sums in verify_coin_totals
+VERIFY_TOLERANCE = 1e-6
+
+
+def coin_totals_upsert(dialect_name: str, rows: Iterable[Tuple[str, float, float, datetime]]):
+    """
+    Build an INSERT ... ON CONFLICT DO UPDATE adding new investments to coin_totals
+
+    Args:
+        dialect_name: Name of the database dialect ('postgresql' or 'sqlite')
+        rows: (coin_name, amount, purchase_price_usd, timestamp) of the new investments
+
+    Returns:
+        The upsert statement, or None if there are no rows
+    """
+    deltas: Dict[str, dict] = defaultdict(lambda: {
+        "count": 0, "total_amount": 0.0, "total_cost_usd": 0.0,
+        "first_timestamp": None, "last_timestamp": None
+    })
+    for coin_name, amount, price, timestamp in rows:
+        delta = deltas[coin_name]
+        delta["count"] += 1
+        delta["total_amount"] += amount
+        delta["total_cost_usd"] += amount * price
+        if delta["first_timestamp"] is None or timestamp < delta["first_timestamp"]:
+            delta["first_timestamp"] = timestamp
+        if delta["last_timestamp"] is None or timestamp > delta["last_timestamp"]:
+            delta["last_timestamp"] = timestamp
+    if not deltas:
+        return None
+
+    dialect_insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    stmt = dialect_insert(CoinTotal).values(
+        [{"coin_name": coin_name, **delta} for coin_name, delta in sorted(deltas.items())]
+    )
+    table, excluded = CoinTotal.__table__.c, stmt.excluded
+    return stmt.on_conflict_do_update(
+        index_elements=[CoinTotal.coin_name],
+        set_={
+            "count": table.count + excluded.count,
+            "total_amount": table.total_amount + excluded.total_amount,
+            "total_cost_usd": table.total_cost_usd + excluded.total_cost_usd,
+            "first_timestamp": case(
+                (excluded.first_timestamp < table.first_timestamp, excluded.first_timestamp),
+                else_=table.first_timestamp
+            ),
+            "last_timestamp": case(
+                (excluded.last_timestamp > table.last_timestamp, excluded.last_timestamp),
+                else_=table.last_timestamp
+            ),
+        }
+    )
+
+
+def _totals_from_investments():
+    """GROUP BY over investments producing coin_totals columns"""
+    return select(
+        Investment.coin_name,
+        func.count(Investment.id),
+        func.sum(Investment.amount),
+        func.sum(Investment.amount * Investment.purchase_price_usd),
+        func.min(Investment.timestamp),
+        func.max(Investment.timestamp)
+    ).group_by(Investment.coin_name)
+
+
+def rebuild_coin_totals(db: Session) -> int:
+    """
+    Recompute coin_totals from scratch (Master session).
+    Writers are blocked for the duration on PostgreSQL so no insert is lost.
+
+    Returns:
+        Number of coins written
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("LOCK TABLE investments IN SHARE MODE"))
+    db.execute(delete(CoinTotal))
+    db.execute(
+        insert(CoinTotal).from_select(
+            ["coin_name", "count", "total_amount", "total_cost_usd",
+             "first_timestamp", "last_timestamp"],
+            _totals_from_investments()
+        )
+    )
+    db.commit()
+    return db.scalar(select(func.count()).select_from(CoinTotal))
+
+
+def _differs(a, b) -> bool:
+    if isinstance(a, float) or isinstance(b, float):
+        return abs((a or 0) - (b or 0)) > VERIFY_TOLERANCE * max(1.0, abs(a or 0), abs(b or 0))
+    return a != b
+
+
+def verify_coin_totals(db: Session) -> List[dict]:
+    """
+    Compare coin_totals with a fresh aggregation of investments
+
+    Returns:
+        One entry per coin whose totals differ (empty when consistent)
+    """
+    expected = {row[0]: row[1:] for row in db.execute(_totals_from_investments())}
+    stored = {
+        row.coin_name: (row.count, row.total_amount, row.total_cost_usd,
+                        row.first_timestamp, row.last_timestamp)
+        for row in db.execute(select(CoinTotal)).scalars()
+    }
+    fields = ("count", "total_amount", "total_cost_usd", "first_timestamp", "last_timestamp")
+
+    mismatches = []
+    for coin_name in sorted(set(expected) | set(stored)):
+        want, have = expected.get(coin_name), stored.get(coin_name)
+        if want is None or have is None:
+            mismatches.append({"coin": coin_name, "expected": want, "stored": have})
+            continue
+        diff = {
+            field: {"expected": w, "stored": h}
+            for field, w, h in zip(fields, want, have) if _differs(w, h)
+        }
+        if diff:
+            mismatches.append({"coin": coin_name, "fields": diff})
+    return mismatches
@@ -0,0 +1,523 @@
+"""
+Load test and benchmark harness for the API.
+
+Boots main:app under uvicorn against the given database, with a fake
+CoinGecko server in its place, seeds the investments table to the requested
+size and drives a weighted mix of POST /invest, GET /history and GET /stats
+from concurrent clients. Throughput and p50/p95/p99 latency per endpoint
+are written as JSON (with the git commit) so runs can be compared.
+
+The replication mode drives write-only load (POST /invest, or POST
+/invest/batch with --batch-size) against a PostgreSQL master while sampling
+the replica's byte and time lag, and reports lag percentiles, the master's
+WAL rate, the time the replica needs to catch up once writes stop and the
+share of wal_keep_size the worst lag used.
+
+Usage:
+    python benchmark.py run [--database-url URL] [--rows N] [--concurrency N]
+                            [--duration S] [--mix invest=1,history=4,stats=2]
+                            [--output results.json]
+    python benchmark.py replication --database-url URL --replica-url URL
+                            [--concurrency N] [--duration S] [--batch-size N]
+                            [--sample-interval S] [--output results.json]
+    python benchmark.py compare baseline.json candidate.json
+    python benchmark.py fake-coingecko [--port N] [--latency-ms N]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Tuple
+
+import httpx
+import numpy as np
+
+from coins import CRYPTO_OPTIONS
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_DATABASE_URL = "sqlite:///benchmark.db"
+DEFAULT_MIX = "invest=1,history=4,stats=2"
+DEFAULT_BATCH_SIZE = 100
+
+# Seed rows inserted per statement
+SEED_CHUNK = 10000
+
+
+# ============================================
+# FAKE COINGECKO
+# ============================================
+def fake_price(coin_name: str) -> float:
+    """Deterministic price per coin, so runs are reproducible"""
+    return float(100 + sum(map(ord, coin_name)) % 900)
+
+
+def fake_coingecko_app(latency_ms: float = 0):
+    """Minimal /simple/price with optional artificial latency"""
+    from fastapi import FastAPI
+
+    app = FastAPI()
+
+    @app.get("/simple/price")
+    async def simple_price(ids: str = "", vs_currencies: str = "usd"):
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        return {coin: {"usd": fake_price(coin)} for coin in ids.split(",") if coin}
+
+    return app
+
+
+def cmd_fake_coingecko(args) -> int:
+    import uvicorn
+    uvicorn.run(fake_coingecko_app(args.latency_ms), host="127.0.0.1", port=args.port, log_level="warning")
+    return 0
+
+
+# ============================================
+# SETUP
+# ============================================
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=HERE, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def seed_database(url: str, rows: int, days: int, reset: bool, seed: int) -> int:
+    """
+    Bring the investments table up to `rows` rows spread over the last
+    `days` days, then rebuild coin_totals
+
+    Returns:
+        Rows inserted
+    """
+    from sqlalchemy import create_engine, func, insert, select
+    from sqlalchemy.orm import Session
+
+    from aggregates import rebuild_coin_totals
+    from models import Base, Investment
+    from schema import create_schema
+
+    engine = create_engine(url)
+    if reset:
+        Base.metadata.drop_all(bind=engine)
+    create_schema(engine)
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    with Session(engine) as db:
+        missing = max(0, rows - db.scalar(select(func.count()).select_from(Investment)))
+        for offset in range(0, missing, SEED_CHUNK):
+            chunk = []
+            for _ in range(min(SEED_CHUNK, missing - offset)):
+                coin = rng.choice(CRYPTO_OPTIONS)
+                chunk.append({
+                    "coin_name": coin,
+                    "amount": round(rng.uniform(0.01, 10), 4),
+                    "purchase_price_usd": fake_price(coin),
+                    "timestamp": now - timedelta(seconds=rng.uniform(0, days * 86400)),
+                })
+            db.execute(insert(Investment), chunk)
+        db.commit()
+        if missing:
+            rebuild_coin_totals(db)
+    engine.dispose()
+    return missing
+
+
+def start_process(argv: List[str], env: Dict[str, str]) -> subprocess.Popen:
+    # stderr goes to a file, never a pipe nobody drains during the run
+    log = tempfile.TemporaryFile(mode="w+")
+    process = subprocess.Popen(argv, cwd=HERE, env={**os.environ, **env},
+                               stdout=subprocess.DEVNULL, stderr=log, text=True)
+    process.log = log
+    return process
+
+
+def process_output(process: subprocess.Popen) -> str:
+    process.log.seek(0)
+    return process.log.read()
+
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited early:\n{process_output(process)}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up in {timeout}s")
+
+
+def stop_process(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+    process.log.close()
+
+
+@contextmanager
+def api_server(database_url: str, replica_url: str, workers: int, coingecko_latency_ms: float) -> Iterator[str]:
+    """Run main:app (with a fake CoinGecko) against the given databases; yields its base URL"""
+    coingecko_port, api_port = free_port(), free_port()
+    coingecko = start_process(
+        [sys.executable, "benchmark.py", "fake-coingecko", "--port", str(coingecko_port),
+         "--latency-ms", str(coingecko_latency_ms)], {}
+    )
+    api = None
+    try:
+        wait_until_up(f"http://127.0.0.1:{coingecko_port}/simple/price?ids=bitcoin", coingecko)
+        api = start_process(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(api_port),
+             "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+            {
+                "DATABASE_MASTER_URL": database_url,
+                "DATABASE_REPLICA_URL": replica_url,
+                "DATABASE_REPLICA_URLS": replica_url,
+                "DATABASE_SHARDS": "",
+                "COINGECKO_API_URL": f"http://127.0.0.1:{coingecko_port}",
+                "DB_ECHO": "0",
+            }
+        )
+        base_url = f"http://127.0.0.1:{api_port}"
+        wait_until_up(f"{base_url}/health", api)
+        yield base_url
+    finally:
+        if api is not None:
+            stop_process(api)
+        stop_process(coingecko)
+
+
+# ============================================
+# WORKLOAD
+# ============================================
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("invest", "batch", "history", "stats"):
+            raise argparse.ArgumentTypeError(f"Unknown endpoint in mix: {name!r}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def random_investment(rng: random.Random) -> dict:
+    return {"coin": rng.choice(CRYPTO_OPTIONS), "amount": round(rng.uniform(0.01, 5), 4)}
+
+
+def build_request(name: str, rng: random.Random, history_limit: int,
+                  batch_size: int = DEFAULT_BATCH_SIZE) -> Tuple[str, str, dict]:
+    """(method, path, httpx keyword arguments) for one request of the mix"""
+    if name == "invest":
+        return "POST", "/invest", {"json": random_investment(rng)}
+    if name == "batch":
+        return "POST", "/invest/batch", {"json": [random_investment(rng) for _ in range(batch_size)]}
+    if name == "history":
+        params = {"limit": history_limit}
+        if rng.random() < 0.5:
+            params["coin"] = rng.choice(CRYPTO_OPTIONS)
+        return "GET", "/history", {"params": params}
+    return "GET", "/stats", {}
+
+
+async def drive(base_url: str, weights: Dict[str, float], concurrency: int, duration: float,
+                warmup: float, history_limit: int, seed: int,
+                batch_size: int = DEFAULT_BATCH_SIZE) -> Dict[str, List[Tuple[float, int]]]:
+    """
+    Run `concurrency` closed-loop clients for warmup + duration seconds
+
+    Returns:
+        endpoint -> [(latency seconds, status code)] recorded after the warmup
+    """
+    names, cumulative = list(weights), list(np.cumsum(list(weights.values())))
+    samples: Dict[str, List[Tuple[float, int]]] = {name: [] for name in names}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    measure_from, stop_at = started + warmup, started + warmup + duration
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        async def client_loop(index: int):
+            rng = random.Random(seed + index)
+            while loop.time() < stop_at:
+                name = rng.choices(names, cum_weights=cumulative)[0]
+                method, path, kwargs = build_request(name, rng, history_limit, batch_size)
+                sent = time.perf_counter()
+                try:
+                    status = (await client.request(method, path, **kwargs)).status_code
+                except httpx.HTTPError:
+                    status = 0
+                if loop.time() >= measure_from:
+                    samples[name].append((time.perf_counter() - sent, status))
+
+        await asyncio.gather(*(client_loop(i) for i in range(concurrency)))
+    return samples
+
+
+def summarize(samples: List[Tuple[float, int]], duration: float) -> dict:
+    if not samples:
+        return {"requests": 0}
+    latencies = np.array([latency for latency, _ in samples]) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for _, status in samples if not 200 <= status < 400),
+        "throughput_rps": round(len(samples) / duration, 2),
+        "mean_ms": round(float(latencies.mean()), 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "max_ms": round(float(latencies.max()), 3),
+    }
+
+
+# ============================================
+# COMMANDS
+# ============================================
+def cmd_run(args) -> int:
+    weights = args.mix
+    replica_url = args.replica_url or args.database_url
+
+    print(f"🌱 Seeding {args.database_url} to {args.rows} row(s)...")
+    seeded = seed_database(args.database_url, args.rows, args.days, args.reset, args.seed)
+    print(f"   {seeded} row(s) inserted")
+
+    with api_server(args.database_url, replica_url, args.workers, args.coingecko_latency_ms) as base_url:
+        print(f"🏁 {args.concurrency} client(s), {args.warmup}s warmup + {args.duration}s, mix {weights}")
+        samples = asyncio.run(drive(base_url, weights, args.concurrency, args.duration,
+                                    args.warmup, args.history_limit, args.seed))
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "database": args.database_url.split("@")[-1],
+            "rows": args.rows,
+            "concurrency": args.concurrency,
+            "duration_seconds": args.duration,
+            "workers": args.workers,
+            "mix": weights,
+            "history_limit": args.history_limit,
+            "coingecko_latency_ms": args.coingecko_latency_ms,
+            "seed": args.seed,
+        },
+        "endpoints": {name: summarize(values, args.duration) for name, values in samples.items()},
+        "total": summarize([s for values in samples.values() for s in values], args.duration),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"✅ Results written to {args.output}")
+    print(output)
+    return 0
+
+
+async def replication_load(args, base_url: str) -> dict:
+    """
+    Drive write load on the API while sampling the replica's lag, then wait
+    for the replica to catch up
+
+    Returns:
+        Request samples, lag summary over the measured window, catch-up time,
+        wal_keep_size and the raw lag series
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from database import to_async_url
+    from replication import ReplicationMonitor, wal_keep_size
+
+    master = create_async_engine(to_async_url(args.database_url), pool_size=2)
+    replica = create_async_engine(to_async_url(args.replica_url), pool_size=2)
+    monitor = ReplicationMonitor(master, [("replica", replica)], interval=args.sample_interval,
+                                 history_size=int((args.warmup + args.duration + args.catch_up_timeout)
+                                                  / args.sample_interval) + 16)
+    try:
+        keep_size = await wal_keep_size(master)
+        endpoint = "batch" if args.batch_size > 1 else "invest"
+        measure_from = time.time() + args.warmup
+        monitor.start()
+        samples = await drive(base_url, {endpoint: 1}, args.concurrency, args.duration, args.warmup,
+                              0, args.seed, args.batch_size)
+        measure_to = time.time()
+        await monitor.stop()
+        lag = monitor.summary(since=measure_from)
+
+        # Catch-up: time from the end of the load until the replica has replayed everything
+        caught_up = None
+        while time.time() - measure_to < args.catch_up_timeout:
+            point = (await monitor.sample())["replicas"]["replica"]
+            if point.get("lag_bytes") == 0:
+                caught_up = round(time.time() - measure_to, 3)
+                break
+            await asyncio.sleep(args.sample_interval)
+
+        series = [point for point in monitor.samples if point["at"] >= measure_from]
+    finally:
+        await monitor.stop()
+        await master.dispose()
+        await replica.dispose()
+    return {"samples": samples, "lag": lag, "catch_up_seconds": caught_up,
+            "wal_keep_size_bytes": keep_size, "series": series}
+
+
+def cmd_replication(args) -> int:
+    if not args.database_url.startswith("postgresql") or not args.replica_url:
+        print("❌ The replication benchmark needs a PostgreSQL --database-url and its streaming --replica-url")
+        return 1
+
+    print(f"🌱 Seeding {args.database_url} to {args.rows} row(s)...")
+    seeded = seed_database(args.database_url, args.rows, args.days, False, args.seed)
+    print(f"   {seeded} row(s) inserted")
+
+    with api_server(args.database_url, args.replica_url, args.workers, 0) as base_url:
+        load = "POST /invest" if args.batch_size <= 1 else f"POST /invest/batch of {args.batch_size}"
+        print(f"🏁 {args.concurrency} writer(s), {args.warmup}s warmup + {args.duration}s of {load}, "
+              f"lag sampled every {args.sample_interval}s")
+        result = asyncio.run(replication_load(args, base_url))
+
+    writes = [s for values in result["samples"].values() for s in values]
+    lag = result["lag"]
+    replica_lag = lag["replicas"]["replica"]
+    keep_size = result["wal_keep_size_bytes"]
+    max_lag = (replica_lag["lag_bytes"] or {}).get("max")
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "database": args.database_url.split("@")[-1],
+            "replica": args.replica_url.split("@")[-1],
+            "rows": args.rows,
+            "concurrency": args.concurrency,
+            "duration_seconds": args.duration,
+            "workers": args.workers,
+            "batch_size": args.batch_size,
+            "sample_interval_seconds": args.sample_interval,
+            "seed": args.seed,
+        },
+        "writes": dict(summarize(writes, args.duration),
+                       rows_per_second=round(len(writes) * max(1, args.batch_size) / args.duration, 1)),
+        "replication": {
+            "samples": lag["samples"],
+            "lag_bytes": replica_lag["lag_bytes"],
+            "lag_seconds": replica_lag["lag_seconds"],
+            "sample_errors": replica_lag["errors"],
+            "wal_rate_bytes_per_second": lag["wal_rate_bytes_per_second"],
+            "catch_up_seconds": result["catch_up_seconds"],
+            "wal_keep_size_bytes": keep_size,
+            "max_lag_of_wal_keep_size": round(max_lag / keep_size, 4) if keep_size and max_lag is not None else None,
+        },
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(json.dumps(dict(report, series=result["series"]), indent=2) + "\n")
+        print(f"✅ Results (with the lag series) written to {args.output}")
+    print(json.dumps(report, indent=2))
+    if result["catch_up_seconds"] is None:
+        print(f"⚠️  The replica did not catch up within {args.catch_up_timeout}s of the end of the load")
+    return 0
+
+
+def cmd_compare(args) -> int:
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    print(f"{baseline['meta']['commit']} -> {candidate['meta']['commit']}")
+    print(f"{'endpoint':<10} {'metric':<15} {'baseline':>12} {'candidate':>12} {'change':>9}")
+    for name in ["total"] + sorted(candidate["endpoints"]):
+        old = baseline["total"] if name == "total" else baseline["endpoints"].get(name, {})
+        new = candidate["total"] if name == "total" else candidate["endpoints"][name]
+        for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            if metric not in old or metric not in new:
+                continue
+            change = (new[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+            print(f"{name:<10} {metric:<15} {old[metric]:>12.2f} {new[metric]:>12.2f} {change:>+8.1f}%")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Seed, boot the API and drive the workload")
+    run.add_argument("--database-url", default=os.getenv("BENCHMARK_DATABASE_URL", DEFAULT_DATABASE_URL),
+                     help="Master database (a scratch PostgreSQL or SQLite file; default %(default)s)")
+    run.add_argument("--replica-url", default=None, help="Read database (default: same as --database-url)")
+    run.add_argument("--rows", type=int, default=10000, help="Investments in the table before the run")
+    run.add_argument("--days", type=int, default=90, help="Seeded rows span this many past days")
+    run.add_argument("--reset", action="store_true", help="Drop and recreate the tables first")
+    run.add_argument("--concurrency", type=int, default=16, help="Concurrent clients")
+    run.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    run.add_argument("--warmup", type=float, default=5, help="Unmeasured seconds before the run")
+    run.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    run.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="Endpoint weights (default %(default)s)")
+    run.add_argument("--history-limit", type=int, default=50, help="Page size of GET /history")
+    run.add_argument("--coingecko-latency-ms", type=float, default=0, help="Artificial fake CoinGecko latency")
+    run.add_argument("--seed", type=int, default=42, help="Random seed for data and request mix")
+    run.add_argument("--output", help="Write the JSON report to this file")
+    run.set_defaults(func=cmd_run)
+
+    replication = commands.add_parser(
+        "replication", help="Drive write load on a PostgreSQL master and measure its replica's lag"
+    )
+    replication.add_argument("--database-url", default=os.getenv("BENCHMARK_DATABASE_URL", ""),
+                             help="Master database (a scratch PostgreSQL with a streaming replica)")
+    replication.add_argument("--replica-url", default=os.getenv("BENCHMARK_REPLICA_URL", ""),
+                             help="Streaming replica of --database-url")
+    replication.add_argument("--rows", type=int, default=10000, help="Investments in the table before the run")
+    replication.add_argument("--days", type=int, default=90, help="Seeded rows span this many past days")
+    replication.add_argument("--concurrency", type=int, default=16, help="Concurrent writers")
+    replication.add_argument("--duration", type=float, default=60, help="Measured seconds")
+    replication.add_argument("--warmup", type=float, default=5, help="Unmeasured seconds before the run")
+    replication.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    replication.add_argument("--batch-size", type=int, default=1,
+                             help="Rows per request: 1 posts /invest, more posts /invest/batch")
+    replication.add_argument("--sample-interval", type=float, default=0.25, help="Seconds between lag samples")
+    replication.add_argument("--catch-up-timeout", type=float, default=60,
+                             help="Longest wait for the replica to catch up after the load")
+    replication.add_argument("--seed", type=int, default=42, help="Random seed for data and requests")
+    replication.add_argument("--output", help="Write the JSON report, with the lag series, to this file")
+    replication.set_defaults(func=cmd_replication)
+
+    compare = commands.add_parser("compare", help="Compare two JSON reports")
+    compare.add_argument("baseline")
+    compare.add_argument("candidate")
+    compare.set_defaults(func=cmd_compare)
+
+    fake = commands.add_parser("fake-coingecko", help="Serve a fake CoinGecko /simple/price")
+    fake.add_argument("--port", type=int, default=8765)
+    fake.add_argument("--latency-ms", type=float, default=0)
+    fake.set_defaults(func=cmd_fake_coingecko)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,22 @@
+"""
+Coins offered by the dashboard and always kept warm by the API price refresher
+"""
+
+# Lista de criptomonedas populares (CoinGecko ids)
+CRYPTO_OPTIONS = [
+    "bitcoin",
+    "ethereum",
+    "binancecoin",
+    "cardano",
+    "solana",
+    "ripple",
+    "dogecoin",
+    "polkadot",
+    "avalanche-2",
+    "chainlink",
+    "matic-network",
+    "litecoin",
+    "shiba-inu",
+    "tron",
+    "uniswap"
+]
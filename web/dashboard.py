@@ -1,8 +1,12 @@
 import streamlit as st
 import requests
 import pandas as pd
+import threading
+import time
 from datetime import datetime
 
+from coins import CRYPTO_OPTIONS
+
 # CONFIGURACIÓN DE LA PÁGINA
 st.set_page_config(
     page_title="Sistema Distribuido Crypto",
@@ -14,6 +18,151 @@ st.set_page_config(
 # CONFIGURACIÓN DE LA API
 API_BASE_URL = "http://localhost:8000"
 
+# Modo en vivo: cada cuántos segundos el script mira si llegó un evento (los
+# widgets siguen respondiendo entre comprobaciones) y tiempo máximo sin recibir
+# nada del stream (el API envía un keep-alive cada 15 s) antes de reconectar
+LIVE_POLL = 0.5
+LIVE_READ_TIMEOUT = 45
+
+
+def read_headers():
+    """Cabeceras para lecturas: incluye el token de la última escritura (read-your-writes)"""
+    token = st.session_state.get("consistency_token")
+    return {"X-Consistency-Token": token} if token else {}
+
+
+def conditional_get(path, params=None):
+    """
+    GET con ETag: reenvía If-None-Match solo si hay un cuerpo guardado en la
+    sesión y, si el API responde 304, lo reutiliza. Devuelve (status_code,
+    datos); ante un error, datos es {}.
+    """
+    cache = st.session_state.setdefault("etag_cache", {})
+    key = (path, tuple(sorted((params or {}).items())))
+    headers = read_headers()
+    cached = cache.get(key)
+    if cached is not None:
+        headers["If-None-Match"] = cached[0]
+    response = requests.get(f"{API_BASE_URL}{path}", params=params, headers=headers, timeout=5)
+    if response.status_code == 304 and cached is not None:
+        return 200, cached[1]
+    if response.status_code == 200:
+        data = response.json()
+        if "ETag" in response.headers:
+            cache[key] = (response.headers["ETag"], data)
+        else:
+            cache.pop(key, None)
+        return 200, data
+    cache.pop(key, None)
+    return response.status_code, {}
+
+
+HISTORY_COLUMNS = {
+    'id': 'ID',
+    'coin_name': 'Moneda',
+    'amount': 'Cantidad',
+    'purchase_price_usd': 'Precio',
+    'total_value_usd': 'Total',
+    'timestamp': 'Fecha'
+}
+
+
+def format_history(rows):
+    """Filas de /history -> DataFrame listo para mostrar (operaciones por columna)"""
+    df = pd.DataFrame(rows, columns=list(HISTORY_COLUMNS))
+    df['timestamp'] = pd.to_datetime(df['timestamp']).dt.strftime('%Y-%m-%d %H:%M:%S')
+    df['purchase_price_usd'] = df['purchase_price_usd'].map('${:,.2f}'.format)
+    df['total_value_usd'] = df['total_value_usd'].map('${:,.2f}'.format)
+    return df.rename(columns=HISTORY_COLUMNS)
+
+
+def prepend_rows(cached, new):
+    """
+    Añade arriba las filas nuevas (ordenadas de más reciente a más antigua).
+    Una fila que se confirmó tarde puede ser más antigua que las primeras de
+    la caché: solo se reordena ese tramo superior, nunca la tabla entera.
+    """
+    if cached.empty or new['Fecha'].iloc[-1] >= cached['Fecha'].iloc[0]:
+        return pd.concat([new, cached], ignore_index=True)
+    # Fecha está en orden descendente: tramo de la caché más reciente que la fila nueva más antigua
+    top = len(cached) - cached['Fecha'].to_numpy()[::-1].searchsorted(new['Fecha'].iloc[-1], side='left')
+    head = pd.concat([new, cached.iloc[:top]]).sort_values(['Fecha', 'ID'], ascending=False)
+    return pd.concat([head, cached.iloc[top:]], ignore_index=True)
+
+
+def sync_history():
+    """
+    Historial cacheado en la sesión: solo se piden (y formatean) las filas
+    nuevas desde la última lectura, que se añaden arriba de la tabla. El API
+    devuelve en X-Sync-Cursor el último id de cada shard (cada shard avanza
+    a su ritmo), sin pasar de las filas de los últimos segundos, y se reenvía
+    como /history?since_id=. Esas filas recientes llegan otra vez por si una
+    transacción más lenta confirma después un id menor; las ya mostradas se
+    descartan con el conjunto de ids guardado en la sesión.
+    Devuelve None si el API responde con error.
+    """
+    cached = st.session_state.get("history_df")
+    sync_cursor = st.session_state.get("history_sync_cursor")
+    params = None
+    if cached is not None and sync_cursor and "history_seen_ids" in st.session_state:
+        params = {"since_id": sync_cursor}
+    response = requests.get(f"{API_BASE_URL}/history", params=params, headers=read_headers(), timeout=5)
+    if response.status_code != 200:
+        return None
+
+    rows = response.json()
+    if params is None:
+        cached = format_history(rows)
+        st.session_state["history_seen_ids"] = {row['id'] for row in rows}
+        st.session_state["history_df"] = cached
+    else:
+        seen = st.session_state["history_seen_ids"]
+        rows = [row for row in rows if row['id'] not in seen]
+        if rows:
+            seen.update(row['id'] for row in rows)
+            cached = prepend_rows(cached, format_history(rows))
+            st.session_state["history_df"] = cached
+    if "X-Sync-Cursor" in response.headers:
+        st.session_state["history_sync_cursor"] = response.headers["X-Sync-Cursor"]
+    return cached
+
+
+class LiveListener:
+    """
+    Hilo en segundo plano que lee GET /live/investments (server-sent events)
+    y activa `changed` con cada inversión nueva, para que el script de
+    Streamlit nunca se quede bloqueado en la red
+    """
+
+    def __init__(self):
+        self.changed = threading.Event()
+        self.stopped = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        connected_before = False
+        while not self.stopped.is_set():
+            try:
+                with requests.get(f"{API_BASE_URL}/live/investments", stream=True,
+                                  timeout=(5, LIVE_READ_TIMEOUT)) as response:
+                    if connected_before:
+                        # Eventos perdidos mientras no había conexión: sincronizar igualmente
+                        self.changed.set()
+                    connected_before = True
+                    for line in response.iter_lines():
+                        if self.stopped.is_set():
+                            return
+                        if line.startswith(b"data:"):
+                            self.changed.set()
+            except requests.exceptions.RequestException:
+                pass
+            # API caída o stream cerrado: reintentar sin bucle activo
+            self.stopped.wait(5)
+
+    def stop(self):
+        self.stopped.set()
+
+
 # ESTILOS CSS PERSONALIZADOS
 st.markdown("""
 <style>
@@ -88,23 +237,7 @@ with col1:
         st.markdown("#### Registrar Inversión")
         
         # Lista de criptomonedas populares
-        crypto_options = [
-            "bitcoin",
-            "ethereum",
-            "binancecoin",
-            "cardano",
-            "solana",
-            "ripple",
-            "dogecoin",
-            "polkadot",
-            "avalanche-2",
-            "chainlink",
-            "matic-network",
-            "litecoin",
-            "shiba-inu",
-            "tron",
-            "uniswap"
-        ]
+        crypto_options = CRYPTO_OPTIONS
         
         # Select input
         selected_val = st.selectbox(
@@ -144,25 +277,10 @@ with col1:
                     if response.status_code == 200:
                         data = response.json()
                         
-                        # Success message - VERDE LLAMATIVO
-                        st.markdown(
-                            f"""
-                            <div class="success-box">
-                                <h3 style="margin:0; font-size:1.5rem;">✅ Datos escritos en NODO MAESTRO (172.20.0.10)</h3>
-                                <p style="margin:0.5rem 0; font-size:1.1rem;"><strong>Inversión registrada exitosamente</strong></p>
-                                <hr style="margin:1rem 0;">
-                                <p><strong>🪙 Moneda:</strong> {data['investment']['coin'].upper()}</p>
-                                <p><strong>📊 Cantidad:</strong> {data['investment']['amount']}</p>
-                                <p><strong>💵 Precio:</strong> ${data['investment']['price_per_coin_usd']:,.2f} USD</p>
-                                <p><strong>💰 Total:</strong> ${data['investment']['total_value_usd']:,.2f} USD</p>
-                            </div>
-                            """,
-                            unsafe_allow_html=True
-                        )
-                        
-                        # Auto-refresh después de 2 segundos
-                        import time
-                        time.sleep(2)
+                        # Guardar el token de consistencia: las lecturas siguientes
+                        # verán esta inversión sin esperas artificiales
+                        st.session_state["consistency_token"] = data.get("consistency_token")
+                        st.session_state["last_investment"] = data["investment"]
                         st.rerun()
                     else:
                         st.error(f"❌ Error: {response.json().get('detail', 'Error desconocido')}")
@@ -172,43 +290,49 @@ with col1:
                 except Exception as e:
                     st.error(f"❌ Error inesperado: {str(e)}")
 
+    # Success message - VERDE LLAMATIVO (tras el rerun posterior a la escritura)
+    last_investment = st.session_state.pop("last_investment", None)
+    if last_investment:
+        st.markdown(
+            f"""
+            <div class="success-box">
+                <h3 style="margin:0; font-size:1.5rem;">✅ Datos escritos en NODO MAESTRO (172.20.0.10)</h3>
+                <p style="margin:0.5rem 0; font-size:1.1rem;"><strong>Inversión registrada exitosamente</strong></p>
+                <hr style="margin:1rem 0;">
+                <p><strong>🪙 Moneda:</strong> {last_investment['coin'].upper()}</p>
+                <p><strong>📊 Cantidad:</strong> {last_investment['amount']}</p>
+                <p><strong>💵 Precio:</strong> ${last_investment['price_per_coin_usd']:,.2f} USD</p>
+                <p><strong>💰 Total:</strong> ${last_investment['total_value_usd']:,.2f} USD</p>
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
+
 # PANEL DERECHO - LECTURA DE LA RÉPLICA
 with col2:
     st.markdown("### 📖 Lectura de la Réplica")
     st.markdown('<div class="node-badge-read">� Leyendo datos del NODO RÉPLICA (172.20.0.11)</div>', unsafe_allow_html=True)
     
     # Botón para actualizar datos
+    # (descarta la caché del historial y lo vuelve a leer completo)
     if st.button("🔄 Actualizar Datos", use_container_width=True, type="secondary"):
+        st.session_state.pop("history_df", None)
+        st.session_state.pop("history_sync_cursor", None)
+        st.session_state.pop("history_seen_ids", None)
         st.rerun()
     
+    # En vivo: el dashboard se refresca cuando el API notifica una escritura
+    live = st.toggle("🔴 En vivo", value=False, help="Actualiza el historial al registrarse una inversión")
+    
     st.markdown("#### 📋 Historial de Inversiones")
     
     try:
         # GET request to API (reads from Replica)
-        response = requests.get(f"{API_BASE_URL}/history", timeout=5)
+        # Solo las filas nuevas desde el último render (GET /history?since_id=<X-Sync-Cursor>)
+        df_display = sync_history()
         
-        if response.status_code == 200:
-            history_data = response.json()
-            
-            if history_data:
-                # Convert to DataFrame
-                df = pd.DataFrame(history_data)
-                
-                # Format columns
-                df['timestamp'] = pd.to_datetime(df['timestamp']).dt.strftime('%Y-%m-%d %H:%M:%S')
-                df['purchase_price_usd'] = df['purchase_price_usd'].apply(lambda x: f"${x:,.2f}")
-                df['total_value_usd'] = df['total_value_usd'].apply(lambda x: f"${x:,.2f}")
-                
-                # Rename columns for display
-                df_display = df.rename(columns={
-                    'id': 'ID',
-                    'coin_name': 'Moneda',
-                    'amount': 'Cantidad',
-                    'purchase_price_usd': 'Precio',
-                    'total_value_usd': 'Total',
-                    'timestamp': 'Fecha'
-                })
-                
+        if df_display is not None:
+            if not df_display.empty:
                 # Display table
                 st.dataframe(
                     df_display,
@@ -217,7 +341,7 @@ with col2:
                     height=400
                 )
                 
-                st.info(f"📊 Total de {len(history_data)} inversión(es) leída(s) desde RÉPLICA")
+                st.info(f"📊 Total de {len(df_display)} inversión(es) leída(s) desde RÉPLICA")
             else:
                 st.warning("📭 No hay inversiones registradas todavía")
         else:
@@ -232,21 +356,32 @@ with col2:
 st.markdown("---")
 st.markdown("## 📈 Evolución del Portafolio")
 
+# Granularidad del gráfico: el API devuelve un punto por intervalo
+bucket = st.radio(
+    "Intervalo",
+    options=["1h", "1d"],
+    index=0,
+    horizontal=True,
+    format_func=lambda x: "Por hora" if x == "1h" else "Por día"
+)
+
 try:
-    # Get history for chart
-    response = requests.get(f"{API_BASE_URL}/history", timeout=5)
+    # Serie acumulada ya agregada en la RÉPLICA (date_trunc + SUM window)
+    response = requests.get(
+        f"{API_BASE_URL}/history/timeseries",
+        params={"bucket": bucket},
+        headers=read_headers(),
+        timeout=5
+    )
     
     if response.status_code == 200:
-        history_data = response.json()
+        points = response.json()["points"]
         
-        if history_data and len(history_data) > 0:
+        if points:
             # Create DataFrame for chart
-            df_chart = pd.DataFrame(history_data)
+            df_chart = pd.DataFrame(points)
             df_chart['timestamp'] = pd.to_datetime(df_chart['timestamp'])
-            df_chart = df_chart.sort_values('timestamp')
-            
-            # Calculate cumulative value
-            df_chart['Valor Acumulado USD'] = df_chart['total_value_usd'].cumsum()
+            df_chart = df_chart.rename(columns={'cumulative_usd': 'Valor Acumulado USD'})
             
             # Create beautiful line chart
             chart_data = df_chart.set_index('timestamp')[['Valor Acumulado USD']]
@@ -256,15 +391,18 @@ try:
                 height=400
             )
             
-            # Summary metrics
+            # Summary metrics (coin_totals: O(monedas))
+            stats_status, stats = conditional_get("/stats")
             col_met1, col_met2, col_met3 = st.columns(3)
             with col_met1:
                 st.metric("💰 Total Invertido", f"${df_chart['Valor Acumulado USD'].iloc[-1]:,.2f}")
             with col_met2:
-                st.metric("📊 Total Operaciones", len(history_data))
+                st.metric("📊 Total Operaciones", int(df_chart['count'].sum()))
             with col_met3:
-                unique_coins = df_chart['coin_name'].nunique()
-                st.metric("🪙 Monedas Diferentes", unique_coins)
+                if stats_status == 200:
+                    st.metric("🪙 Monedas Diferentes", len(stats.get("coins") or {}))
+                else:
+                    st.metric("🪙 Monedas Diferentes", "—")
         else:
             st.info("📊 No hay suficientes datos para mostrar el gráfico. ¡Registra tu primera inversión!")
 except Exception as e:
@@ -281,3 +419,20 @@ st.markdown(
     """,
     unsafe_allow_html=True
 )
+
+# MODO EN VIVO: el hilo de escucha marca cuándo hay inversiones nuevas; el
+# script comprueba la marca cada LIVE_POLL segundos y escribe en la página
+# entre comprobaciones, así que un clic en un widget interrumpe la espera
+# (el historial solo pide las filas nuevas)
+listener = st.session_state.get("live_listener")
+if live:
+    if listener is None:
+        listener = st.session_state["live_listener"] = LiveListener()
+    status = st.empty()
+    while not listener.changed.wait(LIVE_POLL):
+        status.caption(f"🔴 En vivo · última comprobación {datetime.now():%H:%M:%S}")
+    listener.changed.clear()
+    st.rerun()
+elif listener is not None:
+    listener.stop()
+    del st.session_state["live_listener"]
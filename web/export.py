@@ -0,0 +1,323 @@
+"""
+Bulk export of the investments table for analytics jobs (GET /export).
+
+Rows are read from the replica in batches and encoded as they arrive, so
+memory stays bounded whatever the table size:
+
+    csv      CSV text.
+    arrow    Arrow IPC stream, one record batch per batch.
+    parquet  Parquet file, one row group per batch.
+
+On PostgreSQL every format is fed by COPY (SELECT ...) TO STDOUT: the server
+writes CSV straight onto the connection, cut into EXPORT_CHUNK_BYTES chunks
+on row boundaries. CSV goes to the client as is; for Arrow and Parquet each
+chunk is parsed by pyarrow's multithreaded CSV reader, off the event loop.
+No row ever becomes a Python object, which keeps the export close to the
+speed of the replica's COPY. Elsewhere (SQLite) rows come from a server-side
+cursor in batches of EXPORT_BATCH_ROWS.
+
+Rows come in storage order (no ORDER BY, so no sort and no index walk on a
+full export). With several shards, the shards are exported one after another.
+Arrow and Parquet need pyarrow, imported on first use so the API's startup
+does not pay for it. Every nested stream is closed explicitly (aclosing), so
+an export abandoned by its client releases its COPY before the request's
+sessions are returned to the pool.
+"""
+import asyncio
+import csv
+import io
+import os
+from contextlib import aclosing
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from metrics import EXPORT_ROWS
+from models import Investment
+
+# ============================================
+# CONFIGURATION
+# ============================================
+# Bytes of COPY output per batch (PostgreSQL); 4 MB is about 80,000 rows
+EXPORT_CHUNK_BYTES = int(os.getenv("EXPORT_CHUNK_BYTES", str(4 << 20)))
+
+# Rows per batch when reading through a server-side cursor (no COPY)
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "65536"))
+
+# Parquet compression codec (snappy, zstd, gzip, none)
+EXPORT_PARQUET_COMPRESSION = os.getenv("EXPORT_PARQUET_COMPRESSION", "snappy")
+
+# Chunks of COPY output read ahead of the client
+_COPY_READ_AHEAD = 2
+
+EXPORT_COLUMNS = (
+    Investment.id,
+    Investment.coin_name,
+    Investment.amount,
+    Investment.purchase_price_usd,
+    Investment.timestamp,
+)
+EXPORT_FIELDS = [column.key for column in EXPORT_COLUMNS]
+
+# format -> (media type, file extension)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def export_query(coin: Optional[str], start: Optional[datetime], end: Optional[datetime]):
+    """Filtered, unordered SELECT of the exported columns"""
+    query = select(*EXPORT_COLUMNS)
+    if coin:
+        query = query.where(Investment.coin_name == coin.strip().lower())
+    if start is not None:
+        query = query.where(Investment.timestamp >= start)
+    if end is not None:
+        query = query.where(Investment.timestamp < end)
+    return query
+
+
+def require_pyarrow(format: str):
+    """
+    Raises:
+        ImportError: If `format` needs pyarrow and it is not installed
+    """
+    if format in ("arrow", "parquet"):
+        import pyarrow  # noqa: F401
+
+
+# ============================================
+# ROW SOURCES
+# ============================================
+def _row_boundary(data: bytes) -> int:
+    """
+    Length of the longest prefix of CSV `data` made of whole rows. A newline
+    ends a row only outside quotes, i.e. after an even number of quote
+    characters ("" escapes count twice, so they keep the parity).
+    """
+    end = data.rfind(b"\n")
+    if b'"' not in data:
+        return end + 1
+    while end >= 0 and data.count(b'"', 0, end) % 2:
+        end = data.rfind(b"\n", 0, end)
+    return end + 1
+
+
+class _CopyCsv:
+    """
+    COPY (query) TO STDOUT WITH CSV on one PostgreSQL session, read as
+    chunks of whole rows. The server is throttled by a small queue: when the
+    client reads slowly, COPY waits instead of buffering.
+    """
+
+    def __init__(self, db: AsyncSession, query):
+        self.db = db
+        self.query = query
+        self.rows = 0
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        conn = await self.db.connection()
+        compiled = self.query.compile(dialect=conn.dialect)
+        args = [compiled.params[name] for name in compiled.positiontup]
+        raw = await conn.get_raw_connection()
+
+        chunks: asyncio.Queue = asyncio.Queue(maxsize=_COPY_READ_AHEAD)
+        done = object()
+        pending = bytearray()
+
+        async def collect(data: bytes):
+            pending.extend(data)
+            if len(pending) >= EXPORT_CHUNK_BYTES:
+                cut = _row_boundary(pending)
+                if cut:
+                    await chunks.put(bytes(pending[:cut]))
+                    del pending[:cut]
+
+        async def copy():
+            try:
+                status = await raw.driver_connection.copy_from_query(
+                    compiled.string, *args, output=collect, format="csv"
+                )
+                self.rows = int(status.split()[-1])
+                if pending:
+                    await chunks.put(bytes(pending))
+                await chunks.put(done)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await chunks.put(e)
+
+        task = asyncio.get_running_loop().create_task(copy())
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is done:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            if not task.done():
+                task.cancel()  # client went away: stop the COPY
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+                # The protocol is left mid-COPY: close the connection instead of pooling it
+                await conn.invalidate()
+
+
+async def _row_batches(sessions: List[AsyncSession], query) -> AsyncIterator[list]:
+    """Server-side cursor batches of every shard, one shard after another"""
+    streamed = query.execution_options(yield_per=EXPORT_BATCH_ROWS)
+    for db in sessions:
+        result = await db.stream(streamed)
+        try:
+            async for partition in result.partitions():
+                yield partition
+        finally:
+            await result.close()
+
+
+def _uses_copy(sessions: List[AsyncSession]) -> bool:
+    return sessions[0].get_bind().dialect.name == "postgresql"
+
+
+# ============================================
+# ENCODERS
+# ============================================
+class _ChunkSink:
+    """Write-only file object whose contents are taken after every batch"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _arrow_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("id", pa.int64()),
+        ("coin_name", pa.string()),
+        ("amount", pa.float64()),
+        ("purchase_price_usd", pa.float64()),
+        ("timestamp", pa.timestamp("us")),
+    ])
+
+
+def _parse_csv(schema, chunk: bytes):
+    """Whole CSV rows from COPY -> Arrow table (pyarrow's C++ reader, all cores)"""
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    return pa_csv.read_csv(
+        pa.py_buffer(chunk),
+        read_options=pa_csv.ReadOptions(column_names=schema.names),
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(column_types=schema),
+    )
+
+
+def _rows_to_table(schema, rows: list):
+    """Cursor rows (tuples) -> Arrow table, one column array at a time"""
+    import pyarrow as pa
+    columns = zip(*rows)
+    return pa.Table.from_arrays(
+        [pa.array(values, type=field.type) for field, values in zip(schema, columns)], schema=schema
+    )
+
+
+def _rows_to_csv(rows: list) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    return buffer.getvalue().encode()
+
+
+async def _csv_stream(sessions: List[AsyncSession], query) -> AsyncIterator[bytes]:
+    yield (",".join(EXPORT_FIELDS) + "\n").encode()
+    rows = 0
+    if _uses_copy(sessions):
+        for db in sessions:
+            copy = _CopyCsv(db, query)
+            async with aclosing(copy.chunks()) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+            rows += copy.rows
+    else:
+        async with aclosing(_row_batches(sessions, query)) as batches:
+            async for batch in batches:
+                rows += len(batch)
+                yield _rows_to_csv(batch)
+    EXPORT_ROWS.inc("csv", amount=rows)
+
+
+async def _arrow_tables(sessions: List[AsyncSession], query, schema) -> AsyncIterator:
+    """One Arrow table per batch; conversion runs in a thread, off the event loop"""
+    if _uses_copy(sessions):
+        for db in sessions:
+            async with aclosing(_CopyCsv(db, query).chunks()) as chunks:
+                async for chunk in chunks:
+                    yield await asyncio.to_thread(_parse_csv, schema, chunk)
+    else:
+        async with aclosing(_row_batches(sessions, query)) as batches:
+            async for batch in batches:
+                yield await asyncio.to_thread(_rows_to_table, schema, batch)
+
+
+async def _columnar_stream(sessions: List[AsyncSession], query, format: str) -> AsyncIterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema()
+    sink = _ChunkSink()
+    if format == "arrow":
+        writer = pa.ipc.new_stream(sink, schema)
+    else:
+        writer = pq.ParquetWriter(sink, schema, compression=EXPORT_PARQUET_COMPRESSION)
+    rows = 0
+    async with aclosing(_arrow_tables(sessions, query, schema)) as tables:
+        async for table in tables:
+            rows += table.num_rows
+            if format == "arrow":
+                await asyncio.to_thread(writer.write_table, table)
+            else:
+                await asyncio.to_thread(writer.write_table, table, row_group_size=table.num_rows)
+            yield sink.take()
+    writer.close()  # Arrow end-of-stream marker / Parquet footer
+    yield sink.take()
+    EXPORT_ROWS.inc(format, amount=rows)
+
+
+def export_stream(sessions: List[AsyncSession], query, format: str) -> AsyncIterator[bytes]:
+    """
+    Encoded export of `query` over the given sessions (one per shard)
+
+    Args:
+        format: csv, arrow or parquet (see EXPORT_FORMATS)
+    """
+    if format == "csv":
+        return _csv_stream(sessions, query)
+    return _columnar_stream(sessions, query, format)
@@ -0,0 +1,169 @@
+"""
+Live feed of new investments.
+
+Writes publish each new row with pg_notify() inside their transaction, so
+PostgreSQL delivers it only on commit. One LISTEN connection per worker
+receives the notifications and fans them out to every subscriber (the
+server-sent events stream in GET /live/investments). Clients get a push per
+write instead of polling the replicas. With several shards the worker
+listens on every shard's master. Without PostgreSQL the feed degrades to
+in-process delivery after commit.
+"""
+import asyncio
+import json
+import os
+from typing import Callable, List, Optional, Set
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from metrics import LIVE_EVENTS, LIVE_SUBSCRIBERS
+
+# ============================================
+# CONFIGURATION
+# ============================================
+# NOTIFY channel shared by every API worker
+LIVE_CHANNEL = os.getenv("LIVE_CHANNEL", "investments")
+
+# Events buffered per subscriber; a client that falls further behind is
+# disconnected (it reconnects and resyncs with /history?since_id=<X-Sync-Cursor>)
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "100"))
+
+# Seconds between keep-alive comments on idle SSE streams
+LIVE_HEARTBEAT = float(os.getenv("LIVE_HEARTBEAT", "15"))
+
+# Seconds to wait before re-establishing a lost LISTEN connection
+LIVE_RECONNECT_DELAY = float(os.getenv("LIVE_RECONNECT_DELAY", "2"))
+
+
+class Subscription:
+    """Bounded queue of events for one client"""
+
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.dropped = False
+
+    async def get(self, timeout: float) -> Optional[str]:
+        """Next event payload, or None on timeout"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class LiveFeed:
+    """
+    One LISTEN connection per master (shard), fanned out to in-process
+    subscribers
+
+    Args:
+        engine_source: Returns the master engines to listen on (called on
+            first use, so the engines can be created lazily)
+    """
+
+    def __init__(self, engine_source: Callable[[], List[AsyncEngine]], channel: str = LIVE_CHANNEL,
+                 queue_size: int = LIVE_QUEUE_SIZE):
+        self._engine_source = engine_source
+        self._engines: Optional[List[AsyncEngine]] = None
+        self.channel = channel
+        self.queue_size = queue_size
+        self.subscribers: Set[Subscription] = set()
+        self.listening: Set[AsyncEngine] = set()
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def engines(self) -> List[AsyncEngine]:
+        if self._engines is None:
+            self._engines = self._engine_source()
+        return self._engines
+
+    @property
+    def uses_notify(self) -> bool:
+        return self.engines[0].dialect.name == "postgresql"
+
+    # ---------- publishing ----------
+    async def publish(self, db: AsyncSession, event: dict):
+        """
+        Queue an event in the caller's transaction: delivered to every
+        worker when it commits, discarded on rollback. Without PostgreSQL,
+        call dispatch() after committing instead.
+        """
+        if self.uses_notify:
+            await db.execute(select(func.pg_notify(self.channel, json.dumps(event))))
+
+    def dispatch(self, payload: str):
+        """Hand one event to every subscriber of this worker"""
+        LIVE_EVENTS.inc()
+        for sub in list(self.subscribers):
+            try:
+                sub.queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                # Slow consumer: cut it loose rather than buffer without bound
+                sub.dropped = True
+                self.subscribers.discard(sub)
+
+    # ---------- subscribers ----------
+    def subscribe(self) -> Subscription:
+        sub = Subscription(self.queue_size)
+        self.subscribers.add(sub)
+        LIVE_SUBSCRIBERS.set(value=len(self.subscribers))
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        self.subscribers.discard(sub)
+        LIVE_SUBSCRIBERS.set(value=len(self.subscribers))
+
+    # ---------- listener ----------
+    def start(self):
+        """Start one LISTEN loop per master on the running event loop (PostgreSQL only)"""
+        if self.uses_notify and not self._tasks:
+            loop = asyncio.get_running_loop()
+            self._tasks = [loop.create_task(self._loop(engine)) for engine in self.engines]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    async def _loop(self, engine: AsyncEngine):
+        while True:
+            try:
+                await self._listen(engine)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️  Live feed listener lost ({engine.url.host}): {e!r}")
+            self.listening.discard(engine)
+            await asyncio.sleep(LIVE_RECONNECT_DELAY)
+
+    async def _listen(self, engine: AsyncEngine):
+        async with engine.connect() as conn:
+            raw = await conn.get_raw_connection()
+            driver = raw.driver_connection
+            lost = asyncio.Event()
+
+            def on_notify(connection, pid, channel, payload):
+                self.dispatch(payload)
+
+            driver.add_termination_listener(lambda connection: lost.set())
+            await driver.add_listener(self.channel, on_notify)
+            self.listening.add(engine)
+            try:
+                await lost.wait()
+            finally:
+                if not driver.is_closed():
+                    await driver.remove_listener(self.channel, on_notify)
+                raw.invalidate()  # never hand a LISTENing connection back to the pool
+
+    def stats(self) -> dict:
+        return {
+            "channel": self.channel,
+            "mode": "notify" if self.uses_notify else "in-process",
+            "listening": len(self.listening) == len(self.engines),
+            "connections": len(self.listening),
+            "subscribers": len(self.subscribers),
+        }
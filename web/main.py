@@ -1,20 +1,71 @@
 """
 FastAPI Application - Crypto Investment Tracker
 Implements CQRS pattern: Writes to Master, Reads from Replica
+(optionally over several hash-sharded master/replica pairs)
+
+Importing this module has no side effects on the databases: tables are
+created by `python maintenance.py migrate` and engines on first use.
 """
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
-from pydantic import BaseModel, validator
-from typing import List
-import requests
-from datetime import datetime
+from startup import startup_timer
+
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy import func, insert, literal_column, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel, ValidationError, validator
+from typing import Any, Dict, List, Optional, Tuple
+from contextlib import aclosing
+from functools import partial
+from datetime import datetime, timedelta
+import asyncio
+import base64
+import hashlib
+import json
+import orjson
+import os
+import time
+
+startup_timer.mark("import libraries")
+
+from database import (
+    shards, CONSISTENCY_TOKEN_HEADER, current_master_lsn, dispose_engines, get_db_write, get_db_read,
+    make_consistency_token
+)
+startup_timer.mark("import database")
+
+from models import CoinTotal, Investment
+from aggregates import coin_totals_upsert
+from coins import CRYPTO_OPTIONS
+from export import EXPORT_FORMATS, export_query, export_stream, require_pyarrow
+from live import LIVE_HEARTBEAT, LiveFeed
+from metrics import HISTORY_ROWS, RequestMetricsMiddleware, render_metrics
+from portfolio import value_portfolio
+from profiler import query_profiler
+from replication import REPLICATION_MONITOR_ENABLED, ReplicationMonitor
+from schema import SchemaCheck
+from shards import Shard, ShardSessions, merge_sorted, merge_streams
+from sharedprices import PRICE_SHARED_SNAPSHOT, SharedPriceSnapshot
+from prices import (
+    PRICE_MAX_STALENESS, PRICE_REFRESHER_ENABLED, PriceRefresher, close_http_client, price_cache
+)
+from writebehind import INVEST_GROUP_COMMIT, GroupCommitWriter
+
+startup_timer.mark("import app modules")
+
 
-from database import engine_master, get_db_write, get_db_read
-from models import Base, Investment
+# Maximum number of rows accepted by POST /invest/batch
+INVEST_BATCH_MAX_ROWS = int(os.getenv("INVEST_BATCH_MAX_ROWS", "50000"))
 
+# Largest page accepted by GET /history?limit= and rows fetched per round trip when streaming
+HISTORY_MAX_LIMIT = int(os.getenv("HISTORY_MAX_LIMIT", "5000"))
+HISTORY_STREAM_BATCH = int(os.getenv("HISTORY_STREAM_BATCH", "1000"))
 
-# Create all tables in the master database
-Base.metadata.create_all(bind=engine_master)
+# Seconds a new row may still be followed by a lower id committing later: the
+# X-Sync-Cursor of /history stays below rows younger than this
+HISTORY_SYNC_SETTLE = float(os.getenv("HISTORY_SYNC_SETTLE", "5"))
+
+# Seconds a computed portfolio valuation is reused (and may be cached by clients)
+PORTFOLIO_CACHE_TTL = float(os.getenv("PORTFOLIO_CACHE_TTL", "5"))
 
 
 app = FastAPI(
@@ -23,6 +74,9 @@ app = FastAPI(
     version="1.0.0"
 )
 
+app.add_middleware(RequestMetricsMiddleware)
+
+
 # PYDANTIC SCHEMAS
 class InvestmentCreate(BaseModel):
     """Schema for creating a new investment"""
@@ -68,9 +122,42 @@ class InvestmentResponse(BaseModel):
 
 
 # HELPER FUNCTIONS
-def get_crypto_price(coin_name: str) -> float:
+async def load_tracked_coins() -> List[str]:
+    """Distinct coins already present in the investments table (Replica of every shard)"""
+    async def shard_coins(shard: Shard) -> List[str]:
+        async with shard.replica_pool.session() as (db, _):
+            result = await db.execute(select(CoinTotal.coin_name))
+            return list(result.scalars())
+
+    results = await asyncio.gather(*(shard_coins(shard) for shard in shards))
+    return [coin for coins in results for coin in coins]
+
+
+# With several workers, one elected worker refreshes a snapshot all of them map
+shared_prices = SharedPriceSnapshot(price_cache) if PRICE_SHARED_SNAPSHOT else None
+
+price_refresher = PriceRefresher(
+    shared_prices or price_cache,
+    coin_source=load_tracked_coins,
+    static_coins=CRYPTO_OPTIONS
+)
+
+# One LISTEN connection per master (shard) and worker, fanned out to SSE clients
+live_feed = LiveFeed(lambda: [shard.async_engine_master for shard in shards])
+
+# Schema version of every master, read in the background at startup
+schema_check = SchemaCheck(shards)
+
+# Replication lag time series per shard, filled at startup (engines are created there)
+replication_monitors: Dict[str, ReplicationMonitor] = {}
+
+
+async def get_crypto_price(coin_name: str) -> float:
     """
-    Fetch current cryptocurrency price from CoinGecko API
+    Get current cryptocurrency price from the local price snapshot.
+    When the background refresher is running (in this worker, or in the
+    worker elected to fill the shared snapshot) the network is never touched
+    for tracked coins; otherwise the in-process price cache is used.
     
     Args:
         coin_name: Name of the cryptocurrency (e.g., 'bitcoin', 'ethereum')
@@ -79,29 +166,411 @@ def get_crypto_price(coin_name: str) -> float:
         Current price in USD
     
     Raises:
-        HTTPException: If API call fails or coin not found
+        HTTPException: If API call fails, coin not found or snapshot too old
     """
-    try:
-        url = f"https://api.coingecko.com/api/v3/simple/price?ids={coin_name}&vs_currencies=usd"
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        if coin_name not in data:
+    if price_refresher.running or shared_prices is not None:
+        return await price_refresher.get(coin_name)
+    return await price_cache.get(coin_name)
+
+
+async def get_crypto_prices(coin_names: List[str]) -> Dict[str, float]:
+    """
+    Current prices of several coins (valuations). With the shared snapshot,
+    every worker reads the prices the elected worker keeps fresh and only
+    fetches the coins missing from it; otherwise the worker's own cache
+    serves fresh entries and fetches the rest in one batched call.
+
+    Raises:
+        HTTPException: If the batched fetch fails
+    """
+    if shared_prices is not None:
+        return await shared_prices.get_many(coin_names, max_age=PRICE_MAX_STALENESS)
+    return await price_cache.get_many(coin_names)
+
+
+async def parse_batch_body(request: Request) -> Tuple[List[Any], List[Dict[str, Any]]]:
+    """
+    Read a batch of investments from a JSON array or an NDJSON stream
+    
+    Returns:
+        (rows, errors) where errors holds lines that are not valid JSON
+    
+    Raises:
+        HTTPException: 400 if the body is malformed, 413 if it has too many rows
+    """
+    rows: List[Any] = []
+    errors: List[Dict[str, Any]] = []
+    content_type = request.headers.get("content-type", "")
+
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        # Parse the stream line by line instead of buffering the whole body
+        buffer = b""
+        index = 0
+
+        def parse_line(line: bytes):
+            nonlocal index
+            line = line.strip()
+            if not line:
+                return
+            try:
+                rows.append(json.loads(line))
+            except ValueError as e:
+                rows.append(None)
+                errors.append({"index": index, "error": f"Invalid JSON: {e}"})
+            index += 1
+            if index > INVEST_BATCH_MAX_ROWS:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Batch cannot exceed {INVEST_BATCH_MAX_ROWS} rows"
+                )
+
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                parse_line(line)
+        parse_line(buffer)
+    else:
+        try:
+            body = json.loads(await request.body())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
+        if not isinstance(body, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array of investments")
+        if len(body) > INVEST_BATCH_MAX_ROWS:
             raise HTTPException(
-                status_code=404,
-                detail=f"Cryptocurrency '{coin_name}' not found. Please check the coin name."
+                status_code=413,
+                detail=f"Batch cannot exceed {INVEST_BATCH_MAX_ROWS} rows"
             )
-        
-        price = data[coin_name]["usd"]
-        return float(price)
-    
-    except requests.RequestException as e:
-        raise HTTPException(
-            status_code=503,
-            detail=f"Failed to fetch cryptocurrency price: {str(e)}"
-        )
+        rows = body
+
+    return rows, errors
+
+
+def describe_validation_error(error: ValidationError) -> str:
+    """Flatten a pydantic ValidationError into one readable line"""
+    return "; ".join(
+        f"{'.'.join(str(p) for p in e['loc']) or 'row'}: {e['msg']}" for e in error.errors()
+    )
+
+
+def encode_history_cursor(timestamp: datetime, investment_id: int) -> str:
+    """Opaque keyset cursor pointing just after (timestamp, id)"""
+    raw = json.dumps([timestamp.isoformat(), investment_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_history_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Decode a cursor produced by encode_history_cursor
+    
+    Raises:
+        HTTPException: 400 if the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, investment_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), int(investment_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid history cursor")
+
+
+def parse_sync_cursor(since_id: str) -> Dict[str, int]:
+    """
+    Last id already seen on each shard, from a since_id value: a bare id
+    (applies to every shard) or "shard0=ID,shard1=ID" as sent in X-Sync-Cursor
+
+    Raises:
+        HTTPException: 400 if the value is malformed or names an unknown shard
+    """
+    try:
+        if "=" not in since_id:
+            last_id = int(since_id)
+            if last_id < 0:
+                raise ValueError(since_id)
+            return {shard.name: last_id for shard in shards}
+        names = {shard.name for shard in shards}
+        last_ids = {}
+        for part in since_id.split(","):
+            name, _, last_id = part.strip().partition("=")
+            if name not in names or int(last_id) < 0:
+                raise ValueError(since_id)
+            last_ids[name] = int(last_id)
+        return last_ids
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid since_id")
+
+
+def make_sync_cursor(last_ids: Dict[str, int], shard_rows: Dict[str, list],
+                     settled_before: Optional[datetime] = None) -> Optional[str]:
+    """
+    X-Sync-Cursor after returning the rows read from each shard: the highest
+    id seen on every shard. Each shard's id sequence advances at its own
+    write rate, so one global maximum would skip the rows of slower shards.
+
+    Args:
+        settled_before: Only rows older than this advance the cursor. A
+            transaction still open may hold an id below a younger visible
+            row, so those rows are returned again on the next sync (clients
+            drop them by id) until every lower id has committed.
+    """
+    last_ids = dict(last_ids)
+    for name, rows in shard_rows.items():
+        last_ids.setdefault(name, 0)
+        settled = [row.id for row in rows if settled_before is None or row.timestamp < settled_before]
+        if settled:
+            last_ids[name] = max(last_ids[name], max(settled))
+    if not last_ids:
+        return None
+    if not shards.sharded:
+        return str(max(last_ids.values()))
+    return ",".join(f"{name}={last_id}" for name, last_id in sorted(last_ids.items()))
+
+
+def history_query(coin: Optional[str], start: Optional[datetime], end: Optional[datetime],
+                  cursor: Optional[str], limit: Optional[int], since_id: Optional[int] = None):
+    """Build the filtered, keyset-ordered SELECT used by GET /history"""
+    query = select(*HISTORY_COLUMNS).order_by(Investment.timestamp.desc(), Investment.id.desc())
+    if since_id is not None:
+        query = query.where(Investment.id > since_id)
+    if coin:
+        query = query.where(Investment.coin_name == coin.strip().lower())
+    if start is not None:
+        query = query.where(Investment.timestamp >= start)
+    if end is not None:
+        query = query.where(Investment.timestamp < end)
+    if cursor:
+        timestamp, investment_id = decode_history_cursor(cursor)
+        query = query.where(tuple_(Investment.timestamp, Investment.id) < (timestamp, investment_id))
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+# Supported chart buckets: query value -> (date_trunc unit, SQLite strftime format)
+TIMESERIES_BUCKETS = {
+    "1h": ("hour", "%Y-%m-%d %H:00:00"),
+    "1d": ("day", "%Y-%m-%d 00:00:00"),
+}
+
+
+def bucket_expression(dialect_name: str, bucket: str):
+    """Investment.timestamp truncated to the start of its bucket"""
+    unit, sqlite_format = TIMESERIES_BUCKETS[bucket]
+    # Inlined literals (from the fixed table above) so SELECT, GROUP BY and
+    # the window's ORDER BY are the very same expression
+    if dialect_name == "postgresql":
+        return func.date_trunc(literal_column(f"'{unit}'"), Investment.timestamp)
+    return func.strftime(literal_column(f"'{sqlite_format}'"), Investment.timestamp)
+
+
+async def scatter_execute(sessions: List[AsyncSession], query) -> list:
+    """
+    Run a query on the session of every shard read (concurrently) and return
+    each result; `query` may also be a list with one query per session
+    """
+    queries = query if isinstance(query, list) else [query] * len(sessions)
+    if len(sessions) == 1:
+        return [await sessions[0].execute(queries[0])]
+    return await asyncio.gather(*(db.execute(q) for db, q in zip(sessions, queries)))
+
+
+async def table_etag(request: Request, sessions: List[AsyncSession]) -> str:
+    """
+    Weak ETag for a read of the investments table: its high-water mark
+    (max id through the primary key index, row count from coin_totals) over
+    the shards read, plus the query string. Computed without scanning the table.
+    """
+    query = select(
+        select(func.max(Investment.id)).scalar_subquery(),
+        select(func.coalesce(func.sum(CoinTotal.count), 0)).scalar_subquery()
+    )
+    results = await scatter_execute(sessions, query)
+    marks = [result.one() for result in results]
+    max_id = max((mark[0] or 0 for mark in marks), default=0)
+    count = sum(mark[1] for mark in marks)
+    params = sorted(request.query_params.multi_items())
+    digest = hashlib.sha1(repr(params).encode()).hexdigest()[:12]
+    return f'W/"{max_id or 0}-{count}-{digest}"'
+
+
+def etag_headers(etag: str) -> Dict[str, str]:
+    """Headers sent with every response carrying an ETag (clients must revalidate)"""
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True when the client's If-None-Match already names this ETag"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or etag in candidates or etag[2:] in candidates
+
+
+# Columns of a /history row, with the row value computed by the database
+HISTORY_COLUMNS = (
+    Investment.id,
+    Investment.coin_name,
+    Investment.amount,
+    Investment.purchase_price_usd,
+    Investment.timestamp,
+    (Investment.amount * Investment.purchase_price_usd).label("total_value_usd"),
+)
+HISTORY_FIELDS = [column.key for column in HISTORY_COLUMNS]
+
+
+def history_order(row) -> Tuple[datetime, int]:
+    """Keyset order of /history rows (newest first when reversed)"""
+    return row.timestamp, row.id
+
+
+async def history_batches(results, limit: Optional[int] = None) -> Any:
+    """
+    Row batches of streamed /history results: the server-side cursor's own
+    partitions with one shard, a k-way merge in global order with several.
+    Each shard returns its own first `limit` rows, so the merge stops after
+    the global first `limit`.
+    """
+    if len(results) == 1:
+        async for partition in results[0].partitions():
+            yield partition
+        return
+    batch, count = [], 0
+    merged = merge_streams([result.__aiter__() for result in results], history_order, reverse=True)
+    async with aclosing(merged) as rows:
+        async for row in rows:
+            batch.append(row)
+            count += 1
+            if len(batch) >= HISTORY_STREAM_BATCH or count == limit:
+                yield batch
+                batch = []
+            if count == limit:
+                return
+    if batch:
+        yield batch
+
+
+def merge_timeseries(shard_rows: List[list]) -> list:
+    """
+    Sum per-shard (bucket, count, invested, cumulative) rows by bucket and
+    recompute the running total over the merged buckets
+    """
+    if len(shard_rows) == 1:
+        return shard_rows[0]
+    buckets: Dict[Any, List[float]] = {}
+    for rows in shard_rows:
+        for ts, count, bucket_total, _ in rows:
+            totals = buckets.setdefault(ts, [0, 0.0])
+            totals[0] += count
+            totals[1] += bucket_total
+    merged, cumulative = [], 0.0
+    for ts in sorted(buckets):
+        count, bucket_total = buckets[ts]
+        cumulative += bucket_total
+        merged.append((ts, count, bucket_total, cumulative))
+    return merged
+
+
+def passthrough_headers(response: Response) -> Dict[str, str]:
+    """Headers set on the injected response (X-Read-Source, ETag, ...) for a response built by hand"""
+    return {key: value for key, value in response.headers.items() if key != "content-length"}
+
+
+def json_response(content: Any, response: Response) -> Response:
+    """Serialize with orjson, skipping response_model validation"""
+    return Response(orjson.dumps(content), media_type="application/json",
+                    headers=passthrough_headers(response))
+
+
+async def save_investments(db: AsyncSession, values: List[dict]) -> List[int]:
+    """
+    Write many investments in one transaction on the MASTER: multi-row
+    INSERT ... RETURNING, the coin_totals upsert and a live "batch" event,
+    then commit.
+
+    Args:
+        db: Database session (Master)
+        values: Investment column dicts (coin_name, amount, purchase_price_usd, timestamp)
+
+    Returns:
+        New ids, in the order of values
+    """
+    result = await db.execute(
+        insert(Investment).returning(Investment.id, sort_by_parameter_order=True),
+        values
+    )
+    ids = list(result.scalars())
+    await db.execute(coin_totals_upsert(
+        db.get_bind().dialect.name,
+        [(v["coin_name"], v["amount"], v["purchase_price_usd"], v["timestamp"]) for v in values]
+    ))
+    # One summary event per batch (NOTIFY payloads are capped at 8000 bytes);
+    # subscribers fetch the rows with /history?since_id=<X-Sync-Cursor>
+    event = {"type": "batch", "count": len(ids), "first_id": min(ids), "last_id": max(ids)}
+    await live_feed.publish(db, event)
+    await db.commit()
+    if not live_feed.uses_notify:
+        live_feed.dispatch(json.dumps(event))
+    return ids
+
+
+async def save_sharded_investments(
+    dbs: ShardSessions, values: List[dict]
+) -> Tuple[List[Optional[int]], Optional[str], Dict[int, str]]:
+    """
+    Write investments on the master of each coin's shard: one transaction
+    per shard, run concurrently. A write spanning shards is not atomic as a
+    whole; each shard commits its own rows, and a shard that fails does not
+    undo the others.
+
+    Returns:
+        (new ids in the order of values, None for the rows of a failed shard;
+        consistency token of every shard written; error message by position
+        of the rows of every failed shard)
+    """
+    groups = shards.split(values)
+    sessions = [await dbs.get(shard) for shard in groups]
+
+    async def write(db: AsyncSession, positions: List[int]) -> Tuple[List[int], Optional[str]]:
+        try:
+            ids = await save_investments(db, [values[position] for position in positions])
+        except BaseException:
+            await db.rollback()
+            raise
+        return ids, await current_master_lsn(db)
+
+    results = await asyncio.gather(
+        *(write(db, positions) for db, positions in zip(sessions, groups.values())),
+        return_exceptions=True
+    )
+    ids: List[Optional[int]] = [None] * len(values)
+    errors: Dict[int, str] = {}
+    lsns: Dict[str, Optional[str]] = {}
+    for shard, positions, result in zip(groups, groups.values(), results):
+        if isinstance(result, Exception):
+            print(f"❌ Batch write to {shard.name} ({shard.master_name}) failed: {result!r}")
+            errors.update((position, f"Write to {shard.name} failed; not saved") for position in positions)
+            continue
+        if isinstance(result, BaseException):
+            raise result
+        shard_ids, lsns[shard.name] = result
+        for position, investment_id in zip(positions, shard_ids):
+            ids[position] = investment_id
+    return ids, make_consistency_token(lsns), errors
+
+
+async def write_investment_group(shard: Shard, values: List[dict]) -> Tuple[List[int], Optional[str]]:
+    """Flush function of a shard's group-commit writer: one transaction per group"""
+    async with shard.async_session_master() as db:
+        ids = await save_investments(db, values)
+        return ids, make_consistency_token({shard.name: await current_master_lsn(db)})
+
+
+# Optional write-behind path for POST /invest (INVEST_GROUP_COMMIT=1), one writer per shard
+group_writers = {
+    shard.name: GroupCommitWriter(partial(write_investment_group, shard), name=shard.name) for shard in shards
+}
 
 
 # ============================================
@@ -109,41 +578,83 @@ def get_crypto_price(coin_name: str) -> float:
 # ============================================
 
 @app.get("/")
-def read_root():
+async def read_root():
     """Root endpoint with API information"""
     return {
         "message": "Crypto Investment Tracker API",
         "version": "1.0.0",
         "endpoints": {
             "POST /invest": "Create a new investment (writes to Master DB)",
+            "POST /invest/batch": "Bulk-create investments from a JSON array or NDJSON (writes to Master DB)",
             "GET /history": "Get investment history (reads from Replica DB)",
-            "GET /stats": "Get investment statistics"
+            "GET /export": "Bulk export of investments as CSV, Arrow IPC or Parquet (reads from Replica DB)",
+            "GET /history/timeseries": "Get cumulative invested value per time bucket (reads from Replica DB)",
+            "GET /stats": "Get investment statistics",
+            "GET /portfolio/valuation": "Value holdings at current prices (unrealized P&L)",
+            "GET /prices/cache": "Get price cache and refresher counters",
+            "GET /replicas": "Get health, load and lag of the read replicas",
+            "GET /replication/lag": "Replication lag time series and percentiles (master and replicas)",
+            "GET /metrics": "Prometheus metrics (latency, DB, pools, CoinGecko)",
+            "GET /live/investments": "Server-sent events stream of new investments",
+            "GET /live/stats": "Live feed listener state and subscriber count",
+            "GET /invest/queue": "Group-commit write queue depth and group sizes",
+            "GET /debug/queries": "Per-statement timings, slow queries and sampled EXPLAIN plans",
+            "GET /debug/startup": "Import and init time of this worker, by phase"
         }
     }
 
 
 @app.post("/invest", response_model=dict)
-def create_investment(
+async def create_investment(
     investment: InvestmentCreate,
-    db: Session = Depends(get_db_write)
+    response: Response,
+    dbs: ShardSessions = Depends(get_db_write)
 ):
     """
     Create a new cryptocurrency investment.
     
-    ⚠️ WRITES TO MASTER DATABASE (172.20.0.10)
+    ⚠️ WRITES TO MASTER DATABASE (172.20.0.10, or the master of the coin's shard)
     
     Args:
         investment: Investment details (coin and amount)
-        db: Database session (Master)
+        dbs: Database sessions (Master of each shard)
     
     Returns:
-        Confirmation with investment details
+        Confirmation with investment details and a consistency token that
+        makes later reads (X-Consistency-Token header) see this write
     """
     # Get current price from CoinGecko API
-    current_price = get_crypto_price(investment.coin)
+    current_price = await get_crypto_price(investment.coin)
     
     # Calculate total investment value
     total_value = investment.amount * current_price
+    shard = shards.for_coin(investment.coin)
+
+    if INVEST_GROUP_COMMIT:
+        # Committed together with other concurrent requests; still durable on return
+        timestamp = datetime.utcnow()
+        investment_id, consistency_token = await group_writers[shard.name].submit({
+            "coin_name": investment.coin,
+            "amount": investment.amount,
+            "purchase_price_usd": current_price,
+            "timestamp": timestamp
+        })
+        if consistency_token:
+            response.headers[CONSISTENCY_TOKEN_HEADER] = consistency_token
+        return {
+            "status": "success",
+            "message": "Investment saved to MASTER database (group commit)",
+            "database": "Master (172.20.0.10)",
+            "consistency_token": consistency_token,
+            "investment": {
+                "id": investment_id,
+                "coin": investment.coin,
+                "amount": investment.amount,
+                "price_per_coin_usd": current_price,
+                "total_value_usd": total_value,
+                "timestamp": timestamp.isoformat()
+            }
+        }
     
     # Create database record
     db_investment = Investment(
@@ -152,119 +663,697 @@ def create_investment(
         purchase_price_usd=current_price
     )
     
-    # Save to MASTER database
+    # Save to MASTER database, updating coin_totals in the same transaction
+    db = await dbs.get(shard)
     db.add(db_investment)
-    db.commit()
-    db.refresh(db_investment)
+    await db.flush()
+    await db.execute(coin_totals_upsert(
+        db.get_bind().dialect.name,
+        [(db_investment.coin_name, db_investment.amount, current_price, db_investment.timestamp)]
+    ))
+    investment_data = {
+        "id": db_investment.id,
+        "coin": db_investment.coin_name,
+        "amount": db_investment.amount,
+        "price_per_coin_usd": current_price,
+        "total_value_usd": total_value,
+        "timestamp": db_investment.timestamp.isoformat()
+    }
+    # Pushed to live subscribers when (and only if) the transaction commits
+    event = {"type": "investment", "investment": investment_data}
+    await live_feed.publish(db, event)
+    await db.commit()
+    if not live_feed.uses_notify:
+        live_feed.dispatch(json.dumps(event))
+
+    consistency_token = make_consistency_token({shard.name: await current_master_lsn(db)})
+    if consistency_token:
+        response.headers[CONSISTENCY_TOKEN_HEADER] = consistency_token
     
     return {
         "status": "success",
         "message": "Investment saved to MASTER database",
         "database": "Master (172.20.0.10)",
-        "investment": {
-            "id": db_investment.id,
-            "coin": db_investment.coin_name,
-            "amount": db_investment.amount,
-            "price_per_coin_usd": current_price,
-            "total_value_usd": total_value,
-            "timestamp": db_investment.timestamp.isoformat()
+        "consistency_token": consistency_token,
+        "investment": investment_data
+    }
+
+
+@app.post("/invest/batch", response_model=dict)
+async def create_investments_batch(
+    request: Request,
+    response: Response,
+    dbs: ShardSessions = Depends(get_db_write)
+):
+    """
+    Create many investments in a single transaction (one per shard when sharded).
+    
+    ⚠️ WRITES TO MASTER DATABASE (172.20.0.10, or the masters of the coins' shards)
+    
+    The body is a JSON array of {"coin", "amount"} objects, or NDJSON
+    (Content-Type: application/x-ndjson) with one object per line. Prices are
+    resolved once per distinct coin and all valid rows are written with a
+    multi-row INSERT ... RETURNING. Invalid rows are reported in "errors"
+    without aborting the rest of the batch; when no row is saved the same
+    report comes back with status "failed" and HTTP 422.
+    
+    Returns:
+        Inserted ids, per-row errors, throughput figures and a consistency token
+    """
+    started = time.perf_counter()
+    rows, errors = await parse_batch_body(request)
+
+    # Validate every row with the same rules as POST /invest
+    valid: List[Tuple[int, InvestmentCreate]] = []
+    failed = {e["index"] for e in errors}
+    for index, row in enumerate(rows):
+        if index in failed:
+            continue
+        if not isinstance(row, dict):
+            errors.append({"index": index, "error": "Row must be a JSON object"})
+            continue
+        try:
+            valid.append((index, InvestmentCreate(**row)))
+        except ValidationError as e:
+            errors.append({"index": index, "error": describe_validation_error(e)})
+    parsed_at = time.perf_counter()
+
+    # One price lookup per distinct coin
+    coins = sorted({inv.coin for _, inv in valid})
+    results = await asyncio.gather(
+        *(get_crypto_price(coin) for coin in coins), return_exceptions=True
+    )
+    prices: Dict[str, float] = {}
+    for coin, result in zip(coins, results):
+        if isinstance(result, HTTPException):
+            errors.extend(
+                {"index": index, "error": result.detail}
+                for index, inv in valid if inv.coin == coin
+            )
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            prices[coin] = result
+    priced_at = time.perf_counter()
+
+    # Multi-row INSERT ... RETURNING in one transaction on the MASTER (of each shard)
+    timestamp = datetime.utcnow()
+    priced = [(index, inv) for index, inv in valid if inv.coin in prices]
+    values = [
+        {
+            "coin_name": inv.coin,
+            "amount": inv.amount,
+            "purchase_price_usd": prices[inv.coin],
+            "timestamp": timestamp
+        }
+        for _, inv in priced
+    ]
+    ids: List[int] = []
+    consistency_token = None
+    if values:
+        # A shard whose transaction fails reports its rows as errors; the
+        # other shards' rows are committed and keep their ids
+        saved, consistency_token, write_errors = await save_sharded_investments(dbs, values)
+        ids = [investment_id for investment_id in saved if investment_id is not None]
+        errors.extend({"index": priced[position][0], "error": error} for position, error in write_errors.items())
+        values = [v for v, investment_id in zip(values, saved) if investment_id is not None]
+    finished = time.perf_counter()
+
+    if consistency_token:
+        response.headers[CONSISTENCY_TOKEN_HEADER] = consistency_token
+
+    elapsed = finished - started
+    errors.sort(key=lambda e: e["index"])
+    if not errors:
+        status = "success"
+    elif ids:
+        status = "partial"
+    else:
+        status = "failed"
+        response.status_code = 422
+    return {
+        "status": status,
+        "message": f"{len(ids)} investment(s) saved to MASTER database",
+        "database": "Master (172.20.0.10)",
+        "consistency_token": consistency_token,
+        "received": len(rows),
+        "inserted": len(ids),
+        "failed": len(errors),
+        "ids": ids,
+        "total_value_usd": round(sum(v["amount"] * v["purchase_price_usd"] for v in values), 2),
+        "errors": errors,
+        "throughput": {
+            "elapsed_seconds": round(elapsed, 4),
+            "parse_seconds": round(parsed_at - started, 4),
+            "price_seconds": round(priced_at - parsed_at, 4),
+            "write_seconds": round(finished - priced_at, 4),
+            "distinct_coins": len(coins),
+            "rows_per_second": round(len(ids) / elapsed, 1) if elapsed > 0 else None
         }
     }
 
 
 @app.get("/history", response_model=List[InvestmentResponse])
-def get_investment_history(db: Session = Depends(get_db_read)):
+async def get_investment_history(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=HISTORY_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    coin: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    since_id: Optional[str] = None,
+    stream: bool = False,
+    format: str = Query("objects", pattern="^(objects|columns)$"),
+    dbs: ShardSessions = Depends(get_db_read)
+):
     """
-    Get all investment history.
+    Get investment history, newest first.
     
-    ✅ READS FROM REPLICA DATABASE (172.20.0.11)
+    ✅ READS FROM REPLICA DATABASE (172.20.0.11; every shard's replica,
+    merged in timestamp order, unless `coin` selects a single shard)
     
     Args:
-        db: Database session (Replica)
+        limit: Page size; when set, the X-Next-Cursor header points to the next page
+        cursor: Value of X-Next-Cursor from the previous page
+        coin: Only investments in this coin
+        start, end: Only investments with start <= timestamp < end
+        since_id: Only investments with a greater id (incremental sync): a
+            bare id, or the X-Sync-Cursor of the previous response, which
+            holds the last id of every shard
+        stream: Stream every matching row as NDJSON from a server-side cursor
+        format: "objects" (default, one object per investment) or "columns"
+            ({"columns": [...], "rows": [[...], ...]}; when streaming, a
+            {"columns": [...]} line followed by one array per row)
+        dbs: Database sessions (Replica of each shard)
     
     Returns:
-        List of all investments
-    """
-    investments = db.query(Investment).order_by(Investment.timestamp.desc()).all()
-    
-    # Calculate current total value for each investment
-    response = []
-    for inv in investments:
-        total_value = inv.amount * inv.purchase_price_usd
-        response.append(
-            InvestmentResponse(
-                id=inv.id,
-                coin_name=inv.coin_name,
-                amount=inv.amount,
-                purchase_price_usd=inv.purchase_price_usd,
-                timestamp=inv.timestamp,
-                total_value_usd=total_value
-            )
+        List of investments (all of them when no limit is given), or
+        304 Not Modified when If-None-Match matches the current ETag. A
+        complete response (not streamed, not paged) carries an X-Sync-Cursor
+        header to pass as since_id next time, with the same filters.
+    """
+    last_ids = parse_sync_cursor(since_id) if since_id is not None else {}
+    sessions = await dbs.scatter(coin)
+    etag = await table_etag(request, sessions)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=etag_headers(etag))
+
+    # One query per shard: each one filters on that shard's own last id
+    targets = shards.targets(coin)
+    queries = [history_query(coin, start, end, cursor, limit, last_ids.get(shard.name)) for shard in targets]
+
+    if stream:
+        # Server-side cursors: memory stays constant regardless of table size
+        results = [
+            await db.stream(query.execution_options(yield_per=HISTORY_STREAM_BATCH))
+            for db, query in zip(sessions, queries)
+        ]
+
+        async def ndjson_rows():
+            count = 0
+            if format == "columns":
+                yield orjson.dumps({"columns": HISTORY_FIELDS}) + b"\n"
+            async for partition in history_batches(results, limit):
+                count += len(partition)
+                if format == "columns":
+                    lines = [orjson.dumps(tuple(row)) for row in partition]
+                else:
+                    lines = [orjson.dumps(dict(zip(HISTORY_FIELDS, row))) for row in partition]
+                yield b"\n".join(lines) + b"\n"
+            HISTORY_ROWS.observe(count, "stream")
+
+        response.headers.update(etag_headers(etag))
+        return StreamingResponse(
+            ndjson_rows(), media_type="application/x-ndjson", headers=passthrough_headers(response)
+        )
+
+    response.headers.update(etag_headers(etag))
+    # Each shard returns its own first `limit` rows; the merge keeps the global first `limit`
+    shard_rows = [result.all() for result in await scatter_execute(sessions, queries)]
+    rows = merge_sorted(shard_rows, history_order, reverse=True)[:limit]
+    HISTORY_ROWS.observe(len(rows), "page" if limit is not None else "full")
+
+    if limit is not None and len(rows) == limit:
+        last = rows[-1]
+        response.headers["X-Next-Cursor"] = encode_history_cursor(last.timestamp, last.id)
+    elif cursor is None:
+        sync_cursor = make_sync_cursor(
+            last_ids, {shard.name: rows for shard, rows in zip(targets, shard_rows)},
+            settled_before=datetime.utcnow() - timedelta(seconds=HISTORY_SYNC_SETTLE)
         )
+        if sync_cursor is not None:
+            response.headers["X-Sync-Cursor"] = sync_cursor
+
+    # Plain tuples straight to orjson: no ORM objects, no per-row model validation
+    if format == "columns":
+        return json_response({"columns": HISTORY_FIELDS, "rows": [tuple(row) for row in rows]}, response)
+    return json_response([dict(zip(HISTORY_FIELDS, row)) for row in rows], response)
+
+
+@app.get("/export")
+async def export_investments(
+    response: Response,
+    format: str = Query("csv", pattern="^(csv|arrow|parquet)$"),
+    coin: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    dbs: ShardSessions = Depends(get_db_read)
+):
+    """
+    Stream the investments table for analytics jobs, in record batches.
+    
+    ✅ READS FROM REPLICA DATABASE (172.20.0.11; every shard's replica,
+    one after another, unless `coin` selects a single shard)
     
-    return response
+    Args:
+        format: "csv" (COPY TO STDOUT on PostgreSQL), "arrow" (Arrow IPC
+            stream) or "parquet"
+        coin: Only investments in this coin
+        start, end: Only investments with start <= timestamp < end
+        dbs: Database sessions (Replica of each shard)
+    
+    Returns:
+        The matching rows in storage order (unsorted), with memory bounded
+        by EXPORT_BATCH_ROWS whatever the table size
+    """
+    try:
+        require_pyarrow(format)
+    except ImportError:
+        raise HTTPException(status_code=501, detail=f"format={format} requires pyarrow on the server")
+
+    sessions = await dbs.scatter(coin)
+    body = export_stream(sessions, export_query(coin, start, end), format)
+    # A client that disconnects leaves the stream suspended: finish it (and
+    # abort any COPY) before the sessions go back to the pool
+    dbs.on_close(body.aclose)
+
+    media_type, extension = EXPORT_FORMATS[format]
+    headers = passthrough_headers(response)
+    headers["Content-Disposition"] = f'attachment; filename="investments.{extension}"'
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+
+@app.get("/history/timeseries")
+async def get_history_timeseries(
+    bucket: str = Query("1h", pattern="^(1h|1d)$"),
+    coin: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    dbs: ShardSessions = Depends(get_db_read)
+):
+    """
+    Cumulative invested value per time bucket, for the dashboard chart.
+    
+    ✅ READS FROM REPLICA DATABASE (172.20.0.11)
+    
+    Bucketing (date_trunc) and the running total (SUM window function) are
+    computed by the database, so the payload grows with the number of
+    buckets, not with the number of investments. With several shards the
+    buckets are summed across shards and the running total recomputed.
+    
+    Args:
+        bucket: "1h" or "1d"
+        coin: Only investments in this coin
+        start, end: Only investments with start <= timestamp < end
+            (the running total starts at zero at the beginning of the window)
+    
+    Returns:
+        One point per non-empty bucket, oldest first
+    """
+    sessions = await dbs.scatter(coin)
+    bucket_start = bucket_expression(sessions[0].get_bind().dialect.name, bucket)
+    invested = func.sum(Investment.amount * Investment.purchase_price_usd)
+    query = select(
+        bucket_start,
+        func.count(Investment.id),
+        invested,
+        func.sum(invested).over(order_by=bucket_start)
+    ).group_by(bucket_start).order_by(bucket_start)
+    if coin:
+        query = query.where(Investment.coin_name == coin.strip().lower())
+    if start is not None:
+        query = query.where(Investment.timestamp >= start)
+    if end is not None:
+        query = query.where(Investment.timestamp < end)
+
+    results = await scatter_execute(sessions, query)
+    points = [
+        {
+            "timestamp": (ts.isoformat() if isinstance(ts, datetime)
+                          else datetime.fromisoformat(ts).isoformat()),
+            "count": count,
+            "invested_usd": round(bucket_total, 2),
+            "cumulative_usd": round(cumulative, 2)
+        }
+        for ts, count, bucket_total, cumulative in merge_timeseries([result.all() for result in results])
+    ]
+
+    return {
+        "database": "Replica (172.20.0.11)",
+        "bucket": bucket,
+        "coin": coin.strip().lower() if coin else None,
+        "points": points
+    }
 
 
 @app.get("/stats")
-def get_statistics(db: Session = Depends(get_db_read)):
+async def get_statistics(
+    request: Request,
+    response: Response,
+    coin: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    dbs: ShardSessions = Depends(get_db_read)
+):
     """
     Get investment statistics.
     
     ✅ READS FROM REPLICA DATABASE (172.20.0.11)
     
+    Without a time window it reads the coin_totals summary table, so the cost
+    depends on the number of coins, not on the size of the history. With
+    start/end it aggregates investments in SQL with a single GROUP BY. With
+    several shards every coin lives in one shard, so the per-shard results
+    are simply concatenated.
+    
+    Args:
+        coin: Only investments in this coin
+        start, end: Only investments with start <= timestamp < end
+    
     Returns:
-        Statistics about investments
+        Statistics about investments, or 304 Not Modified when
+        If-None-Match matches the current ETag
     """
-    investments = db.query(Investment).all()
+    sessions = await dbs.scatter(coin)
+    etag = await table_etag(request, sessions)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=etag_headers(etag))
+    response.headers.update(etag_headers(etag))
+
+    if start is None and end is None:
+        query = select(
+            CoinTotal.coin_name,
+            CoinTotal.count,
+            CoinTotal.total_amount,
+            CoinTotal.total_cost_usd
+        ).where(CoinTotal.count > 0)
+        if coin:
+            query = query.where(CoinTotal.coin_name == coin.strip().lower())
+    else:
+        query = select(
+            Investment.coin_name,
+            func.count(Investment.id),
+            func.sum(Investment.amount),
+            func.sum(Investment.amount * Investment.purchase_price_usd)
+        ).group_by(Investment.coin_name)
+        if coin:
+            query = query.where(Investment.coin_name == coin.strip().lower())
+        if start is not None:
+            query = query.where(Investment.timestamp >= start)
+        if end is not None:
+            query = query.where(Investment.timestamp < end)
+
+    results = await scatter_execute(sessions, query)
+    rows = [row for result in results for row in result.all()]
     
-    if not investments:
+    if not rows:
         return {
             "total_investments": 0,
             "total_value_usd": 0,
             "coins": []
         }
     
-    total_value = sum(inv.amount * inv.purchase_price_usd for inv in investments)
-    
-    # Group by coin
-    coins_summary = {}
-    for inv in investments:
-        if inv.coin_name not in coins_summary:
-            coins_summary[inv.coin_name] = {
-                "total_amount": 0,
-                "total_value_usd": 0,
-                "count": 0
-            }
-        coins_summary[inv.coin_name]["total_amount"] += inv.amount
-        coins_summary[inv.coin_name]["total_value_usd"] += inv.amount * inv.purchase_price_usd
-        coins_summary[inv.coin_name]["count"] += 1
+    coins_summary = {
+        coin_name: {
+            "total_amount": total_amount,
+            "total_value_usd": total_value,
+            "count": count
+        }
+        for coin_name, count, total_amount, total_value in rows
+    }
     
     return {
         "database": "Replica (172.20.0.11)",
-        "total_investments": len(investments),
-        "total_value_usd": round(total_value, 2),
+        "total_investments": sum(row[1] for row in rows),
+        "total_value_usd": round(sum(row[3] for row in rows), 2),
         "coins": coins_summary
     }
 
 
+# (expires_at, payload) of the last valuation computed by this worker
+_valuation_cache: Tuple[float, Optional[dict]] = (0.0, None)
+
+
+@app.get("/portfolio/valuation")
+async def get_portfolio_valuation(
+    request: Request,
+    response: Response,
+    dbs: ShardSessions = Depends(get_db_read)
+):
+    """
+    Mark-to-market valuation of the portfolio.
+    
+    ✅ READS FROM REPLICA DATABASE (172.20.0.11)
+    
+    Combines the per-coin totals in coin_totals with current prices (the
+    shared snapshot or fresh cache entries, plus one batched CoinGecko call
+    for the rest), so the cost
+    depends on the number of coins, not on the length of the history. The
+    result is reused for PORTFOLIO_CACHE_TTL seconds unless the request
+    carries a consistency token.
+    
+    Returns:
+        Cost basis, market value and unrealized P&L per coin and overall
+    """
+    global _valuation_cache
+    response.headers["Cache-Control"] = f"max-age={int(PORTFOLIO_CACHE_TTL)}"
+
+    use_cache = CONSISTENCY_TOKEN_HEADER not in request.headers
+    expires_at, payload = _valuation_cache
+    if use_cache and payload is not None and time.monotonic() < expires_at:
+        return payload
+
+    query = (
+        select(CoinTotal.coin_name, CoinTotal.total_amount, CoinTotal.total_cost_usd)
+        .where(CoinTotal.count > 0)
+        .order_by(CoinTotal.coin_name)
+    )
+    results = await scatter_execute(await dbs.scatter(), query)
+    totals = merge_sorted([result.all() for result in results], lambda row: row.coin_name)
+    prices = await get_crypto_prices([row[0] for row in totals]) if totals else {}
+
+    payload = {
+        "database": "Replica (172.20.0.11)",
+        "as_of": datetime.utcnow().isoformat(),
+        **value_portfolio(totals, prices)
+    }
+    if use_cache:
+        _valuation_cache = (time.monotonic() + PORTFOLIO_CACHE_TTL, payload)
+    return payload
+
+
+@app.get("/prices/cache")
+async def get_price_cache_stats():
+    """Hit/miss/stale counters of the price cache and state of the refresher"""
+    return {
+        "cache": price_cache.stats(),
+        "refresher": price_refresher.stats(),
+        "shared_snapshot": shared_prices.stats() if shared_prices is not None else None
+    }
+
+
+@app.get("/replicas")
+async def get_replicas():
+    """Health, requests in flight and replication lag of every read replica (per shard when sharded)"""
+    if not shards.sharded:
+        return shards.shards[0].replica_pool.stats()
+    return {"shards": {shard.name: shard.replica_pool.stats() for shard in shards}}
+
+
+@app.get("/replication/lag")
+async def get_replication_lag(samples: int = Query(60, ge=0, le=10000)):
+    """
+    Replication lag time series of this worker's monitor: byte and time lag
+    per replica, master WAL senders and WAL rate, with percentiles over the
+    kept window (REPLICATION_MONITOR_ENABLED=1; one series per shard). With
+    the shared price snapshot only the leader worker samples; the others
+    answer with its pid
+
+    Args:
+        samples: Most recent samples returned in the series (0: summary only)
+    """
+    if not replication_monitors:
+        return {"mode": "disabled", "detail": "set REPLICATION_MONITOR_ENABLED=1"}
+    if shared_prices is not None and not shared_prices.is_leader:
+        return {
+            "mode": "follower",
+            "detail": "lag is sampled by the leader worker; retry to reach it",
+            "leader_pid": shared_prices.stats()["leader_pid"]
+        }
+    if not shards.sharded:
+        return replication_monitors[shards.shards[0].name].stats(samples)
+    return {"shards": {name: monitor.stats(samples) for name, monitor in replication_monitors.items()}}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus text exposition of this worker's metrics"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/live/investments")
+async def live_investments(request: Request):
+    """
+    Server-sent events stream of new investments.
+    
+    Every worker holds one LISTEN connection on the master and fans its
+    notifications out to all connected clients, so a client waits for a push
+    instead of polling the replicas. Each event's data is a JSON object with
+    "type" "investment" (the new row, as returned by POST /invest) or
+    "batch" (count and id range of a bulk insert). Idle streams get a
+    keep-alive comment every LIVE_HEARTBEAT seconds. A client that falls
+    behind is disconnected and should resync with /history?since_id= and
+    the X-Sync-Cursor of its last read.
+    """
+    sub = live_feed.subscribe()
+
+    async def events():
+        try:
+            yield "retry: 2000\n\n"
+            while not sub.dropped:
+                payload = await sub.get(LIVE_HEARTBEAT)
+                if payload is None:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                else:
+                    yield f"data: {payload}\n\n"
+        finally:
+            live_feed.unsubscribe(sub)
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/debug/queries")
+async def get_debug_queries(
+    limit: int = Query(20, ge=1, le=500),
+    sort: str = Query("total_ms", pattern="^(total_ms|mean_ms|max_ms|count|slow)$")
+):
+    """
+    Statement profile of this worker: normalized statements with count,
+    total/mean/max time and captured EXPLAIN plan, plus the latest slow
+    queries (SLOW_QUERY_THRESHOLD_MS)
+    """
+    return query_profiler.report(limit, sort)
+
+
+@app.delete("/debug/queries")
+async def reset_debug_queries():
+    """Clear the statement profile and slow-query log"""
+    query_profiler.reset()
+    return {"status": "reset"}
+
+
+@app.get("/invest/queue")
+async def get_invest_queue():
+    """Depth and group sizes of the group-commit writer (INVEST_GROUP_COMMIT=1; one per shard)"""
+    if not shards.sharded:
+        return next(iter(group_writers.values())).stats()
+    return {"shards": {name: writer.stats() for name, writer in group_writers.items()}}
+
+
+@app.get("/live/stats")
+async def get_live_stats():
+    """Listener state and subscriber count of this worker's live feed"""
+    return live_feed.stats()
+
+
 @app.get("/health")
-def health_check():
+async def health_check():
     """Health check endpoint"""
+    schema = schema_check.stats()
     return {
-        "status": "healthy",
-        "timestamp": datetime.utcnow().isoformat()
+        "status": "healthy" if schema["state"] in ("ok", "pending") else "degraded",
+        "timestamp": datetime.utcnow().isoformat(),
+        "schema": schema
     }
 
 
+@app.get("/debug/startup")
+async def get_debug_startup():
+    """Time spent importing and initializing this worker, by phase"""
+    return startup_timer.report()
+
+
+startup_timer.mark("define routes")
+
+
 # ============================================
 # STARTUP MESSAGE
 # ============================================
 @app.on_event("startup")
 async def startup_event():
+    startup_timer.mark("server setup")
     print("=" * 60)
     print("🚀 Crypto Investment Tracker API Started")
     print("=" * 60)
-    print("📊 Master DB (WRITE):  172.20.0.10:5432")
-    print("📖 Replica DB (READ):  172.20.0.11:5432")
+    for shard in shards:
+        prefix = f"[{shard.name}] " if shards.sharded else ""
+        print(f"📊 {prefix}Master DB (WRITE):  {shard.master_name}")
+        for node in shard.replica_pool.replicas:
+            print(f"📖 {prefix}Replica DB (READ):  {node.name}")
     print("🌐 API Documentation:  http://localhost:8000/docs")
     print("=" * 60)
+    startup_timer.mark("create engines")
+    schema_check.start()
+    for shard in shards:
+        shard.replica_pool.start()
+        if REPLICATION_MONITOR_ENABLED:
+            replication_monitors[shard.name] = ReplicationMonitor(
+                shard.async_engine_master,
+                [(node.name, node.engine) for node in shard.replica_pool.replicas]
+            )
+    startup_timer.mark("start replica pools")
+    if shared_prices is not None:
+        # The elected worker alone runs the refresher and the lag monitors
+        shared_prices.open()
+        if PRICE_REFRESHER_ENABLED or replication_monitors:
+            shared_prices.start(on_elected=start_leader_tasks)
+    else:
+        start_leader_tasks()
+    startup_timer.mark("start price refresher and lag monitors")
+    live_feed.start()
+    if INVEST_GROUP_COMMIT:
+        for writer in group_writers.values():
+            writer.start()
+    startup_timer.mark("start live feed and writers")
+    startup_timer.print_report()
+
+
+def start_leader_tasks():
+    """Background work that runs in one worker only"""
+    if PRICE_REFRESHER_ENABLED:
+        price_refresher.start()
+    for monitor in replication_monitors.values():
+        monitor.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for writer in group_writers.values():
+        await writer.stop()
+    await schema_check.stop()
+    for monitor in replication_monitors.values():
+        await monitor.stop()
+    await live_feed.stop()
+    await price_refresher.stop()
+    if shared_prices is not None:
+        await shared_prices.stop()
+    for shard in shards:
+        await shard.replica_pool.stop()
+    await close_http_client()
+    await dispose_engines()
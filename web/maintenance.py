@@ -0,0 +1,211 @@
+"""
+Maintenance commands for the Crypto Investment database (run against the Master
+of every shard)
+
+Usage:
+    python maintenance.py migrate          # create the tables and record the schema version (before starting the API)
+    python maintenance.py rebuild-totals   # recompute coin_totals from investments
+    python maintenance.py verify-totals    # compare coin_totals with investments
+    python maintenance.py partition-table  # convert investments to monthly partitions (PostgreSQL, once)
+    python maintenance.py create-partitions [--months-ahead N]  # create upcoming monthly partitions
+    python maintenance.py configure-shards # interleave the id sequences of the shards (DATABASE_SHARDS)
+    python maintenance.py rebalance-shards # move rows to the shard owning their coin (writes stopped)
+"""
+import argparse
+import sys
+
+from sqlalchemy import delete, insert, select
+
+from database import shards
+from models import Investment
+from aggregates import rebuild_coin_totals, verify_coin_totals
+from partitions import PARTITION_MONTHS_AHEAD, convert_to_partitioned, ensure_partitions, is_partitioned
+from schema import SCHEMA_VERSION, create_schema, migrate
+from shards import configure_id_sequences
+
+
+def _label(shard) -> str:
+    """Prefix of a per-shard message (empty without sharding)"""
+    return f"[{shard.name}] " if shards.sharded else ""
+
+
+def cmd_migrate(args) -> int:
+    for name, changed in migrate(shards).items():
+        label = f"[{name}] " if shards.sharded else ""
+        state = "migrated" if changed else "already up to date"
+        print(f"✅ {label}Schema version {SCHEMA_VERSION} ({state})")
+    return 0
+
+
+def cmd_rebuild_totals(args) -> int:
+    for shard in shards:
+        create_schema(shard.engine_master)
+        with shard.session_master() as db:
+            coins = rebuild_coin_totals(db)
+        print(f"✅ {_label(shard)}coin_totals rebuilt: {coins} coin(s)")
+    return 0
+
+
+def cmd_verify_totals(args) -> int:
+    status = 0
+    for shard in shards:
+        with shard.session_master() as db:
+            mismatches = verify_coin_totals(db)
+        if not mismatches:
+            print(f"✅ {_label(shard)}coin_totals is consistent with investments")
+            continue
+        print(f"❌ {_label(shard)}{len(mismatches)} coin(s) out of sync:")
+        for mismatch in mismatches:
+            print(f"   {mismatch}")
+        print("   Run 'python maintenance.py rebuild-totals' to repair")
+        status = 1
+    return status
+
+
+def _require_postgresql() -> bool:
+    if any(shard.engine_master.dialect.name != "postgresql" for shard in shards):
+        print("❌ Partitioning requires PostgreSQL")
+        return False
+    return True
+
+
+def cmd_partition_table(args) -> int:
+    if not _require_postgresql():
+        return 1
+    for shard in shards:
+        create_schema(shard.engine_master)
+        with shard.session_master() as db:
+            if is_partitioned(db):
+                print(f"✅ {_label(shard)}investments is already partitioned")
+                continue
+            rows = convert_to_partitioned(db, args.months_ahead)
+        print(f"✅ {_label(shard)}investments converted to monthly partitions: {rows} row(s) copied")
+    return 0
+
+
+def cmd_create_partitions(args) -> int:
+    if not _require_postgresql():
+        return 1
+    for shard in shards:
+        with shard.session_master() as db:
+            if not is_partitioned(db):
+                print(f"❌ {_label(shard)}investments is not partitioned; "
+                      "run 'python maintenance.py partition-table' first")
+                return 1
+            created = ensure_partitions(db, args.months_ahead)
+        if created:
+            print(f"✅ {_label(shard)}Created {len(created)} partition(s): {', '.join(created)}")
+        else:
+            print(f"✅ {_label(shard)}Partitions already exist through {args.months_ahead} month(s) ahead")
+    return 0
+
+
+def cmd_configure_shards(args) -> int:
+    if not shards.sharded:
+        print("✅ Single master (DATABASE_SHARDS is not set): nothing to configure")
+        return 0
+    for shard in shards:
+        create_schema(shard.engine_master)
+    for shard, changed in zip(shards, configure_id_sequences(shards)):
+        state = "configured" if changed else "already configured"
+        print(f"✅ {_label(shard)}ids {shard.index + 1}, {shard.index + 1 + len(shards)}, ... ({state})")
+    return 0
+
+
+def _move_coin(source, target, coin: str, batch_size: int) -> int:
+    """
+    Move every investment of a coin from one shard's master to another's,
+    batch_size rows at a time in id order. Each batch is inserted and
+    committed on the target, then deleted and committed on the source; rows
+    whose id is already on the target (a batch copied before an interrupted
+    run) are not inserted again, so the move can simply be re-run.
+
+    Returns:
+        Rows moved
+
+    Raises:
+        RuntimeError: If an id to move belongs to another coin on the target
+    """
+    table = Investment.__table__
+    moved, last_id = 0, 0
+    with source.session_master() as src, target.session_master() as dst:
+        while True:
+            rows = src.execute(
+                select(table)
+                .where(table.c.coin_name == coin, table.c.id > last_id)
+                .order_by(table.c.id)
+                .limit(batch_size)
+            ).mappings().all()
+            if not rows:
+                return moved
+            ids = [row["id"] for row in rows]
+            existing = dict(dst.execute(select(table.c.id, table.c.coin_name).where(table.c.id.in_(ids))).all())
+            clashes = sorted(i for i, existing_coin in existing.items() if existing_coin != coin)
+            if clashes:
+                raise RuntimeError(f"ids {clashes[:5]} of {coin} already exist on {target.name} for another coin")
+            new_rows = [dict(row) for row in rows if row["id"] not in existing]
+            if new_rows:
+                dst.execute(insert(table), new_rows)
+            dst.commit()
+            src.execute(delete(table).where(table.c.coin_name == coin, table.c.id.in_(ids)))
+            src.commit()
+            moved += len(rows)
+            last_id = ids[-1]
+
+
+def cmd_rebalance_shards(args) -> int:
+    if not shards.sharded:
+        print("✅ Single master (DATABASE_SHARDS is not set): nothing to rebalance")
+        return 0
+    moved = 0
+    # Rows written before sharding (or before the number of shards changed)
+    # may sit on a shard that no longer owns their coin
+    for source in shards:
+        with source.session_master() as src:
+            coins = src.scalars(select(Investment.coin_name).distinct()).all()
+        for coin in coins:
+            target = shards.for_coin(coin)
+            if target is source:
+                continue
+            try:
+                count = _move_coin(source, target, coin, args.batch_size)
+            except RuntimeError as e:
+                print(f"❌ {e}")
+                return 1
+            moved += count
+            print(f"   {coin}: {count} row(s) {source.name} -> {target.name}")
+    if not moved:
+        print("✅ Every coin is already on its shard (run verify-totals if a previous run was interrupted)")
+        return 0
+    for shard in shards:
+        with shard.session_master() as db:
+            rebuild_coin_totals(db)
+    print(f"✅ Moved {moved} row(s); coin_totals rebuilt on every shard")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate", help="Create the tables and record the schema version").set_defaults(func=cmd_migrate)
+    commands.add_parser("rebuild-totals", help="Recompute coin_totals from investments").set_defaults(func=cmd_rebuild_totals)
+    commands.add_parser("verify-totals", help="Compare coin_totals with investments").set_defaults(func=cmd_verify_totals)
+    commands.add_parser("configure-shards", help="Interleave the id sequences of the shards").set_defaults(func=cmd_configure_shards)
+    rebalance = commands.add_parser("rebalance-shards", help="Move rows to the shard owning their coin")
+    rebalance.add_argument("--batch-size", type=int, default=5000, help="Rows copied per transaction (default 5000)")
+    rebalance.set_defaults(func=cmd_rebalance_shards)
+    for name, func, help_text in (
+        ("partition-table", cmd_partition_table, "Convert investments to monthly range partitions"),
+        ("create-partitions", cmd_create_partitions, "Create the monthly partitions of upcoming months"),
+    ):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD,
+                             help=f"Months after the current one to cover (default {PARTITION_MONTHS_AHEAD})")
+        command.set_defaults(func=func)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,336 @@
+"""
+Minimal Prometheus-style metrics for the API, exposed at GET /metrics.
+
+Counters, gauges and histograms are plain in-process dicts keyed by label
+values, so recording a sample is a dict lookup plus a few additions and can
+stay enabled under load. Metrics are per worker process.
+"""
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from sqlalchemy import event
+
+# Latency buckets in seconds (upper bounds; +Inf is implicit)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Row-count buckets for result sizes
+ROW_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+
+# Every metric created below, in exposition order
+REGISTRY: List["Metric"] = []
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base class: a named metric family with fixed label names"""
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Monotonically increasing value"""
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(Metric):
+    """Value that goes up and down; may be computed at scrape time by a callback"""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(),
+                 collect: Callable[[], Dict[Tuple[str, ...], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._collect = collect
+
+    def set(self, *labels: str, value: float):
+        self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        values = dict(self._values)
+        if self._collect is not None:
+            values.update(self._collect())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(values.items())
+        ]
+
+
+class Histogram(Metric):
+    """Distribution of observations over fixed cumulative buckets"""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def time(self, *labels: str):
+        """Context manager observing the elapsed time of its block"""
+        return _Timer(self, labels)
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return int(sum(series[:-1])) if series else 0
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, f'le="{_format_value(float(bound))}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            suffix = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{suffix} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+
+def render_metrics() -> str:
+    """Every registered metric in the Prometheus text exposition format"""
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ============================================
+# API METRICS
+# ============================================
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Time to produce the response, by route",
+    ["method", "route"]
+)
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "Requests served, by route and status code",
+    ["method", "route", "status"]
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Statement execution time, by database role",
+    ["role"]
+)
+DB_QUERY_ERRORS = Counter(
+    "db_query_errors_total", "Statements that raised, by database role",
+    ["role"]
+)
+COINGECKO_REQUEST_DURATION = Histogram(
+    "coingecko_request_duration_seconds", "CoinGecko API call latency",
+    ["endpoint"]
+)
+COINGECKO_ERRORS = Counter(
+    "coingecko_errors_total", "Failed CoinGecko API calls, by kind",
+    ["kind"]
+)
+HISTORY_ROWS = Histogram(
+    "history_rows_returned", "Rows returned per GET /history request",
+    ["mode"], buckets=ROW_BUCKETS
+)
+EXPORT_ROWS = Counter(
+    "export_rows_total", "Rows streamed by GET /export, by format",
+    ["format"]
+)
+
+LIVE_SUBSCRIBERS = Gauge(
+    "live_subscribers", "Clients connected to GET /live/investments"
+)
+LIVE_EVENTS = Counter(
+    "live_events_total", "Investment events fanned out to live subscribers"
+)
+
+GROUP_COMMIT_QUEUE_DEPTH = Gauge(
+    "group_commit_queue_depth", "Investments waiting for the group-commit writer, by shard",
+    ["shard"]
+)
+GROUP_COMMIT_ROWS = Histogram(
+    "group_commit_rows", "Investments written per group-commit transaction, by shard",
+    ["shard"], buckets=ROW_BUCKETS
+)
+GROUP_COMMIT_DURATION = Histogram(
+    "group_commit_flush_duration_seconds", "Time to write and commit one group, by shard",
+    ["shard"]
+)
+GROUP_COMMIT_WAIT = Histogram(
+    "group_commit_wait_seconds", "Time from queueing an investment to its group's commit, by shard",
+    ["shard"]
+)
+GROUP_COMMIT_REJECTED = Counter(
+    "group_commit_rejected_total", "Investments refused with 503 because the queue was full, by shard",
+    ["shard"]
+)
+
+
+# ============================================
+# REQUEST INSTRUMENTATION
+# ============================================
+class RequestMetricsMiddleware:
+    """
+    Latency histogram and status counter per route template, as a plain
+    ASGI middleware: it only watches `send`, so response bodies (NDJSON,
+    exports, SSE) stream through untouched. Latency runs up to the start of
+    the response; a handler that raises before it is counted as a 500.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        recorded = False
+
+        def record(status: int):
+            nonlocal recorded
+            recorded = True
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, scope["method"], path)
+            HTTP_REQUESTS.inc(scope["method"], path, str(status))
+
+        async def send_and_record(message):
+            if message["type"] == "http.response.start":
+                record(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_record)
+        except Exception:
+            if not recorded:
+                record(500)
+            raise
+
+
+# ============================================
+# DATABASE INSTRUMENTATION
+# ============================================
+_POOLS: Dict[str, object] = {}
+
+
+def instrument_engine(engine, role: str, name: str = None):
+    """
+    Time every statement run through an engine (sync or async) and expose its
+    connection pool as gauges
+
+    Args:
+        engine: Engine or AsyncEngine
+        role: "master" or "replica"
+        name: Pool label (defaults to role)
+    """
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        DB_QUERY_DURATION.observe(time.perf_counter() - started, role)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        conn = context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+        DB_QUERY_ERRORS.inc(role)
+
+    _POOLS[name or role] = sync_engine.pool
+
+
+def _pool_values(method: str) -> Dict[Tuple[str, ...], float]:
+    values = {}
+    for name, pool in _POOLS.items():
+        reader = getattr(pool, method, None)
+        if reader is not None:
+            values[(name,)] = reader()
+    return values
+
+
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "Connections currently in use, by pool", ["pool"],
+    collect=lambda: _pool_values("checkedout")
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow", "Connections opened beyond pool_size, by pool", ["pool"],
+    collect=lambda: {labels: max(0, value) for labels, value in _pool_values("overflow").items()}
+)
+DB_POOL_SIZE = Gauge(
+    "db_pool_size", "Configured pool size, by pool", ["pool"],
+    collect=lambda: _pool_values("size")
+)
@@ -1,22 +1,65 @@
 """
 Database models for the Crypto Investment application
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import Column, Integer, String, Float, DateTime, Index
 from datetime import datetime
 from database import Base
 
 
 class Investment(Base):
     """
-    Investment table to track cryptocurrency purchases
+    Investment table to track cryptocurrency purchases.
+    On PostgreSQL it can be range-partitioned by month on timestamp
+    (see partitions.py); the primary key then becomes (id, timestamp).
     """
     __tablename__ = "investments"
+    __table_args__ = (
+        # Per-coin reads over time (/history?coin=, /stats windows)
+        Index("ix_investments_coin_name_timestamp", "coin_name", "timestamp"),
+        # Keyset order of /history
+        Index("ix_investments_timestamp_id", "timestamp", "id"),
+        # Compact index for time-range scans over append-only data
+        Index("ix_investments_timestamp_brin", "timestamp", postgresql_using="brin").ddl_if(dialect="postgresql"),
+    )
 
-    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    coin_name = Column(String(100), nullable=False, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    coin_name = Column(String(100), nullable=False)
     amount = Column(Float, nullable=False)
     purchase_price_usd = Column(Float, nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow, nullable=False)
 
     def __repr__(self):
         return f"<Investment(id={self.id}, coin={self.coin_name}, amount={self.amount}, price=${self.purchase_price_usd})>"
+
+
+class CoinTotal(Base):
+    """
+    Per-coin running totals of the investments table.
+    Updated in the same transaction as every insert so /stats reads
+    O(number of coins) rows instead of aggregating the whole history.
+    """
+    __tablename__ = "coin_totals"
+
+    coin_name = Column(String(100), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    total_amount = Column(Float, nullable=False, default=0)
+    total_cost_usd = Column(Float, nullable=False, default=0)
+    first_timestamp = Column(DateTime, nullable=False)
+    last_timestamp = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<CoinTotal(coin={self.coin_name}, count={self.count}, cost=${self.total_cost_usd})>"
+
+
+class SchemaVersion(Base):
+    """
+    Schema versions applied by `python maintenance.py migrate` (one row per
+    migration). The API only reads the highest version at startup.
+    """
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True)
+    applied_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<SchemaVersion(version={self.version}, applied_at={self.applied_at})>"
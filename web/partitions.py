@@ -0,0 +1,139 @@
+"""
+Monthly range partitioning of the investments table (PostgreSQL only).
+
+The partitioned layout is a parent table PARTITION BY RANGE (timestamp) with
+one child per calendar month (investments_yYYYYmMM) plus a DEFAULT partition
+that catches rows outside every monthly range, so inserts never fail when
+partitions were not created in time. Queries bounded on timestamp (history
+windows, /stats windows, time series) only touch the matching months.
+
+convert_to_partitioned() turns the plain table created by create_all into
+the partitioned layout; ensure_partitions() creates upcoming months ahead of
+time, moving any rows that already landed in the DEFAULT partition.
+"""
+import os
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from models import Investment
+
+# Months after the current one that must already have a partition
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+
+DEFAULT_PARTITION = "investments_default"
+
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+
+def add_months(moment: datetime, months: int) -> datetime:
+    index = moment.year * 12 + moment.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"investments_y{month.year}m{month.month:02d}"
+
+
+def is_partitioned(db: Session) -> bool:
+    """True if investments is already a partitioned table"""
+    return bool(db.scalar(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table p "
+        "JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.oid = to_regclass('investments'))"
+    )))
+
+
+def _partition_exists(db: Session, name: str) -> bool:
+    return db.scalar(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})
+
+
+def _create_month(db: Session, month: datetime) -> bool:
+    """
+    Create and attach the partition of one month (no-op if it exists).
+    Rows of that month sitting in the DEFAULT partition are moved into it
+    first, since ATTACH refuses to overlap them.
+    """
+    name = partition_name(month)
+    if _partition_exists(db, name):
+        return False
+    bounds = {"start": month, "end": add_months(month, 1)}
+    db.execute(text(f"CREATE TABLE {name} (LIKE investments INCLUDING DEFAULTS)"))
+    db.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION}
+            WHERE timestamp >= :start AND timestamp < :end
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """), bounds)
+    db.execute(text(
+        f"ALTER TABLE investments ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{bounds['start'].isoformat()}') TO ('{bounds['end'].isoformat()}')"
+    ))
+    return True
+
+
+def _create_months(db: Session, months_ahead: int, since: Optional[datetime]) -> List[str]:
+    now = month_start(datetime.utcnow())
+    month = month_start(since) if since is not None else now
+    last = add_months(now, months_ahead)
+    created = []
+    while month <= last:
+        if _create_month(db, month):
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def ensure_partitions(db: Session, months_ahead: int = PARTITION_MONTHS_AHEAD,
+                      since: Optional[datetime] = None) -> List[str]:
+    """
+    Create the monthly partitions from `since` (default: this month) through
+    `months_ahead` months after the current one, then commit
+
+    Returns:
+        Names of the partitions created
+    """
+    created = _create_months(db, months_ahead, since)
+    db.commit()
+    return created
+
+
+def convert_to_partitioned(db: Session, months_ahead: int = PARTITION_MONTHS_AHEAD) -> int:
+    """
+    Rebuild a plain investments table as a partitioned one, in a single
+    transaction (writers and readers wait until it commits).
+
+    Columns and the id sequence are kept; the primary key becomes
+    (id, timestamp) because PostgreSQL requires unique constraints on a
+    partitioned table to include the partition key.
+
+    Returns:
+        Number of rows copied
+    """
+    db.execute(text("LOCK TABLE investments IN ACCESS EXCLUSIVE MODE"))
+    first = db.scalar(text("SELECT min(timestamp) FROM investments"))
+
+    db.execute(text("ALTER TABLE investments RENAME TO investments_legacy"))
+    db.execute(text(
+        "CREATE TABLE investments (LIKE investments_legacy INCLUDING DEFAULTS) "
+        "PARTITION BY RANGE (timestamp)"
+    ))
+    db.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF investments DEFAULT"))
+    # The id sequence must survive dropping the old table
+    db.execute(text("ALTER SEQUENCE investments_id_seq OWNED BY investments.id"))
+
+    _create_months(db, months_ahead, since=first)
+    rows = db.execute(text("INSERT INTO investments SELECT * FROM investments_legacy")).rowcount
+    db.execute(text("DROP TABLE investments_legacy"))
+
+    db.execute(text("ALTER TABLE investments ADD PRIMARY KEY (id, timestamp)"))
+    for index in Investment.__table__.indexes:
+        index.create(db.connection())
+    db.commit()
+    return rows
@@ -0,0 +1,60 @@
+"""
+Mark-to-market valuation of the portfolio.
+Works on per-coin totals (one row per coin) with numpy arrays, so the cost
+is independent of the length of the investment history.
+"""
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+
+def value_portfolio(totals: Sequence[Tuple[str, float, float]], prices: Dict[str, float]) -> dict:
+    """
+    Value holdings at current prices
+
+    Args:
+        totals: (coin_name, total_amount, total_cost_usd) per coin
+        prices: Current price in USD per coin (coins without a price are reported as unpriced)
+
+    Returns:
+        Per-coin and overall cost basis, market value and unrealized P&L
+    """
+    coins: List[str] = [row[0] for row in totals]
+    amount = np.fromiter((row[1] for row in totals), dtype=float, count=len(coins))
+    cost = np.fromiter((row[2] for row in totals), dtype=float, count=len(coins))
+    price = np.fromiter((prices.get(coin, np.nan) for coin in coins), dtype=float, count=len(coins))
+
+    priced = ~np.isnan(price)
+    value = amount * price
+    pnl = value - cost
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_cost = np.where(amount > 0, cost / amount, np.nan)
+        pnl_pct = np.where(cost > 0, pnl / cost * 100, np.nan)
+
+    def number(x: float, digits: int = 2):
+        return None if np.isnan(x) else round(float(x), digits)
+
+    summary = {
+        coin: {
+            "total_amount": float(amount[i]),
+            "cost_basis_usd": number(cost[i]),
+            "avg_cost_usd": number(avg_cost[i], 8),
+            "current_price_usd": number(price[i], 8),
+            "market_value_usd": number(value[i]),
+            "unrealized_pnl_usd": number(pnl[i]),
+            "unrealized_pnl_pct": number(pnl_pct[i]),
+        }
+        for i, coin in enumerate(coins)
+    }
+
+    total_cost = float(cost[priced].sum())
+    total_value = float(value[priced].sum())
+    total_pnl = total_value - total_cost
+    return {
+        "coins": summary,
+        "total_cost_basis_usd": round(float(cost.sum()), 2),
+        "total_market_value_usd": round(total_value, 2),
+        "total_unrealized_pnl_usd": round(total_pnl, 2),
+        "total_unrealized_pnl_pct": round(total_pnl / total_cost * 100, 2) if total_cost > 0 else None,
+        "unpriced_coins": [coin for coin, ok in zip(coins, priced) if not ok],
+    }
@@ -0,0 +1,453 @@
+"""
+Cryptocurrency price lookups against the CoinGecko API.
+Prices are kept in an in-process TTL cache so concurrent /invest requests
+share a single upstream call per coin, and a background refresher keeps
+every tracked coin warm with batched requests.
+
+All upstream calls go through one shared keep-alive httpx.AsyncClient so
+they never block the event loop or pin a threadpool worker.
+"""
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+from fastapi import HTTPException
+
+from metrics import COINGECKO_ERRORS, COINGECKO_REQUEST_DURATION
+
+# ============================================
+# CONFIGURATION
+# ============================================
+# Base URL of the price API (point it at a local fake server for testing)
+COINGECKO_API_URL = os.getenv("COINGECKO_API_URL", "https://api.coingecko.com/api/v3")
+
+# Seconds a cached price is served as fresh
+PRICE_CACHE_TTL = float(os.getenv("PRICE_CACHE_TTL", "30"))
+
+# Extra seconds an expired price may still be served while it is refreshed
+PRICE_CACHE_STALE_TTL = float(os.getenv("PRICE_CACHE_STALE_TTL", "60"))
+
+# Timeout for upstream calls
+PRICE_REQUEST_TIMEOUT = float(os.getenv("PRICE_REQUEST_TIMEOUT", "10"))
+
+# Connection limits of the shared HTTP client
+PRICE_HTTP_MAX_CONNECTIONS = int(os.getenv("PRICE_HTTP_MAX_CONNECTIONS", "20"))
+PRICE_HTTP_MAX_KEEPALIVE = int(os.getenv("PRICE_HTTP_MAX_KEEPALIVE", "10"))
+
+# Background refresher: enable flag, seconds between refreshes and coins per request
+PRICE_REFRESHER_ENABLED = os.getenv("PRICE_REFRESHER_ENABLED", "1") == "1"
+PRICE_REFRESH_INTERVAL = float(os.getenv("PRICE_REFRESH_INTERVAL", "15"))
+PRICE_REFRESH_BATCH_SIZE = int(os.getenv("PRICE_REFRESH_BATCH_SIZE", "100"))
+
+# Seconds between reloads of the tracked coin list from the database
+PRICE_COIN_LIST_INTERVAL = float(os.getenv("PRICE_COIN_LIST_INTERVAL", "300"))
+
+# Oldest snapshot (seconds) a write may use before failing with 503
+PRICE_MAX_STALENESS = float(os.getenv("PRICE_MAX_STALENESS", "120"))
+
+
+# ============================================
+# SHARED HTTP CLIENT
+# ============================================
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the process-wide keep-alive HTTP client, creating it on first use"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            base_url=COINGECKO_API_URL,
+            timeout=PRICE_REQUEST_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=PRICE_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=PRICE_HTTP_MAX_KEEPALIVE
+            )
+        )
+    return _http_client
+
+
+async def close_http_client():
+    """Close the shared HTTP client (called on API shutdown)"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+# ============================================
+# UPSTREAM FETCH
+# ============================================
+async def fetch_crypto_price(coin_name: str) -> float:
+    """
+    Fetch current cryptocurrency price from CoinGecko API (uncached)
+
+    Args:
+        coin_name: Name of the cryptocurrency (e.g., 'bitcoin', 'ethereum')
+
+    Returns:
+        Current price in USD
+
+    Raises:
+        HTTPException: If API call fails or coin not found
+    """
+    try:
+        with COINGECKO_REQUEST_DURATION.time("simple_price"):
+            response = await get_http_client().get(
+                "/simple/price", params={"ids": coin_name, "vs_currencies": "usd"}
+            )
+        response.raise_for_status()
+
+        data = response.json()
+
+        if coin_name not in data:
+            COINGECKO_ERRORS.inc("not_found")
+            raise HTTPException(
+                status_code=404,
+                detail=f"Cryptocurrency '{coin_name}' not found. Please check the coin name."
+            )
+
+        price = data[coin_name]["usd"]
+        return float(price)
+
+    except httpx.HTTPError as e:
+        COINGECKO_ERRORS.inc(type(e).__name__)
+        raise HTTPException(
+            status_code=503,
+            detail=f"Failed to fetch cryptocurrency price: {str(e)}"
+        )
+
+
+async def fetch_crypto_prices(coin_names: Iterable[str]) -> Dict[str, float]:
+    """
+    Fetch the prices of several coins in one CoinGecko request
+
+    Args:
+        coin_names: CoinGecko ids to look up
+
+    Returns:
+        Mapping coin -> price in USD; unknown coins are omitted
+
+    Raises:
+        HTTPException: If the API call fails
+    """
+    try:
+        with COINGECKO_REQUEST_DURATION.time("simple_price_batch"):
+            response = await get_http_client().get(
+                "/simple/price", params={"ids": ",".join(coin_names), "vs_currencies": "usd"}
+            )
+        response.raise_for_status()
+        data = response.json()
+    except httpx.HTTPError as e:
+        COINGECKO_ERRORS.inc(type(e).__name__)
+        raise HTTPException(
+            status_code=503,
+            detail=f"Failed to fetch cryptocurrency prices: {str(e)}"
+        )
+
+    return {
+        coin: float(quote["usd"])
+        for coin, quote in data.items()
+        if isinstance(quote, dict) and "usd" in quote
+    }
+
+
+# ============================================
+# PRICE CACHE
+# ============================================
+class PriceCache:
+    """
+    TTL cache for coin prices with stale-while-revalidate and single-flight.
+
+    - Fresh entries (age < ttl) are returned directly.
+    - Stale entries (age < ttl + stale_ttl) are returned immediately while a
+      background refresh task is started.
+    - Missing or expired entries are fetched before returning. Concurrent
+      callers for the same coin await the same task instead of each calling
+      upstream.
+    """
+
+    def __init__(self, fetcher: Callable[[str], Awaitable[float]] = fetch_crypto_price,
+                 ttl: float = PRICE_CACHE_TTL, stale_ttl: float = PRICE_CACHE_STALE_TTL,
+                 batch_fetcher: Callable[[List[str]], Awaitable[Dict[str, float]]] = fetch_crypto_prices):
+        self.fetcher = fetcher
+        self.batch_fetcher = batch_fetcher
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries: Dict[str, Tuple[float, float]] = {}  # coin -> (price, fetched_at)
+        self._flights: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.upstream_calls = 0
+        self.upstream_errors = 0
+
+    async def get(self, coin_name: str) -> float:
+        """
+        Return the price of a coin, fetching it from upstream if needed
+
+        Raises:
+            HTTPException: If the upstream fetch fails and no usable entry exists
+        """
+        entry = self._entries.get(coin_name)
+        if entry is not None:
+            price, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                self.hits += 1
+                return price
+            if age < self.ttl + self.stale_ttl:
+                self.stale += 1
+                self._flight(coin_name)
+                return price
+
+        self.misses += 1
+        # shield: a cancelled request must not cancel the fetch other callers await
+        return await asyncio.shield(self._flight(coin_name))
+
+    def _flight(self, coin_name: str) -> asyncio.Task:
+        """Return the in-progress fetch for a coin, starting one if needed"""
+        task = self._flights.get(coin_name)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(coin_name))
+            self._flights[coin_name] = task
+            task.add_done_callback(lambda t: self._flight_done(coin_name, t))
+        return task
+
+    def _flight_done(self, coin_name: str, task: asyncio.Task):
+        self._flights.pop(coin_name, None)
+        if not task.cancelled():
+            task.exception()  # mark background failures as retrieved
+
+    async def _fetch(self, coin_name: str) -> float:
+        """Fetch a price from upstream and store it"""
+        self.upstream_calls += 1
+        try:
+            price = await self.fetcher(coin_name)
+        except BaseException:
+            self.upstream_errors += 1
+            raise
+        self._entries[coin_name] = (price, time.monotonic())
+        return price
+
+    async def get_many(self, coin_names: Iterable[str]) -> Dict[str, float]:
+        """
+        Prices of several coins: fresh entries come from the cache and all the
+        others are fetched together in one batched upstream request.
+        Coins unknown upstream are omitted.
+
+        Raises:
+            HTTPException: If the batched fetch fails
+        """
+        prices: Dict[str, float] = {}
+        missing: List[str] = []
+        now = time.monotonic()
+        for coin_name in coin_names:
+            entry = self._entries.get(coin_name)
+            if entry is not None and now - entry[1] < self.ttl:
+                self.hits += 1
+                prices[coin_name] = entry[0]
+            else:
+                self.misses += 1
+                missing.append(coin_name)
+
+        if missing:
+            self.upstream_calls += 1
+            try:
+                fetched = await self.batch_fetcher(missing)
+            except BaseException:
+                self.upstream_errors += 1
+                raise
+            self.put_many(fetched)
+            prices.update(fetched)
+        return prices
+
+    def coins(self) -> List[str]:
+        """Every cached coin"""
+        return list(self._entries)
+
+    def put_many(self, prices: Dict[str, float]):
+        """Store freshly fetched prices, e.g. from a batched refresh"""
+        now = time.monotonic()
+        for coin_name, price in prices.items():
+            self._entries[coin_name] = (price, now)
+
+    def peek(self, coin_name: str) -> Optional[Tuple[float, float]]:
+        """Return (price, age in seconds) of a cached coin without fetching"""
+        entry = self._entries.get(coin_name)
+        if entry is None:
+            return None
+        price, fetched_at = entry
+        return price, time.monotonic() - fetched_at
+
+    def clear(self):
+        """Drop every cached price"""
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """Counters describing cache effectiveness"""
+        lookups = self.hits + self.misses + self.stale
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_ratio": round((self.hits + self.stale) / lookups, 4) if lookups else 0.0,
+            "upstream_calls": self.upstream_calls,
+            "upstream_errors": self.upstream_errors,
+            "ttl_seconds": self.ttl,
+            "stale_ttl_seconds": self.stale_ttl,
+        }
+
+
+# ============================================
+# BACKGROUND REFRESHER
+# ============================================
+class PriceRefresher:
+    """
+    Periodically refreshes the prices of every tracked coin in batched
+    upstream requests, so writes read a local snapshot instead of the network.
+
+    Tracked coins are the static list plus whatever `coin_source` returns
+    (the coins already present in the investments table).
+    """
+
+    def __init__(self, cache: PriceCache,
+                 coin_source: Callable[[], Awaitable[Iterable[str]]] = None,
+                 static_coins: Iterable[str] = (),
+                 batch_fetcher: Callable[[List[str]], Awaitable[Dict[str, float]]] = fetch_crypto_prices,
+                 interval: float = PRICE_REFRESH_INTERVAL,
+                 batch_size: int = PRICE_REFRESH_BATCH_SIZE,
+                 max_staleness: float = PRICE_MAX_STALENESS,
+                 coin_list_interval: float = PRICE_COIN_LIST_INTERVAL):
+        self.cache = cache
+        self.coin_source = coin_source
+        self.batch_fetcher = batch_fetcher
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self.max_staleness = max_staleness
+        self.coin_list_interval = coin_list_interval
+        self._coins = set(static_coins)
+        self._coins_loaded_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.last_refresh_at: Optional[float] = None
+        self.last_refresh_seconds: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start the refresh loop as a task on the running event loop"""
+        if self.running:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        """Stop the refresh loop"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def track(self, coin_name: str):
+        """Add a coin to the next refresh"""
+        self._coins.add(coin_name)
+
+    def tracked_coins(self) -> List[str]:
+        return sorted(self._coins)
+
+    async def _loop(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.interval)
+
+    async def _reload_coins(self):
+        """Merge the coins found by coin_source into the tracked set"""
+        if self.coin_source is None:
+            return
+        now = time.monotonic()
+        if self._coins_loaded_at is not None and now - self._coins_loaded_at < self.coin_list_interval:
+            return
+        try:
+            coins = await self.coin_source()
+        except Exception as e:
+            print(f"⚠️  Price refresher could not load tracked coins: {e}")
+            return
+        self._coins.update(coins)
+        self._coins_loaded_at = now
+
+    async def refresh(self):
+        """Fetch every tracked coin, batch_size ids per upstream request"""
+        started = time.monotonic()
+        await self._reload_coins()
+        # Coins seen since by any reader of the cache (other workers' requests
+        # in the shared snapshot)
+        self._coins.update(self.cache.coins())
+        coins = self.tracked_coins()
+        for i in range(0, len(coins), self.batch_size):
+            batch = coins[i:i + self.batch_size]
+            try:
+                prices = await self.batch_fetcher(batch)
+            except Exception as e:
+                self.refresh_errors += 1
+                print(f"⚠️  Price refresh failed for {len(batch)} coin(s): {e}")
+                continue
+            self.cache.put_many(prices)
+        self.refreshes += 1
+        self.last_refresh_at = time.monotonic()
+        self.last_refresh_seconds = self.last_refresh_at - started
+
+    async def get(self, coin_name: str) -> float:
+        """
+        Return a coin price from the local snapshot
+
+        Raises:
+            HTTPException: 503 if the snapshot is older than max_staleness
+        """
+        entry = self.cache.peek(coin_name)
+        if entry is None:
+            # First time we see this coin: fetch it once and keep it warm
+            price = await self.cache.get(coin_name)
+            self.track(coin_name)
+            return price
+
+        price, age = entry
+        if age > self.max_staleness:
+            raise HTTPException(
+                status_code=503,
+                detail=f"Price snapshot for '{coin_name}' is {age:.0f}s old "
+                       f"(limit {self.max_staleness:.0f}s). Try again later."
+            )
+        return price
+
+    def stats(self) -> dict:
+        """State of the refresh loop"""
+        return {
+            "running": self.running,
+            "tracked_coins": len(self._coins),
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "last_refresh_age_seconds": (
+                round(time.monotonic() - self.last_refresh_at, 3)
+                if self.last_refresh_at is not None else None
+            ),
+            "last_refresh_seconds": (
+                round(self.last_refresh_seconds, 3)
+                if self.last_refresh_seconds is not None else None
+            ),
+            "interval_seconds": self.interval,
+            "batch_size": self.batch_size,
+            "max_staleness_seconds": self.max_staleness,
+        }
+
+
+# Shared cache used by the API
+price_cache = PriceCache()
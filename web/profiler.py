@@ -0,0 +1,201 @@
+"""
+Statement profiler for the async engines, exposed at GET /debug/queries.
+
+Every statement is timed through SQLAlchemy cursor events and aggregated by
+its normalized text (literals, bind parameters and VALUES/IN lists
+collapsed), so the same query issued with different arguments is one entry.
+Statements slower than SLOW_QUERY_THRESHOLD_MS are logged; a sample of the
+slow SELECTs also gets its plan captured with EXPLAIN (optionally ANALYZE)
+on a separate connection, off the request path. This replaces statement
+logging on the master (log_statement='all') and engine echo for finding
+regressions.
+"""
+import asyncio
+import os
+import random
+import re
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from sqlalchemy import event
+
+# ============================================
+# CONFIGURATION
+# ============================================
+QUERY_PROFILER_ENABLED = os.getenv("QUERY_PROFILER_ENABLED", "1") == "1"
+
+# Statements taking longer than this are logged as slow
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "100"))
+
+# Fraction of slow SELECTs whose plan is captured (0 disables EXPLAIN)
+SLOW_QUERY_EXPLAIN_SAMPLE = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE", "0.1"))
+
+# Use EXPLAIN ANALYZE (runs the SELECT again) instead of a plain EXPLAIN
+SLOW_QUERY_EXPLAIN_ANALYZE = os.getenv("SLOW_QUERY_EXPLAIN_ANALYZE", "0") == "1"
+
+# Distinct normalized statements tracked, and recent slow queries kept
+QUERY_PROFILER_MAX_STATEMENTS = int(os.getenv("QUERY_PROFILER_MAX_STATEMENTS", "500"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "50"))
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_PARAM = re.compile(r"\$\d+|%\(\w+\)s|%s|\?|\b\d+(?:\.\d+)?\b")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_statement(statement: str) -> str:
+    """SQL text with literals and parameters replaced by ? and lists collapsed"""
+    normalized = _STRING.sub("?", statement)
+    normalized = _PARAM.sub("?", normalized)
+    normalized = _LIST.sub("(...)", normalized)
+    return _SPACE.sub(" ", normalized).strip()
+
+
+class StatementStats:
+    """Running totals of one normalized statement"""
+
+    def __init__(self, statement: str, role: str):
+        self.statement = statement
+        self.role = role
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.slow = 0
+        self.plan: Optional[str] = None
+        self.plan_captured_at: Optional[float] = None
+        self.explaining = False
+
+    def stats(self) -> dict:
+        return {
+            "statement": self.statement,
+            "role": self.role,
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else None,
+            "max_ms": round(self.max_ms, 3),
+            "slow": self.slow,
+            "plan": self.plan,
+        }
+
+
+class QueryProfiler:
+    """Per-statement timings, a slow-query log and sampled EXPLAIN plans"""
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_THRESHOLD_MS,
+                 explain_sample: float = SLOW_QUERY_EXPLAIN_SAMPLE,
+                 explain_analyze: bool = SLOW_QUERY_EXPLAIN_ANALYZE,
+                 max_statements: int = QUERY_PROFILER_MAX_STATEMENTS,
+                 log_size: int = SLOW_QUERY_LOG_SIZE):
+        self.threshold_ms = threshold_ms
+        self.explain_sample = explain_sample
+        self.explain_analyze = explain_analyze
+        self.max_statements = max_statements
+        self.statements: Dict[tuple, StatementStats] = {}
+        self.slow_log = deque(maxlen=log_size)
+        self.dropped = 0
+        self._normalized: Dict[str, str] = {}
+
+    def instrument(self, engine, role: str):
+        """Time every statement run through an AsyncEngine"""
+        sync_engine = engine.sync_engine
+
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("profiler_started", []).append(time.perf_counter())
+
+        @event.listens_for(sync_engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            elapsed_ms = (time.perf_counter() - conn.info["profiler_started"].pop()) * 1000
+            if context is not None and context.execution_options.get("skip_profiler"):
+                return  # our own EXPLAIN
+            self.record(engine, role, statement, parameters, executemany, elapsed_ms)
+
+        @event.listens_for(sync_engine, "handle_error")
+        def _error(context):
+            conn = context.connection
+            if conn is not None and conn.info.get("profiler_started"):
+                conn.info["profiler_started"].pop()
+
+    def _normalize(self, statement: str) -> str:
+        # Statements come from a small set of compiled queries: cache the regex work
+        normalized = self._normalized.get(statement)
+        if normalized is None:
+            normalized = normalize_statement(statement)
+            if len(self._normalized) < self.max_statements * 4:
+                self._normalized[statement] = normalized
+        return normalized
+
+    def record(self, engine, role: str, statement: str, parameters, executemany: bool, elapsed_ms: float):
+        normalized = self._normalize(statement)
+        key = (role, normalized)
+        entry = self.statements.get(key)
+        if entry is None:
+            if len(self.statements) >= self.max_statements:
+                self.dropped += 1
+                return
+            entry = self.statements[key] = StatementStats(normalized, role)
+        entry.count += 1
+        entry.total_ms += elapsed_ms
+        entry.max_ms = max(entry.max_ms, elapsed_ms)
+        if elapsed_ms < self.threshold_ms:
+            return
+
+        entry.slow += 1
+        self.slow_log.append({
+            "at": time.time(),
+            "role": role,
+            "duration_ms": round(elapsed_ms, 3),
+            "statement": normalized,
+        })
+        print(f"🐢 Slow query ({role}, {elapsed_ms:.1f} ms): {normalized[:300]}")
+
+        if (not executemany and not entry.explaining
+                and engine.dialect.name == "postgresql"
+                and normalized.lstrip("( ").upper().startswith(("SELECT", "WITH"))
+                and random.random() < self.explain_sample):
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return
+            entry.explaining = True
+            loop.create_task(self._explain(engine, entry, statement, parameters))
+
+    async def _explain(self, engine, entry: StatementStats, statement: str, parameters):
+        """Capture the plan on another connection; its transaction is rolled back"""
+        prefix = "EXPLAIN (ANALYZE, BUFFERS) " if self.explain_analyze else "EXPLAIN "
+        try:
+            async with engine.connect() as conn:
+                result = await conn.exec_driver_sql(
+                    prefix + statement, parameters, execution_options={"skip_profiler": True}
+                )
+                entry.plan = "\n".join(row[0] for row in result)
+                entry.plan_captured_at = time.time()
+                print(f"🐢 Plan ({entry.role}):\n{entry.plan}")
+        except Exception as e:
+            entry.plan = f"EXPLAIN failed: {e!r}"
+        finally:
+            entry.explaining = False
+
+    def report(self, limit: int = 20, sort: str = "total_ms") -> dict:
+        entries = sorted(
+            (entry.stats() for entry in self.statements.values()),
+            key=lambda stats: stats[sort] or 0, reverse=True
+        )
+        return {
+            "threshold_ms": self.threshold_ms,
+            "explain_sample": self.explain_sample,
+            "explain_analyze": self.explain_analyze,
+            "tracked_statements": len(self.statements),
+            "untracked_executions": self.dropped,
+            "statements": entries[:limit],
+            "slow_queries": list(reversed(self.slow_log)),
+        }
+
+    def reset(self):
+        self.statements.clear()
+        self.slow_log.clear()
+        self.dropped = 0
+
+
+query_profiler = QueryProfiler()
@@ -0,0 +1,218 @@
+"""
+Read pool over one or more PostgreSQL replicas.
+
+Reads go to the healthy replica with the fewest requests in flight. A
+background task probes every replica, samples its replication lag against
+the master and ejects nodes that are down or lagging; when no replica is
+usable, reads fall back to the master.
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+# ============================================
+# CONFIGURATION
+# ============================================
+# Seconds between health/lag probes of every replica
+REPLICA_HEALTH_INTERVAL = float(os.getenv("REPLICA_HEALTH_INTERVAL", "5"))
+
+# Timeout of a single probe
+REPLICA_HEALTH_TIMEOUT = float(os.getenv("REPLICA_HEALTH_TIMEOUT", "2"))
+
+# A replica further behind than either limit stops receiving reads
+REPLICA_MAX_LAG_BYTES = int(os.getenv("REPLICA_MAX_LAG_BYTES", str(16 * 1024 * 1024)))
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "30"))
+
+# Probe run on each replica: replay position, and seconds since the last
+# replayed transaction when WAL is still pending (0 when fully caught up)
+_REPLICA_PROBE = text("""
+    SELECT
+        pg_last_wal_replay_lsn()::text,
+        CASE
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+        END
+""")
+_LAG_BYTES = text(
+    "SELECT pg_wal_lsn_diff(CAST(CAST(:master AS text) AS pg_lsn), CAST(CAST(:replica AS text) AS pg_lsn))"
+)
+
+
+class ReplicaNode:
+    """One replica: its engine, load and last known health"""
+
+    def __init__(self, name: str, engine: AsyncEngine):
+        self.name = name
+        self.engine = engine
+        self.sessionmaker = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+        self.outstanding = 0
+        self.healthy = True
+        self.lag_bytes: Optional[float] = None
+        self.lag_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_check: Optional[float] = None
+        self.served = 0
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "served": self.served,
+            "lag_bytes": self.lag_bytes,
+            "lag_seconds": round(self.lag_seconds, 3) if self.lag_seconds is not None else None,
+            "last_error": self.last_error,
+            "last_check_age_seconds": (
+                round(time.monotonic() - self.last_check, 3) if self.last_check is not None else None
+            ),
+        }
+
+
+class ReplicaPool:
+    """
+    Least-outstanding-requests balancer over the replicas, with periodic
+    health checks and lag-based ejection. Falls back to the master.
+    """
+
+    def __init__(self, replicas: List[ReplicaNode], master_engine: AsyncEngine,
+                 interval: float = REPLICA_HEALTH_INTERVAL,
+                 max_lag_bytes: int = REPLICA_MAX_LAG_BYTES,
+                 max_lag_seconds: float = REPLICA_MAX_LAG_SECONDS):
+        self.replicas = replicas
+        self.master_engine = master_engine
+        self.master_sessionmaker = async_sessionmaker(
+            master_engine, autoflush=False, expire_on_commit=False
+        )
+        self.interval = interval
+        self.max_lag_bytes = max_lag_bytes
+        self.max_lag_seconds = max_lag_seconds
+        self.master_fallbacks = 0
+        self._task: Optional[asyncio.Task] = None
+
+    # ---------- balancing ----------
+    def pick(self) -> Optional[ReplicaNode]:
+        """Healthy replica with the fewest requests in flight (None if all are out)"""
+        healthy = [node for node in self.replicas if node.healthy]
+        if not healthy:
+            return None
+        return min(healthy, key=lambda node: node.outstanding)
+
+    @asynccontextmanager
+    async def session(self):
+        """
+        Async session on the least loaded healthy replica, or on the master
+        when none is available. Yields (session, node name or "master").
+        """
+        node = self.pick()
+        if node is None:
+            self.master_fallbacks += 1
+            async with self.master_sessionmaker() as db:
+                yield db, "master"
+            return
+
+        node.outstanding += 1
+        node.served += 1
+        try:
+            async with node.sessionmaker() as db:
+                yield db, node.name
+        except (OSError, DBAPIError) as e:
+            # Lost connection: stop routing here until the next successful probe
+            if isinstance(e, OSError) or e.connection_invalidated:
+                node.healthy, node.last_error = False, repr(e)
+            raise
+        finally:
+            node.outstanding -= 1
+
+    # ---------- health checks ----------
+    def start(self):
+        """Start the health-check loop on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _loop(self):
+        while True:
+            await self.check_all()
+            await asyncio.sleep(self.interval)
+
+    async def _master_lsn(self) -> Optional[str]:
+        try:
+            async with self.master_engine.connect() as conn:
+                result = await asyncio.wait_for(
+                    conn.execute(text("SELECT pg_current_wal_lsn()::text")), REPLICA_HEALTH_TIMEOUT
+                )
+                return result.scalar()
+        except Exception:
+            return None  # lag in bytes is unknown this round; time lag still applies
+
+    async def _probe(self, node: ReplicaNode, master_lsn: Optional[str]) -> Tuple[Optional[float], Optional[float]]:
+        async with node.engine.connect() as conn:
+            result = await asyncio.wait_for(conn.execute(_REPLICA_PROBE), REPLICA_HEALTH_TIMEOUT)
+            replay_lsn, lag_seconds = result.one()
+            lag_bytes = None
+            if master_lsn and replay_lsn:
+                result = await conn.execute(_LAG_BYTES, {"master": master_lsn, "replica": replay_lsn})
+                lag_bytes = max(0.0, float(result.scalar()))
+            return lag_bytes, float(lag_seconds) if lag_seconds is not None else None
+
+    async def check(self, node: ReplicaNode, master_lsn: Optional[str]):
+        """Probe one replica and update its health"""
+        node.last_check = time.monotonic()
+        if node.engine.dialect.name != "postgresql":
+            node.healthy, node.last_error = True, None
+            return
+        try:
+            node.lag_bytes, node.lag_seconds = await self._probe(node, master_lsn)
+        except Exception as e:
+            if node.healthy:
+                print(f"⚠️  Replica {node.name} ejected: {e!r}")
+            node.healthy, node.last_error = False, repr(e)
+            node.lag_bytes = node.lag_seconds = None  # unknown while unreachable
+            return
+
+        lagging = (
+            (node.lag_bytes is not None and node.lag_bytes > self.max_lag_bytes)
+            or (node.lag_seconds is not None and node.lag_seconds > self.max_lag_seconds)
+        )
+        if lagging:
+            if node.healthy:
+                print(f"⚠️  Replica {node.name} ejected: lag {node.lag_bytes} bytes / {node.lag_seconds}s")
+            node.healthy, node.last_error = False, "replication lag above limit"
+        else:
+            if not node.healthy:
+                print(f"✅ Replica {node.name} back in the read pool")
+            node.healthy, node.last_error = True, None
+
+    async def check_all(self):
+        """Probe every replica concurrently"""
+        master_lsn = None
+        if self.master_engine.dialect.name == "postgresql":
+            master_lsn = await self._master_lsn()
+        await asyncio.gather(*(self.check(node, master_lsn) for node in self.replicas))
+
+    async def dispose(self):
+        for node in self.replicas:
+            await node.engine.dispose()
+
+    def stats(self) -> dict:
+        return {
+            "replicas": [node.stats() for node in self.replicas],
+            "healthy": sum(1 for node in self.replicas if node.healthy),
+            "master_fallbacks": self.master_fallbacks,
+            "max_lag_bytes": self.max_lag_bytes,
+            "max_lag_seconds": self.max_lag_seconds,
+        }
@@ -0,0 +1,319 @@
+"""
+Replication lag monitoring (GET /replication/lag and `python replication.py`).
+
+Both sides of streaming replication are sampled at a fixed interval:
+
+    master   pg_current_wal_lsn() and pg_stat_replication: per WAL sender,
+             bytes not yet sent / replayed and PostgreSQL's own write,
+             flush and replay lag times
+    replica  pg_last_wal_receive_lsn(), pg_last_wal_replay_lsn() and the
+             seconds since the last replayed transaction
+
+Every sample becomes a point of a time series kept in memory, with byte lag
+(master position minus replay position) and time lag per replica, and the
+master's WAL rate between samples. Percentiles over the kept window size
+wal_keep_size and the replica limits from data; benchmark.py replication
+uses the same sampler under sustained write load. Every point probes the
+master and the replicas itself: the ReplicaPool health check runs less often
+and only keeps the latest lag, for routing. Inside the API the monitor is
+off by default, and with the shared price snapshot only the elected leader
+worker samples.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from replicas import REPLICA_HEALTH_TIMEOUT
+
+# ============================================
+# CONFIGURATION
+# ============================================
+# Sample replication lag in the background of the API (one worker: the
+# shared snapshot leader when PRICE_SHARED_SNAPSHOT=1)
+REPLICATION_MONITOR_ENABLED = os.getenv("REPLICATION_MONITOR_ENABLED", "0") == "1"
+
+# Seconds between samples
+REPLICATION_SAMPLE_INTERVAL = float(os.getenv("REPLICATION_SAMPLE_INTERVAL", "1"))
+
+# Samples kept per shard (900 at 1 s: the last 15 minutes)
+REPLICATION_HISTORY_SIZE = int(os.getenv("REPLICATION_HISTORY_SIZE", "900"))
+
+_MASTER_POSITION = text("SELECT pg_current_wal_lsn()::text")
+_WAL_SENDERS = text("""
+    SELECT
+        application_name,
+        client_addr::text,
+        state,
+        sync_state,
+        pg_wal_lsn_diff(pg_current_wal_lsn(), sent_lsn),
+        pg_wal_lsn_diff(pg_current_wal_lsn(), replay_lsn),
+        EXTRACT(EPOCH FROM write_lag),
+        EXTRACT(EPOCH FROM flush_lag),
+        EXTRACT(EPOCH FROM replay_lag)
+    FROM pg_stat_replication
+    ORDER BY application_name, client_addr
+""")
+_REPLICA_POSITION = text("""
+    SELECT
+        pg_last_wal_receive_lsn()::text,
+        pg_last_wal_replay_lsn()::text,
+        CASE
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+        END
+""")
+_WAL_KEEP_SIZE = text(
+    "SELECT setting::bigint * 1024 * 1024 FROM pg_settings WHERE name = 'wal_keep_size'"
+)
+
+_PERCENTILES = (50, 95, 99)
+
+
+def lsn_to_int(lsn: str) -> int:
+    """Byte position of a 'X/Y' LSN"""
+    high, _, low = lsn.partition("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+def _bytes(value) -> Optional[int]:
+    return int(value) if value is not None else None
+
+
+def _seconds(value) -> Optional[float]:
+    return round(float(value), 6) if value is not None else None
+
+
+def distribution(values: List[float]) -> Optional[dict]:
+    """Mean, p50/p95/p99 and max of a series (None when empty)"""
+    if not values:
+        return None
+    array = np.asarray(values, dtype=float)
+    summary = {"mean": round(float(array.mean()), 6)}
+    for percentile, value in zip(_PERCENTILES, np.percentile(array, _PERCENTILES)):
+        summary[f"p{percentile}"] = round(float(value), 6)
+    summary["max"] = round(float(array.max()), 6)
+    return summary
+
+
+class ReplicationMonitor:
+    """
+    Time series of the replication lag of one master and its replicas
+
+    Args:
+        master: Async engine of the master
+        replicas: (name, async engine) of every replica
+    """
+
+    def __init__(self, master: AsyncEngine, replicas: List[Tuple[str, AsyncEngine]],
+                 interval: float = REPLICATION_SAMPLE_INTERVAL,
+                 history_size: int = REPLICATION_HISTORY_SIZE):
+        self.master = master
+        self.replicas = replicas
+        self.interval = interval
+        self.samples = deque(maxlen=history_size)
+        self._previous: Optional[Tuple[float, int]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def available(self) -> bool:
+        return self.master.dialect.name == "postgresql"
+
+    # ---------- sampling ----------
+    async def _master(self) -> dict:
+        async with self.master.connect() as conn:
+            position = (await asyncio.wait_for(conn.execute(_MASTER_POSITION), REPLICA_HEALTH_TIMEOUT)).scalar()
+            senders = (await asyncio.wait_for(conn.execute(_WAL_SENDERS), REPLICA_HEALTH_TIMEOUT)).all()
+        return {
+            "lsn": position,
+            "senders": [
+                {
+                    "application_name": name,
+                    "client_addr": client,
+                    "state": state,
+                    "sync_state": sync_state,
+                    "unsent_bytes": _bytes(unsent),
+                    "replay_lag_bytes": _bytes(unreplayed),
+                    "write_lag_seconds": _seconds(write_lag),
+                    "flush_lag_seconds": _seconds(flush_lag),
+                    "replay_lag_seconds": _seconds(replay_lag),
+                }
+                for name, client, state, sync_state, unsent, unreplayed, write_lag, flush_lag, replay_lag in senders
+            ],
+        }
+
+    async def _replica(self, engine: AsyncEngine, master_position: Optional[int]) -> dict:
+        async with engine.connect() as conn:
+            result = await asyncio.wait_for(conn.execute(_REPLICA_POSITION), REPLICA_HEALTH_TIMEOUT)
+            received, replayed, lag_seconds = result.one()
+        sample = {"lag_bytes": None, "receive_lag_bytes": None, "lag_seconds": _seconds(lag_seconds)}
+        if master_position is not None and replayed is not None:
+            sample["lag_bytes"] = max(0, master_position - lsn_to_int(replayed))
+            sample["receive_lag_bytes"] = max(0, master_position - lsn_to_int(received))
+        return sample
+
+    async def sample(self) -> dict:
+        """Take one sample of the master and every replica and append it to the series"""
+        at = time.time()
+        point = {"at": round(at, 3), "master_lsn": None, "wal_rate_bytes_per_second": None}
+        try:
+            master = await self._master()
+            point["master_lsn"] = master["lsn"]
+            point["senders"] = master["senders"]
+        except Exception as e:
+            point["master_error"] = repr(e)
+
+        position = lsn_to_int(point["master_lsn"]) if point["master_lsn"] else None
+        if position is not None:
+            if self._previous is not None and at > self._previous[0]:
+                point["wal_rate_bytes_per_second"] = round((position - self._previous[1]) / (at - self._previous[0]), 1)
+            self._previous = (at, position)
+
+        async def replica(name: str, engine: AsyncEngine) -> Tuple[str, dict]:
+            try:
+                return name, await self._replica(engine, position)
+            except Exception as e:
+                return name, {"error": repr(e)}
+
+        point["replicas"] = dict(await asyncio.gather(*(replica(name, engine) for name, engine in self.replicas)))
+        self.samples.append(point)
+        return point
+
+    # ---------- background loop ----------
+    def start(self):
+        """Sample every `interval` seconds on the running event loop (PostgreSQL only)"""
+        if self.available and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _loop(self):
+        while True:
+            started = time.monotonic()
+            await self.sample()
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    # ---------- reports ----------
+    def summary(self, since: Optional[float] = None) -> dict:
+        """Lag and WAL rate distributions over the kept samples (taken at or after `since`)"""
+        points = [point for point in self.samples if since is None or point["at"] >= since]
+        replicas = {}
+        for name, _ in self.replicas:
+            values = [point["replicas"].get(name, {}) for point in points]
+            replicas[name] = {
+                "lag_bytes": distribution([v["lag_bytes"] for v in values if v.get("lag_bytes") is not None]),
+                "lag_seconds": distribution([v["lag_seconds"] for v in values if v.get("lag_seconds") is not None]),
+                "errors": sum(1 for v in values if "error" in v),
+            }
+        return {
+            "samples": len(points),
+            "window_seconds": round(points[-1]["at"] - points[0]["at"], 3) if points else 0,
+            "wal_rate_bytes_per_second": distribution(
+                [point["wal_rate_bytes_per_second"] for point in points
+                 if point["wal_rate_bytes_per_second"] is not None]
+            ),
+            "replicas": replicas,
+        }
+
+    def stats(self, limit: int = 60) -> dict:
+        if not self.available:
+            return {"mode": "unavailable", "detail": "replication monitoring requires PostgreSQL"}
+        return {
+            "interval_seconds": self.interval,
+            "summary": self.summary(),
+            "series": list(self.samples)[-limit:] if limit else [],
+        }
+
+
+async def wal_keep_size(master: AsyncEngine) -> Optional[int]:
+    """wal_keep_size of the master in bytes"""
+    async with master.connect() as conn:
+        return (await conn.execute(_WAL_KEEP_SIZE)).scalar()
+
+
+# ============================================
+# COMMAND LINE
+# ============================================
+async def watch(args) -> int:
+    from database import shards
+
+    monitors = {
+        shard.name: ReplicationMonitor(
+            shard.async_engine_master,
+            [(node.name, node.engine) for node in shard.replica_pool.replicas],
+            interval=args.interval,
+        )
+        for shard in shards
+    }
+    if not all(monitor.available for monitor in monitors.values()):
+        print("❌ Replication monitoring requires PostgreSQL")
+        return 1
+
+    writer = None
+    output = open(args.csv, "w", newline="") if args.csv else None
+    if output:
+        writer = csv.writer(output)
+        writer.writerow(["at", "shard", "replica", "lag_bytes", "receive_lag_bytes", "lag_seconds",
+                         "wal_rate_bytes_per_second"])
+    print(f"{'time':<12} {'replica':<28} {'lag bytes':>12} {'lag s':>9} {'WAL B/s':>12}")
+    deadline = time.monotonic() + args.duration if args.duration else None
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            started = time.monotonic()
+            points = await asyncio.gather(*(monitor.sample() for monitor in monitors.values()))
+            for (name, monitor), point in zip(monitors.items(), points):
+                label = f"{name}:" if shards.sharded else ""
+                clock = time.strftime("%H:%M:%S", time.localtime(point["at"]))
+                for replica, sample in point["replicas"].items():
+                    if "error" in sample:
+                        print(f"{clock:<12} {label + replica:<28} {sample['error']}")
+                        continue
+                    print(f"{clock:<12} {label + replica:<28} {sample['lag_bytes'] or 0:>12} "
+                          f"{sample['lag_seconds'] or 0:>9.3f} {point['wal_rate_bytes_per_second'] or 0:>12.0f}")
+                    if writer:
+                        writer.writerow([point["at"], name, replica, sample["lag_bytes"], sample["receive_lag_bytes"],
+                                         sample["lag_seconds"], point["wal_rate_bytes_per_second"]])
+            await asyncio.sleep(max(0.0, args.interval - (time.monotonic() - started)))
+    except asyncio.CancelledError:
+        pass  # Ctrl+C: still print the summary
+    finally:
+        if output:
+            output.close()
+        for shard in shards:
+            await shard.async_engine_master.dispose()
+            await shard.replica_pool.dispose()
+
+    summaries = {name: monitor.summary() for name, monitor in monitors.items()}
+    print(json.dumps(summaries if shards.sharded else summaries[shards.shards[0].name], indent=2))
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Sample replication lag of every master/replica pair (DATABASE_* settings of the API)"
+    )
+    parser.add_argument("--interval", type=float, default=REPLICATION_SAMPLE_INTERVAL, help="Seconds between samples")
+    parser.add_argument("--duration", type=float, default=0, help="Stop after this many seconds (default: Ctrl+C)")
+    parser.add_argument("--csv", help="Also write every sample to this CSV file")
+    args = parser.parse_args(argv)
+    return asyncio.run(watch(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
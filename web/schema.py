@@ -0,0 +1,211 @@
+"""
+Schema creation and the API's startup schema check.
+
+The API never creates tables: `python maintenance.py migrate` does, on the
+master of every shard, and records SCHEMA_VERSION in the schema_version
+table. At startup the API only reads that version back (one indexed SELECT
+per master, in the background) and reports a missing or outdated schema in
+the log and in GET /health, so a worker boots without touching the database
+and never races other workers on DDL.
+"""
+import asyncio
+import os
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, insert, inspect, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.orm import Session
+
+from aggregates import rebuild_coin_totals
+from models import Base, CoinTotal, Investment, SchemaVersion
+from partitions import is_partitioned
+from shards import Shard, ShardSet, configure_id_sequences
+
+# ============================================
+# CONFIGURATION
+# ============================================
+# Version of the tables defined in models.py; bump it with every schema change
+# (2: coin/time, keyset and BRIN indexes on existing investments tables)
+SCHEMA_VERSION = 2
+
+# Seconds between schema checks while a master is unreachable
+SCHEMA_CHECK_RETRY_INTERVAL = float(os.getenv("SCHEMA_CHECK_RETRY_INTERVAL", "5"))
+
+
+# ============================================
+# MIGRATIONS
+# ============================================
+def _invalid_indexes(engine: Engine) -> List[str]:
+    """Indexes of investments left invalid by an interrupted CREATE INDEX CONCURRENTLY"""
+    with engine.connect() as conn:
+        return list(conn.scalars(text(
+            "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE i.indrelid = to_regclass('investments') AND NOT i.indisvalid"
+        )))
+
+
+def _index_names(engine: Engine) -> set:
+    """Names of the indexes defined on investments (on the parent, when partitioned)"""
+    if engine.dialect.name != "postgresql":
+        return {index["name"] for index in inspect(engine).get_indexes("investments")}
+    with engine.connect() as conn:
+        return set(conn.scalars(text(
+            "SELECT indexname FROM pg_indexes "
+            "WHERE schemaname = current_schema() AND tablename = 'investments'"
+        )))
+
+
+def create_indexes(engine: Engine) -> List[str]:
+    """
+    Create the indexes of the investments model that an existing table lacks
+    (create_all skips tables that already exist, indexes included). On
+    PostgreSQL they are built CONCURRENTLY, so writes go on during the
+    build, except on a partitioned table, where PostgreSQL does not allow
+    it. An invalid index left by an interrupted build is rebuilt.
+
+    Returns:
+        Names of the indexes created
+    """
+    before = _index_names(engine)
+    if engine.dialect.name != "postgresql":
+        with engine.begin() as conn:
+            for index in Investment.__table__.indexes:
+                index.create(conn, checkfirst=True)
+        return sorted(_index_names(engine) - before)
+
+    invalid = _invalid_indexes(engine)
+    missing = [index for index in Investment.__table__.indexes
+               if index.name not in before or index.name in invalid]
+    if not missing:
+        return []
+    with Session(engine) as db:
+        concurrently = not is_partitioned(db)
+    option = "CONCURRENTLY " if concurrently else ""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for index in missing:
+            if index.name in invalid:
+                conn.execute(text(f'DROP INDEX {option}"{index.name}"'))
+            ddl = str(CreateIndex(index).compile(dialect=engine.dialect))
+            conn.execute(text(ddl.replace("CREATE INDEX ", f"CREATE INDEX {option}", 1)))
+    return [index.name for index in missing]
+
+
+def create_schema(engine: Engine) -> bool:
+    """
+    Create the missing tables and indexes on one master and record SCHEMA_VERSION
+
+    Returns:
+        True if anything was created or rebuilt, or the version was not
+        recorded yet
+    """
+    Base.metadata.create_all(bind=engine)
+    created = create_indexes(engine)
+    with Session(engine) as db:
+        # coin_totals just created (or left empty) next to existing
+        # investments: fill it now, or /stats would report zero
+        rebuilt = (
+            db.scalar(select(CoinTotal.coin_name).limit(1)) is None
+            and db.scalar(select(Investment.id).limit(1)) is not None
+        )
+        if rebuilt:
+            rebuild_coin_totals(db)
+        current = db.scalar(select(func.max(SchemaVersion.version)))
+        if current is not None and current >= SCHEMA_VERSION:
+            return bool(created) or rebuilt
+        db.execute(insert(SchemaVersion).values(version=SCHEMA_VERSION))
+        db.commit()
+    return True
+
+
+def migrate(shards: ShardSet) -> Dict[str, bool]:
+    """
+    Bring every shard to SCHEMA_VERSION; with several shards, also interleave
+    their id sequences so ids stay unique across shards
+
+    Returns:
+        Whether each shard was changed, by shard name
+    """
+    changed = {shard.name: create_schema(shard.engine_master) for shard in shards}
+    if shards.sharded:
+        for shard, sequence_changed in zip(shards, configure_id_sequences(shards)):
+            changed[shard.name] = changed[shard.name] or sequence_changed
+    return changed
+
+
+# ============================================
+# STARTUP CHECK
+# ============================================
+class SchemaCheck:
+    """Background read of the schema version of every shard master"""
+
+    def __init__(self, shards: ShardSet, retry_interval: float = SCHEMA_CHECK_RETRY_INTERVAL):
+        self.shards = shards
+        self.retry_interval = retry_interval
+        self.versions: Dict[str, Optional[int]] = {}
+        self.errors: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            loop = asyncio.get_running_loop()
+            self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run(self):
+        await asyncio.gather(*(self._check(shard) for shard in self.shards))
+
+    async def _check(self, shard: Shard):
+        prefix = f"[{shard.name}] " if self.shards.sharded else ""
+        while True:
+            try:
+                async with shard.async_session_master() as db:
+                    version = await db.scalar(select(func.max(SchemaVersion.version)))
+                break
+            except (ProgrammingError, OperationalError) as e:
+                # A missing table is reported as ProgrammingError by asyncpg and as
+                # OperationalError by SQLite: tell it apart from an unreachable master
+                if "schema_version" in str(e.orig):
+                    version = None
+                    break
+                self.errors[shard.name] = repr(e.orig)
+            except Exception as e:
+                self.errors[shard.name] = repr(e)
+            await asyncio.sleep(self.retry_interval)
+
+        self.errors.pop(shard.name, None)
+        self.versions[shard.name] = version
+        if version is None:
+            print(f"⚠️  {prefix}No schema on {shard.master_name}: run 'python maintenance.py migrate'")
+        elif version < SCHEMA_VERSION:
+            print(f"⚠️  {prefix}Schema version {version} on {shard.master_name} is older than "
+                  f"{SCHEMA_VERSION}: run 'python maintenance.py migrate'")
+
+    @property
+    def state(self) -> str:
+        """ok, pending (not read yet), missing or outdated"""
+        if len(self.versions) < len(self.shards):
+            return "pending"
+        versions = list(self.versions.values())
+        if any(version is None for version in versions):
+            return "missing"
+        if min(versions) < SCHEMA_VERSION:
+            return "outdated"
+        return "ok"
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "expected_version": SCHEMA_VERSION,
+            "versions": dict(self.versions),
+            "errors": dict(self.errors),
+        }
@@ -0,0 +1,268 @@
+"""
+Hash-sharded write masters.
+
+Every coin belongs to exactly one shard, picked by a stable hash of its name,
+so all of its investments and its coin_totals row live on one master/replica
+pair and writes spread over every master. Requests that name a coin touch a
+single shard; the rest are scattered to all shards concurrently and merged
+by the caller: rows in global (timestamp, id) order for /history, buckets
+summed for the time series, and a plain union for /stats and the portfolio,
+since no coin is split between shards.
+
+Ids come from each shard's own sequence. configure_id_sequence() interleaves
+them (shard k of N issues k+1, k+1+N, k+1+2N, ...) so they never collide and
+the (timestamp, id) keyset order stays total across shards.
+"""
+import heapq
+import zlib
+from contextlib import AsyncExitStack
+from functools import cached_property
+from typing import (
+    Any, AsyncContextManager, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+)
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+
+from replicas import ReplicaPool
+
+
+class Shard:
+    """
+    One master/replica pair. Engines, session factories and the read pool
+    are created on first use, so importing the API loads no database driver
+    and opens no connection.
+
+    Args:
+        create_engine_master: Builds the sync master engine (schema and
+            command-line tools)
+        create_async_engines: Builds the async master engine and the read pool
+    """
+
+    def __init__(self, index: int, name: str, master_name: str,
+                 create_engine_master: Callable[["Shard"], Engine],
+                 create_async_engines: Callable[["Shard"], Tuple[AsyncEngine, ReplicaPool]]):
+        self.index = index
+        self.name = name
+        self.master_name = master_name
+        self._create_engine_master = create_engine_master
+        self._create_async_engines = create_async_engines
+
+    @cached_property
+    def engine_master(self) -> Engine:
+        return self._create_engine_master(self)
+
+    @cached_property
+    def session_master(self) -> sessionmaker:
+        return sessionmaker(autocommit=False, autoflush=False, bind=self.engine_master)
+
+    @cached_property
+    def _async_engines(self) -> Tuple[AsyncEngine, ReplicaPool]:
+        return self._create_async_engines(self)
+
+    @property
+    def async_engine_master(self) -> AsyncEngine:
+        return self._async_engines[0]
+
+    @property
+    def replica_pool(self) -> ReplicaPool:
+        return self._async_engines[1]
+
+    @cached_property
+    def async_session_master(self) -> async_sessionmaker:
+        return async_sessionmaker(self.async_engine_master, autoflush=False, expire_on_commit=False)
+
+    @property
+    def async_started(self) -> bool:
+        """True once the async engines exist (nothing to dispose otherwise)"""
+        return "_async_engines" in self.__dict__
+
+    def __repr__(self):
+        return f"<Shard({self.name})>"
+
+
+class ShardSet:
+    """The shards of the deployment and the coin -> shard routing"""
+
+    def __init__(self, shards: List[Shard]):
+        self.shards = shards
+
+    def __iter__(self) -> Iterator[Shard]:
+        return iter(self.shards)
+
+    def __len__(self) -> int:
+        return len(self.shards)
+
+    @property
+    def sharded(self) -> bool:
+        return len(self.shards) > 1
+
+    def for_coin(self, coin_name: str) -> Shard:
+        """Shard owning a coin (crc32 of the name: stable across processes and restarts)"""
+        if not self.sharded:
+            return self.shards[0]
+        return self.shards[zlib.crc32(coin_name.encode()) % len(self.shards)]
+
+    def targets(self, coin_name: Optional[str] = None) -> List[Shard]:
+        """Shards a read must query: the coin's shard, or all of them"""
+        if coin_name:
+            return [self.for_coin(coin_name.strip().lower())]
+        return list(self.shards)
+
+    def split(self, values: List[dict]) -> Dict[Shard, List[int]]:
+        """Positions of investment column dicts grouped by the shard of their coin"""
+        groups: Dict[Shard, List[int]] = {}
+        for position, row in enumerate(values):
+            groups.setdefault(self.for_coin(row["coin_name"]), []).append(position)
+        return groups
+
+
+class ShardSessions:
+    """
+    Sessions of one request, opened on first use (at most one per shard) and
+    closed together when the request ends
+
+    Args:
+        shards: The deployment's ShardSet
+        opener: Returns an async context manager yielding a session on a shard
+    """
+
+    def __init__(self, shards: ShardSet, opener: Callable[[Shard], AsyncContextManager[AsyncSession]]):
+        self.shards = shards
+        self._opener = opener
+        self._stack = AsyncExitStack()
+        self._sessions: Dict[str, AsyncSession] = {}
+
+    async def get(self, shard: Shard) -> AsyncSession:
+        db = self._sessions.get(shard.name)
+        if db is None:
+            db = self._sessions[shard.name] = await self._stack.enter_async_context(self._opener(shard))
+        return db
+
+    async def for_coin(self, coin_name: str) -> AsyncSession:
+        return await self.get(self.shards.for_coin(coin_name))
+
+    async def scatter(self, coin_name: Optional[str] = None) -> List[AsyncSession]:
+        """Sessions on every shard a read must query (see ShardSet.targets)"""
+        return [await self.get(shard) for shard in self.shards.targets(coin_name)]
+
+    def on_close(self, callback: Callable[[], Awaitable[Any]]):
+        """Await `callback` when the request ends, before the sessions opened so far are closed"""
+        self._stack.push_async_callback(callback)
+
+    async def aclose(self):
+        await self._stack.aclose()
+        self._sessions.clear()
+
+
+# ============================================
+# MERGING SCATTERED RESULTS
+# ============================================
+class _Descending:
+    """Sort key wrapper inverting the order, for a max-heap over any comparable key"""
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other: "_Descending") -> bool:
+        return other.key < self.key
+
+
+def merge_sorted(results: List[List[Any]], key: Callable[[Any], Any], reverse: bool = False) -> List[Any]:
+    """Merge row lists already sorted by `key` (one per shard) into one sorted list"""
+    if len(results) == 1:
+        return results[0]
+    return list(heapq.merge(*results, key=key, reverse=reverse))
+
+
+async def merge_streams(streams: List[AsyncIterator[Any]], key: Callable[[Any], Any],
+                        reverse: bool = False) -> AsyncIterator[Any]:
+    """
+    Merge async row iterators already sorted by `key` (one per shard),
+    holding a single row per stream in memory
+    """
+    wrap = _Descending if reverse else (lambda value: value)
+    heap = []
+    for position, stream in enumerate(streams):
+        async for row in stream:
+            heap.append((wrap(key(row)), position, row))
+            break
+    heapq.heapify(heap)
+    while heap:
+        _, position, row = heap[0]
+        yield row
+        async for following in streams[position]:
+            heapq.heapreplace(heap, (wrap(key(following)), position, following))
+            break
+        else:
+            heapq.heappop(heap)
+
+
+# ============================================
+# INTERLEAVED ID SEQUENCES
+# ============================================
+def _max_investment_id(db: Session) -> int:
+    return db.scalar(text("SELECT COALESCE(max(id), 0) FROM investments"))
+
+
+def first_interleaved_id(lowest: int, index: int, count: int) -> int:
+    """Smallest id >= `lowest` in the id series of shard `index` (of `count`): index+1 modulo count"""
+    return lowest + ((index + 1) % count - lowest) % count
+
+
+def configure_id_sequence(db: Session, index: int, count: int, floor: int = 0) -> bool:
+    """
+    Make the investments id sequence of shard `index` (of `count`) issue
+    index+1, index+1+count, ... then commit. No-op when already configured
+    or not on PostgreSQL.
+
+    Args:
+        floor: Highest id issued by any shard so far; the first interleaved
+            id is above it, so ids written before sharding never collide
+
+    Returns:
+        True if the sequence was changed
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    sequence = db.scalar(text("SELECT pg_get_serial_sequence('investments', 'id')"))
+    increment = db.scalar(
+        text("SELECT seqincrement FROM pg_sequence WHERE seqrelid = CAST(:sequence AS regclass)"),
+        {"sequence": sequence}
+    )
+    last_value, is_called = db.execute(text(f"SELECT last_value, is_called FROM {sequence}")).one()
+    max_id = _max_investment_id(db)
+
+    residue = (index + 1) % count
+    upcoming = last_value + increment if is_called else last_value
+    if increment == count and upcoming % count == residue and upcoming > max_id:
+        return False
+
+    next_id = first_interleaved_id(max(floor, max_id, last_value if is_called else 0) + 1, index, count)
+    db.execute(text(f"ALTER SEQUENCE {sequence} INCREMENT BY {int(count)}"))
+    db.execute(text("SELECT setval(CAST(:sequence AS regclass), :next_id, false)"),
+               {"sequence": sequence, "next_id": next_id})
+    db.commit()
+    return True
+
+
+def configure_id_sequences(shards: ShardSet) -> List[bool]:
+    """
+    Interleave the id sequences of every shard (see configure_id_sequence)
+
+    Returns:
+        Whether each shard's sequence was changed
+    """
+    floor = 0
+    for shard in shards:
+        if shard.engine_master.dialect.name == "postgresql":
+            with shard.session_master() as db:
+                floor = max(floor, _max_investment_id(db))
+    changed = []
+    for shard in shards:
+        with shard.session_master() as db:
+            changed.append(configure_id_sequence(db, shard.index, len(shards), floor))
+    return changed
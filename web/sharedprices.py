@@ -0,0 +1,342 @@
+"""
+Price snapshot shared by every uvicorn worker of a host.
+
+With several workers, each process would otherwise run its own refresher
+and cache, multiplying CoinGecko traffic and disagreeing on prices at the
+same instant. Instead the workers map one file (on /dev/shm when available)
+with a fixed layout:
+
+    header  64 bytes   magic, layout version, slot count, slots used,
+                       leader pid, leader's last write (unix time)
+    slot    80 bytes   sequence (u64), price (f64), fetched at (f64, unix
+                       time), name length (u16), coin id (54 bytes utf-8)
+
+One worker is elected through an exclusive flock on a companion .lock file
+and runs the refresher, writing prices into the slots; the others retry the
+lock periodically and take over when the leader exits. Readers never lock:
+each slot is a seqlock (odd sequence while being written, re-read when the
+sequence moved), so /invest in any worker gets its price with a memory read.
+
+A follower that meets a coin missing from the snapshot fetches it once
+through its own cache and claims an empty slot for it (under a flock on the
+snapshot file, the only write a follower makes); the leader's refresher
+picks up every named slot on its next refresh.
+"""
+import asyncio
+import mmap
+import os
+import struct
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; the shared snapshot needs Linux/macOS
+    fcntl = None
+
+from prices import PriceCache
+
+# ============================================
+# CONFIGURATION
+# ============================================
+# Share one price snapshot between the workers of this host
+PRICE_SHARED_SNAPSHOT = os.getenv("PRICE_SHARED_SNAPSHOT", "0") == "1"
+
+# Backing file (tmpfs when possible, so it never touches the disk)
+PRICE_SHARED_PATH = os.getenv(
+    "PRICE_SHARED_PATH",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "crypto_prices.snapshot")
+)
+
+# Coins the snapshot can hold
+PRICE_SHARED_SLOTS = int(os.getenv("PRICE_SHARED_SLOTS", "1024"))
+
+# Seconds between attempts of non-leader workers to take over the refresher
+PRICE_SHARED_ELECTION_INTERVAL = float(os.getenv("PRICE_SHARED_ELECTION_INTERVAL", "5"))
+
+_MAGIC = b"CPRC"
+_LAYOUT_VERSION = 1
+_HEADER = struct.Struct("<4sIIIId")   # magic, version, slots, used, leader pid, leader heartbeat
+_HEADER_SIZE = 64
+_USED_OFFSET = 12
+_LEADER_OFFSET = 16
+_SLOT_SIZE = 80
+_SLOT_VALUE = struct.Struct("<Qdd")   # sequence, price, fetched at
+_SLOT_NAME = struct.Struct("<H54s")   # name length, name
+_NAME_MAX_BYTES = 54
+_SEQUENCE = struct.Struct("<Q")
+_USED = struct.Struct("<I")
+_LEADER = struct.Struct("<Id")
+_READ_RETRIES = 16
+
+
+class SharedPriceSnapshot:
+    """
+    Memory-mapped price table written by one elected worker and read by all.
+
+    Exposes the same peek/put_many/get/get_many/coins interface as
+    PriceCache, so a PriceRefresher can run on top of it unchanged. Coins
+    not in the snapshot yet are fetched through the worker's own `fallback`
+    cache and requested from the leader.
+    """
+
+    def __init__(self, fallback: PriceCache, path: str = PRICE_SHARED_PATH,
+                 slots: int = PRICE_SHARED_SLOTS,
+                 election_interval: float = PRICE_SHARED_ELECTION_INTERVAL):
+        self.fallback = fallback
+        # One file per layout: a deploy with another layout or slot count maps
+        # its own file and never resizes one that running workers have mapped
+        self.path = f"{path}.v{_LAYOUT_VERSION}-{slots}"
+        self.slots = slots
+        self.election_interval = election_interval
+        self.is_leader = False
+        self.hits = 0
+        self.misses = 0
+        self.full = 0
+        self.too_long = 0
+        self._mm: Optional[mmap.mmap] = None
+        self._lock_fd: Optional[int] = None
+        self._index: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    # ---------- mapping ----------
+    def open(self):
+        """
+        Create or attach to the backing file and map it
+
+        Raises:
+            RuntimeError: If fcntl is unavailable, or the file exists with
+                another layout (it is never truncated: other workers may
+                have it mapped)
+        """
+        if fcntl is None:
+            raise RuntimeError("PRICE_SHARED_SNAPSHOT requires fcntl (Linux or macOS)")
+        size = _HEADER_SIZE + self.slots * _SLOT_SIZE
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            # Exclusive while checking the layout, so two workers never both initialize it
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            if os.fstat(fd).st_size == 0:
+                os.ftruncate(fd, size)
+                os.pwrite(fd, _HEADER.pack(_MAGIC, _LAYOUT_VERSION, self.slots, 0, 0, 0.0), 0)
+            header = os.pread(fd, _HEADER.size, 0)
+            current = _HEADER.unpack(header) if len(header) == _HEADER.size else None
+            if (current is None or current[:3] != (_MAGIC, _LAYOUT_VERSION, self.slots)
+                    or os.fstat(fd).st_size < size):
+                raise RuntimeError(
+                    f"{self.path} is not a price snapshot of layout {_LAYOUT_VERSION} with {self.slots} "
+                    f"slots; remove it once no worker uses it, or set PRICE_SHARED_PATH"
+                )
+            self._mm = mmap.mmap(fd, size)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)  # the mapping stays valid
+
+    def close(self):
+        self._release_leadership()
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    def _used(self) -> int:
+        return _USED.unpack_from(self._mm, _USED_OFFSET)[0]
+
+    def _refresh_index(self):
+        """Learn the slots assigned since the last look (names never change once written)"""
+        used = self._used()
+        for slot in range(len(self._index), used):
+            length, name = _SLOT_NAME.unpack_from(self._mm, _HEADER_SIZE + slot * _SLOT_SIZE + _SLOT_VALUE.size)
+            # Names are stored whole (longer ones never get a slot); a damaged
+            # entry must not break every reader, it just never matches a coin
+            self._index[name[:length].decode(errors="replace")] = slot
+
+    def _slot_offset(self, coin_name: str) -> Optional[int]:
+        slot = self._index.get(coin_name)
+        if slot is None:
+            self._refresh_index()
+            slot = self._index.get(coin_name)
+        return None if slot is None else _HEADER_SIZE + slot * _SLOT_SIZE
+
+    # ---------- reads (any worker) ----------
+    def peek(self, coin_name: str) -> Optional[Tuple[float, float]]:
+        """Return (price, age in seconds) from the snapshot without locking"""
+        offset = self._slot_offset(coin_name)
+        if offset is not None:
+            for _ in range(_READ_RETRIES):
+                sequence, price, fetched_at = _SLOT_VALUE.unpack_from(self._mm, offset)
+                if sequence & 1 == 0 and _SEQUENCE.unpack_from(self._mm, offset)[0] == sequence:
+                    if sequence == 0:
+                        break  # slot assigned, never written
+                    self.hits += 1
+                    return price, max(0.0, time.time() - fetched_at)
+            # else: the writer kept the slot busy; treat as a miss
+        self.misses += 1
+        return None
+
+    async def get(self, coin_name: str) -> float:
+        """Price from the snapshot, or fetched through this worker's own cache"""
+        entry = self.peek(coin_name)
+        if entry is not None:
+            return entry[0]
+        price = await self.fallback.get(coin_name)
+        self._publish({coin_name: price})
+        return price
+
+    async def get_many(self, coin_names: Iterable[str], max_age: float = float("inf")) -> Dict[str, float]:
+        """
+        Prices of several coins: snapshot entries at most `max_age` seconds
+        old, and one batched fetch through this worker's cache for the rest
+
+        Raises:
+            HTTPException: If the batched fetch fails
+        """
+        prices: Dict[str, float] = {}
+        missing: List[str] = []
+        for coin_name in coin_names:
+            entry = self.peek(coin_name)
+            if entry is not None and entry[1] <= max_age:
+                prices[coin_name] = entry[0]
+            else:
+                missing.append(coin_name)
+        if missing:
+            fetched = await self.fallback.get_many(missing)
+            self._publish(fetched)
+            prices.update(fetched)
+        return prices
+
+    def coins(self) -> List[str]:
+        """Every coin with a slot, written or only requested"""
+        self._refresh_index()
+        return list(self._index)
+
+    def _publish(self, prices: Dict[str, float]):
+        """Prices fetched outside the refresher: written by the leader, requested by followers"""
+        if self.is_leader:
+            self.put_many(prices)
+        else:
+            for coin_name in prices:
+                self.request(coin_name)
+
+    def request(self, coin_name: str):
+        """Claim an empty slot for a coin, so the leader starts refreshing it"""
+        if self._slot_offset(coin_name) is None:
+            self._assign_slot(coin_name)
+
+    # ---------- slot assignment (any worker) ----------
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        fd = os.open(self.path, os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # releases the lock
+
+    def _assign_slot(self, coin_name: str) -> Optional[int]:
+        """
+        Claim the next free slot for a coin under the file lock
+
+        Returns:
+            Offset of the coin's slot, or None when the snapshot is full or
+            the UTF-8 name does not fit in a slot (that coin keeps being
+            served by each worker's own cache)
+        """
+        encoded = coin_name.encode()
+        if len(encoded) > _NAME_MAX_BYTES:
+            self.too_long += 1
+            return None
+        with self._file_lock():
+            # Another worker may have claimed it while we waited for the lock
+            self._refresh_index()
+            slot = self._index.get(coin_name)
+            if slot is not None:
+                return _HEADER_SIZE + slot * _SLOT_SIZE
+            used = self._used()
+            if used >= self.slots:
+                self.full += 1
+                return None
+            offset = _HEADER_SIZE + used * _SLOT_SIZE
+            _SLOT_VALUE.pack_into(self._mm, offset, 0, 0.0, 0.0)
+            _SLOT_NAME.pack_into(self._mm, offset + _SLOT_VALUE.size, len(encoded), encoded)
+            _USED.pack_into(self._mm, _USED_OFFSET, used + 1)  # publish after the name is in place
+        self._index[coin_name] = used
+        return offset
+
+    # ---------- writes (leader only) ----------
+    def put_many(self, prices: Dict[str, float]):
+        """Write fresh prices (ignored unless this worker is the leader)"""
+        if not self.is_leader:
+            return
+        now = time.time()
+        for coin_name, price in prices.items():
+            offset = self._slot_offset(coin_name)
+            if offset is None:
+                offset = self._assign_slot(coin_name)
+                if offset is None:
+                    continue
+            sequence = _SEQUENCE.unpack_from(self._mm, offset)[0]
+            _SEQUENCE.pack_into(self._mm, offset, sequence + 1)          # odd: being written
+            _SLOT_VALUE.pack_into(self._mm, offset, sequence + 1, price, now)
+            _SEQUENCE.pack_into(self._mm, offset, sequence + 2)          # even: consistent
+        _LEADER.pack_into(self._mm, _LEADER_OFFSET, os.getpid(), now)
+
+    # ---------- leader election ----------
+    def try_lead(self) -> bool:
+        """Take the leader lock if nobody holds it; True if this worker leads"""
+        if self.is_leader:
+            return True
+        fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd  # held until stop() or process exit
+        self.is_leader = True
+        _LEADER.pack_into(self._mm, _LEADER_OFFSET, os.getpid(), time.time())
+        return True
+
+    def _release_leadership(self):
+        if self._lock_fd is not None:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            os.close(self._lock_fd)
+            self._lock_fd = None
+        self.is_leader = False
+
+    def start(self, on_elected: Callable[[], None]):
+        """Run the election loop; `on_elected` is called once if this worker becomes leader"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._elect(on_elected))
+
+    async def _elect(self, on_elected: Callable[[], None]):
+        while not self.try_lead():
+            await asyncio.sleep(self.election_interval)
+        print(f"📈 Worker {os.getpid()} now refreshes the shared price snapshot")
+        on_elected()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self.close()
+
+    def stats(self) -> dict:
+        leader_pid, heartbeat = _LEADER.unpack_from(self._mm, _LEADER_OFFSET) if self._mm else (0, 0.0)
+        return {
+            "path": self.path,
+            "role": "leader" if self.is_leader else "follower",
+            "leader_pid": leader_pid or None,
+            "leader_write_age_seconds": round(time.time() - heartbeat, 3) if heartbeat else None,
+            "slots": self.slots,
+            "slots_used": self._used() if self._mm else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "dropped_full": self.full,
+            "dropped_name_too_long": self.too_long,
+        }
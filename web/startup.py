@@ -0,0 +1,45 @@
+"""
+Startup timing of the API, printed once the worker is ready and exposed at
+GET /debug/startup.
+
+main.py imports this module first and marks the end of each import phase
+(libraries, database layer, application modules, routes); the startup hook
+then times each init step (read pools, price refresher, live feed, ...).
+A regression in boot time shows up here as the phase that grew.
+"""
+import time
+from typing import List, Tuple
+
+
+class StartupTimer:
+    """Consecutive named phases timed from the creation of the timer"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        self._last = self.started
+
+    def mark(self, phase: str):
+        """Close the phase that ends now (it began at the previous mark)"""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    @property
+    def total(self) -> float:
+        return self._last - self.started
+
+    def report(self) -> dict:
+        return {
+            "total_ms": round(self.total * 1000, 1),
+            "phases": [{"phase": phase, "ms": round(seconds * 1000, 1)} for phase, seconds in self.phases],
+        }
+
+    def print_report(self):
+        width = max((len(phase) for phase, _ in self.phases), default=0)
+        print(f"⏱️  Startup in {self.total * 1000:.0f} ms:")
+        for phase, seconds in self.phases:
+            print(f"   {phase:<{width}}  {seconds * 1000:7.1f} ms")
+
+
+startup_timer = StartupTimer()
@@ -0,0 +1,86 @@
+"""
+pytest configuration: the API modules live flat in web/ and import each
+other by module name, so that directory goes on sys.path.
+
+The API settings are read at import time, so they are pinned here before
+any test imports it: one SQLite file as master and replica, no background
+refresher, no sharding, and a CoinGecko URL nothing listens on (prices
+come from the `prices` fixture).
+"""
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+from sqlalchemy import delete
+
+_DATABASE = os.path.join(tempfile.mkdtemp(prefix="crypto-tests-"), "api.db")
+os.environ.update({
+    "DATABASE_MASTER_URL": f"sqlite:///{_DATABASE}",
+    "DATABASE_REPLICA_URLS": f"sqlite:///{_DATABASE}",
+    "DATABASE_SHARDS": "",
+    "COINGECKO_API_URL": "http://127.0.0.1:9",
+    "PRICE_REFRESHER_ENABLED": "0",
+    "PRICE_SHARED_SNAPSHOT": "0",
+    "INVEST_GROUP_COMMIT": "0",
+    "REPLICATION_MONITOR_ENABLED": "0",
+})
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakePrices:
+    """Price source injected into the API's cache: fixed prices, counted calls"""
+
+    def __init__(self):
+        self.prices = {"bitcoin": 50000.0, "ethereum": 3000.0, "solana": 100.0}
+        self.calls = []
+
+    async def fetch(self, coin_name: str) -> float:
+        from fastapi import HTTPException
+
+        self.calls.append([coin_name])
+        if coin_name not in self.prices:
+            raise HTTPException(status_code=404, detail=f"Cryptocurrency '{coin_name}' not found")
+        return self.prices[coin_name]
+
+    async def fetch_many(self, coin_names) -> dict:
+        coin_names = list(coin_names)
+        self.calls.append(coin_names)
+        return {coin_name: self.prices[coin_name] for coin_name in coin_names if coin_name in self.prices}
+
+
+@pytest.fixture
+def prices(monkeypatch) -> FakePrices:
+    import main
+
+    fake = FakePrices()
+    main.price_cache.clear()
+    monkeypatch.setattr(main.price_cache, "fetcher", fake.fetch)
+    monkeypatch.setattr(main.price_cache, "batch_fetcher", fake.fetch_many)
+    return fake
+
+
+@pytest.fixture
+def client(prices):
+    """TestClient of the API over an empty, migrated database"""
+    from fastapi.testclient import TestClient
+
+    import main
+    from database import shards
+    from models import CoinTotal, Investment
+    from schema import migrate
+
+    migrate(shards)
+    for shard in shards:
+        with shard.session_master() as db:
+            db.execute(delete(Investment))
+            db.execute(delete(CoinTotal))
+            db.commit()
+    with TestClient(main.app) as test_client:
+        # Let the startup schema check finish: cancelled mid-query at shutdown,
+        # its SQLite connection can keep the next test's cleanup locked out
+        while main.schema_check.state == "pending":
+            time.sleep(0.001)
+        yield test_client
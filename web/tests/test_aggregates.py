@@ -0,0 +1,35 @@
+"""coin_totals upsert"""
+from datetime import datetime
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from aggregates import coin_totals_upsert
+from models import CoinTotal
+
+
+def test_upsert_without_rows_is_none():
+    assert coin_totals_upsert("sqlite", []) is None
+
+
+def test_upsert_adds_to_existing_totals():
+    engine = create_engine("sqlite://")
+    CoinTotal.__table__.create(engine)
+    early, middle, late = datetime(2026, 1, 1), datetime(2026, 6, 1), datetime(2026, 12, 1)
+
+    with Session(engine) as db:
+        db.execute(coin_totals_upsert("sqlite", [
+            ("bitcoin", 2.0, 100.0, middle),
+            ("bitcoin", 1.0, 50.0, late),
+            ("ethereum", 4.0, 10.0, middle),
+        ]))
+        db.execute(coin_totals_upsert("sqlite", [("bitcoin", 0.5, 200.0, early)]))
+        db.commit()
+        totals = {row.coin_name: row for row in db.scalars(select(CoinTotal))}
+
+    bitcoin = totals["bitcoin"]
+    assert bitcoin.count == 3
+    assert bitcoin.total_amount == 3.5
+    assert bitcoin.total_cost_usd == 2.0 * 100 + 1.0 * 50 + 0.5 * 200
+    assert (bitcoin.first_timestamp, bitcoin.last_timestamp) == (early, late)
+    assert (totals["ethereum"].count, totals["ethereum"].total_cost_usd) == (1, 40.0)
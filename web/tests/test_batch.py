@@ -0,0 +1,77 @@
+"""POST /invest/batch: JSON and NDJSON bodies, partial success and 422"""
+import json
+
+import pytest
+
+import main
+
+
+def test_valid_batch_is_saved_with_one_price_lookup_per_coin(client, prices):
+    rows = [{"coin": "bitcoin", "amount": 1}, {"coin": "ethereum", "amount": 2}, {"coin": "BITCOIN ", "amount": 3}]
+
+    response = client.post("/invest/batch", json=rows)
+    body = response.json()
+
+    assert response.status_code == 200
+    assert body["status"] == "success"
+    assert body["inserted"] == 3 and len(set(body["ids"])) == 3
+    assert body["total_value_usd"] == 4 * 50000 + 2 * 3000
+    assert body["throughput"]["distinct_coins"] == 2
+    assert sorted(coin for call in prices.calls for coin in call) == ["bitcoin", "ethereum"]
+    assert client.get("/stats").json()["total_investments"] == 3
+
+
+def test_invalid_rows_are_reported_and_the_rest_saved(client):
+    rows = [
+        {"coin": "bitcoin", "amount": 1},
+        {"coin": "bitcoin", "amount": -1},
+        "not an object",
+        {"coin": "dogecoin", "amount": 1},
+        {"coin": "solana", "amount": 5},
+    ]
+
+    response = client.post("/invest/batch", json=rows)
+    body = response.json()
+
+    assert response.status_code == 200
+    assert body["status"] == "partial"
+    assert (body["received"], body["inserted"], body["failed"]) == (5, 2, 3)
+    assert [error["index"] for error in body["errors"]] == [1, 2, 3]
+    assert "not found" in body["errors"][2]["error"]
+
+
+def test_batch_without_a_valid_row_is_422(client):
+    response = client.post("/invest/batch", json=[{"coin": "", "amount": 1}, {"coin": "dogecoin", "amount": 1}])
+    body = response.json()
+
+    assert response.status_code == 422
+    assert body["status"] == "failed"
+    assert body["ids"] == [] and body["failed"] == 2
+    assert client.get("/stats").json()["total_investments"] == 0
+
+
+def test_ndjson_body_reports_bad_lines_by_index(client):
+    lines = [json.dumps({"coin": "bitcoin", "amount": 1}), "{not json", "", json.dumps({"coin": "ethereum", "amount": 1})]
+
+    response = client.post("/invest/batch", content="\n".join(lines).encode(),
+                           headers={"Content-Type": "application/x-ndjson"})
+    body = response.json()
+
+    assert response.status_code == 200
+    assert (body["received"], body["inserted"]) == (3, 2)
+    assert body["errors"][0]["index"] == 1 and body["errors"][0]["error"].startswith("Invalid JSON")
+
+
+@pytest.mark.parametrize("body", [b"{not json", b'{"coin": "bitcoin", "amount": 1}'])
+def test_malformed_json_body_is_400(client, body):
+    response = client.post("/invest/batch", content=body, headers={"Content-Type": "application/json"})
+    assert response.status_code == 400
+
+
+def test_batch_over_the_row_limit_is_413(client, monkeypatch):
+    monkeypatch.setattr(main, "INVEST_BATCH_MAX_ROWS", 2)
+
+    assert client.post("/invest/batch", json=[{"coin": "bitcoin", "amount": 1}] * 3).status_code == 413
+    ndjson = "\n".join([json.dumps({"coin": "bitcoin", "amount": 1})] * 3).encode()
+    response = client.post("/invest/batch", content=ndjson, headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 413
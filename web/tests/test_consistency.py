@@ -0,0 +1,93 @@
+"""Read-your-writes: consistency tokens and the replica/master routing of reads"""
+import asyncio
+
+import pytest
+
+import database
+from database import make_consistency_token, parse_consistency_token, wait_for_replay
+
+
+class FakeReplicaSession:
+    """PostgreSQL session whose replay check answers from a list"""
+
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.checks = 0
+        self.rolled_back = False
+        self.dialect = type("Dialect", (), {"name": "postgresql"})()
+
+    def get_bind(self):
+        return self
+
+    async def execute(self, statement, params=None):
+        self.checks += 1
+        answer = self.answers.pop(0) if self.answers else False
+        return type("Result", (), {"scalar": lambda self: answer})()
+
+    async def rollback(self):
+        self.rolled_back = True
+
+
+def test_single_shard_token_is_the_bare_lsn():
+    assert make_consistency_token({"shard0": "0/3000148"}) == "0/3000148"
+    assert make_consistency_token({"shard0": None}) is None
+    assert parse_consistency_token("0/3000148") == {"shard0": "0/3000148"}
+    assert parse_consistency_token("shard0=0/10") == {"shard0": "0/10"}
+
+
+@pytest.mark.parametrize("token", ["3000148", "0/xyz", "shard9=0/10", "shard0=0/10,garbage"])
+def test_malformed_token_is_refused(token):
+    with pytest.raises(ValueError):
+        parse_consistency_token(token)
+
+
+def test_replay_wait_polls_until_caught_up(monkeypatch):
+    monkeypatch.setattr(database, "READ_YOUR_WRITES_POLL_INTERVAL", 0)
+    session = FakeReplicaSession([False, False, True])
+
+    assert asyncio.run(wait_for_replay(session, "0/10")) is True
+    assert session.checks == 3
+    assert session.rolled_back
+
+
+def test_replay_wait_gives_up_after_the_limit(monkeypatch):
+    monkeypatch.setattr(database, "READ_YOUR_WRITES_MAX_WAIT", 0.05)
+    monkeypatch.setattr(database, "READ_YOUR_WRITES_POLL_INTERVAL", 0.01)
+    session = FakeReplicaSession([])
+
+    assert asyncio.run(wait_for_replay(session, "0/10")) is False
+    assert session.checks > 1
+
+
+def test_sqlite_writes_return_no_token(client):
+    response = client.post("/invest", json={"coin": "bitcoin", "amount": 1})
+
+    assert response.json()["consistency_token"] is None
+    assert database.CONSISTENCY_TOKEN_HEADER not in response.headers
+
+
+def test_read_with_token_goes_to_the_replica_once_caught_up(client, monkeypatch):
+    async def caught_up(db, token):
+        return True
+
+    monkeypatch.setattr(database, "wait_for_replay", caught_up)
+    response = client.get("/history", headers={database.CONSISTENCY_TOKEN_HEADER: "0/10"})
+
+    assert response.status_code == 200
+    assert response.headers["X-Read-Source"] != "master"
+
+
+def test_read_with_token_falls_back_to_the_master(client, monkeypatch):
+    async def lagging(db, token):
+        return False
+
+    monkeypatch.setattr(database, "wait_for_replay", lagging)
+    response = client.get("/stats", params={"consistency_token": "0/10"})
+
+    assert response.status_code == 200
+    assert response.headers["X-Read-Source"] == "master"
+
+
+def test_invalid_token_is_400(client):
+    response = client.get("/history", headers={database.CONSISTENCY_TOKEN_HEADER: "not-a-token"})
+    assert response.status_code == 400
@@ -0,0 +1,35 @@
+"""Conditional GET: ETag / If-None-Match on /history and /stats"""
+import pytest
+
+
+@pytest.mark.parametrize("path", ["/history", "/stats"])
+def test_unchanged_table_revalidates_to_304(client, path):
+    client.post("/invest", json={"coin": "bitcoin", "amount": 1})
+    first = client.get(path)
+    etag = first.headers["ETag"]
+
+    again = client.get(path, headers={"If-None-Match": etag})
+
+    assert first.status_code == 200 and first.headers["Cache-Control"] == "no-cache"
+    assert again.status_code == 304
+    assert again.content == b""
+    assert again.headers["ETag"] == etag
+
+
+@pytest.mark.parametrize("path", ["/history", "/stats"])
+def test_write_changes_the_etag(client, path):
+    client.post("/invest", json={"coin": "bitcoin", "amount": 1})
+    etag = client.get(path).headers["ETag"]
+    client.post("/invest", json={"coin": "ethereum", "amount": 2})
+
+    fresh = client.get(path, headers={"If-None-Match": etag})
+
+    assert fresh.status_code == 200
+    assert fresh.headers["ETag"] != etag
+
+
+def test_stale_or_wildcard_if_none_match(client):
+    client.post("/invest", json={"coin": "bitcoin", "amount": 1})
+
+    assert client.get("/stats", headers={"If-None-Match": 'W/"stale"'}).status_code == 200
+    assert client.get("/stats", headers={"If-None-Match": "*"}).status_code == 304
@@ -0,0 +1,118 @@
+"""GET /export: CSV, Arrow and Parquet streams cut on row and batch boundaries"""
+import asyncio
+import csv
+import io
+import os
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import export
+from export import EXPORT_FIELDS, _CopyCsv, _row_boundary, export_query
+from models import Base
+from schema import create_schema
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.parquet as pq  # noqa: E402
+
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+AWKWARD_COIN = 'coin, "quoted"\nand split'
+
+
+@pytest.mark.parametrize("data, boundary", [
+    (b"1,a\n2,b\n3,c", 8),
+    (b"1,a\n2,b\n", 8),
+    (b"1,a", 0),
+    (b'1,"x\ny"\n2,"z', 8),
+    (b'1,"x""\n"\n2,b', 9),
+])
+def test_row_boundary(data, boundary):
+    assert _row_boundary(data) == boundary
+
+
+@pytest.fixture
+def five_rows(client, prices, monkeypatch):
+    """Five investments, one in a coin whose name needs CSV quoting; batches of two rows"""
+    prices.prices[AWKWARD_COIN] = 1.0
+    for coin in ("bitcoin", "ethereum", "bitcoin", "solana", AWKWARD_COIN):
+        assert client.post("/invest", json={"coin": coin, "amount": 1}).status_code == 200
+    monkeypatch.setattr(export, "EXPORT_BATCH_ROWS", 2)
+    return client
+
+
+def test_csv_export(five_rows):
+    response = five_rows.get("/export", params={"format": "csv"})
+
+    assert response.headers["content-type"].startswith("text/csv")
+    assert 'filename="investments.csv"' in response.headers["content-disposition"]
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == EXPORT_FIELDS
+    assert len(rows) == 6
+    assert sorted(row[1] for row in rows[1:]) == sorted(["bitcoin", "ethereum", "bitcoin", "solana", AWKWARD_COIN])
+
+
+def test_arrow_export_has_one_record_batch_per_batch(five_rows):
+    response = five_rows.get("/export", params={"format": "arrow"})
+
+    reader = pa.ipc.open_stream(response.content)
+    batches = list(reader)
+    assert [batch.num_rows for batch in batches] == [2, 2, 1]
+    assert reader.schema.names == EXPORT_FIELDS
+    assert pa.Table.from_batches(batches).column("coin_name").to_pylist().count("bitcoin") == 2
+
+
+def test_parquet_export_has_one_row_group_per_batch(five_rows):
+    response = five_rows.get("/export", params={"format": "parquet"})
+
+    parquet = pq.ParquetFile(io.BytesIO(response.content))
+    assert [parquet.metadata.row_group(i).num_rows for i in range(parquet.num_row_groups)] == [2, 2, 1]
+    assert AWKWARD_COIN in parquet.read().column("coin_name").to_pylist()
+
+
+def test_export_filters(five_rows):
+    response = five_rows.get("/export", params={"format": "csv", "coin": "Bitcoin", "end": "2000-01-01T00:00:00"})
+    assert response.text == ",".join(EXPORT_FIELDS) + "\n"
+
+    rows = list(csv.reader(io.StringIO(five_rows.get("/export", params={"coin": "bitcoin"}).text)))
+    assert [row[1] for row in rows[1:]] == ["bitcoin", "bitcoin"]
+
+
+def test_unknown_format_is_422(client):
+    assert client.get("/export", params={"format": "xlsx"}).status_code == 422
+
+
+@pytest.mark.skipif(not TEST_POSTGRES_URL, reason="set TEST_POSTGRES_URL to a throwaway PostgreSQL database")
+def test_copy_chunks_end_on_row_boundaries(monkeypatch):
+    engine = create_engine(TEST_POSTGRES_URL)
+    Base.metadata.drop_all(engine)
+    create_schema(engine)
+    with engine.begin() as conn:
+        # Enough rows for COPY to hand over its output in several pieces
+        conn.execute(text(
+            "INSERT INTO investments (coin_name, amount, purchase_price_usd, timestamp) "
+            "SELECT CASE WHEN n % 7 = 0 THEN :awkward ELSE 'coin' || n END, n, 1.5, '2026-05-01' "
+            "FROM generate_series(1, 20000) AS n"
+        ), {"awkward": AWKWARD_COIN})
+    monkeypatch.setattr(export, "EXPORT_CHUNK_BYTES", 4096)
+
+    async def copy_chunks():
+        async_engine = create_async_engine(TEST_POSTGRES_URL.replace("postgresql://", "postgresql+asyncpg://", 1))
+        try:
+            async with async_sessionmaker(async_engine)() as db:
+                copy = _CopyCsv(db, export_query(None, None, None))
+                return [chunk async for chunk in copy.chunks()], copy.rows
+        finally:
+            await async_engine.dispose()
+
+    try:
+        chunks, rows = asyncio.run(copy_chunks())
+    finally:
+        Base.metadata.drop_all(engine)
+        engine.dispose()
+
+    assert rows == 20000 and len(chunks) > 1
+    parsed = [list(csv.reader(io.StringIO(chunk.decode()))) for chunk in chunks]
+    assert all(len(row) == len(EXPORT_FIELDS) for chunk in parsed for row in chunk)
+    assert sum(len(chunk) for chunk in parsed) == 20000
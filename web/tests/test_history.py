@@ -0,0 +1,59 @@
+"""GET /history cursors"""
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from main import decode_history_cursor, encode_history_cursor, make_sync_cursor, parse_sync_cursor
+
+
+def test_history_cursor_round_trip():
+    timestamp = datetime(2026, 10, 18, 5, 32, 31, 123456)
+    cursor = encode_history_cursor(timestamp, 180990)
+
+    assert "=" not in cursor
+    assert decode_history_cursor(cursor) == (timestamp, 180990)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "WzEsMiwzXQ", "WyJ4IiwgMV0"])
+def test_malformed_history_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_history_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_sync_cursor_single_shard():
+    last_ids = parse_sync_cursor("41")
+    assert list(last_ids.values()) == [41]
+
+    class Row:
+        def __init__(self, id):
+            self.id = id
+
+    name = next(iter(last_ids))
+    assert make_sync_cursor(last_ids, {name: [Row(45), Row(43)]}) == "45"
+    assert make_sync_cursor(last_ids, {name: []}) == "41"
+
+
+@pytest.mark.parametrize("since_id", ["-1", "abc", "nosuchshard=5"])
+def test_malformed_since_id_is_rejected(since_id):
+    with pytest.raises(HTTPException) as error:
+        parse_sync_cursor(since_id)
+    assert error.value.status_code == 400
+
+
+def test_sync_cursor_stays_below_unsettled_rows(client, monkeypatch):
+    import main
+
+    ids = [client.post("/invest", json={"coin": "bitcoin", "amount": n}).json()["investment"]["id"] for n in (1, 2)]
+
+    monkeypatch.setattr(main, "HISTORY_SYNC_SETTLE", 3600)
+    response = client.get("/history")
+    assert response.headers["X-Sync-Cursor"] == "0"
+    again = client.get("/history", params={"since_id": response.headers["X-Sync-Cursor"]})
+    assert sorted(row["id"] for row in again.json()) == ids
+
+    monkeypatch.setattr(main, "HISTORY_SYNC_SETTLE", 0)
+    settled = client.get("/history", params={"since_id": "0"})
+    assert settled.headers["X-Sync-Cursor"] == str(max(ids))
+    assert client.get("/history", params={"since_id": settled.headers["X-Sync-Cursor"]}).json() == []
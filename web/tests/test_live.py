@@ -0,0 +1,42 @@
+"""Live feed: events pushed to subscribers after a write commits"""
+import json
+
+import main
+from live import LiveFeed
+
+
+def test_investment_is_pushed_to_subscribers(client):
+    sub = main.live_feed.subscribe()
+    try:
+        response = client.post("/invest", json={"coin": "bitcoin", "amount": 2})
+        assert response.status_code == 200
+
+        event = json.loads(sub.queue.get_nowait())
+        assert event["type"] == "investment"
+        assert event["investment"]["id"] == response.json()["investment"]["id"]
+        assert sub.queue.empty()
+    finally:
+        main.live_feed.unsubscribe(sub)
+
+
+def test_failed_write_pushes_nothing(client):
+    sub = main.live_feed.subscribe()
+    try:
+        assert client.post("/invest", json={"coin": "dogecoin", "amount": 2}).status_code == 404
+        assert sub.queue.empty()
+    finally:
+        main.live_feed.unsubscribe(sub)
+
+
+def test_slow_subscriber_is_cut_loose():
+    feed = LiveFeed(lambda: [], queue_size=2)
+    slow, fast = feed.subscribe(), feed.subscribe()
+
+    for n in range(3):
+        feed.dispatch(str(n))
+        if not fast.queue.empty():
+            fast.queue.get_nowait()
+
+    assert slow.dropped and slow not in feed.subscribers
+    assert not fast.dropped and fast in feed.subscribers
+    assert slow.queue.get_nowait() == "0"
@@ -0,0 +1,67 @@
+"""Mark-to-market valuation: value_portfolio and GET /portfolio/valuation"""
+import pytest
+
+import main
+from database import CONSISTENCY_TOKEN_HEADER
+from portfolio import value_portfolio
+
+
+def test_profit_and_loss_per_coin():
+    totals = [("bitcoin", 2.0, 80000.0), ("ethereum", 10.0, 40000.0)]
+
+    valuation = value_portfolio(totals, {"bitcoin": 50000.0, "ethereum": 3000.0})
+
+    bitcoin = valuation["coins"]["bitcoin"]
+    assert bitcoin["avg_cost_usd"] == 40000
+    assert bitcoin["market_value_usd"] == 100000
+    assert bitcoin["unrealized_pnl_usd"] == 20000 and bitcoin["unrealized_pnl_pct"] == 25
+    assert valuation["coins"]["ethereum"]["unrealized_pnl_pct"] == -25
+    assert valuation["total_market_value_usd"] == 130000
+    assert valuation["total_unrealized_pnl_usd"] == 10000
+    assert valuation["total_unrealized_pnl_pct"] == pytest.approx(8.33)
+
+
+def test_unpriced_coin_is_left_out_of_the_totals():
+    totals = [("bitcoin", 1.0, 40000.0), ("delisted", 5.0, 500.0)]
+
+    valuation = value_portfolio(totals, {"bitcoin": 50000.0})
+
+    assert valuation["unpriced_coins"] == ["delisted"]
+    assert valuation["coins"]["delisted"]["market_value_usd"] is None
+    assert valuation["total_cost_basis_usd"] == 40500
+    assert valuation["total_unrealized_pnl_usd"] == 10000
+
+
+def test_empty_portfolio():
+    valuation = value_portfolio([], {})
+    assert valuation["coins"] == {} and valuation["total_unrealized_pnl_pct"] is None
+
+
+@pytest.fixture
+def fresh_valuation(monkeypatch):
+    monkeypatch.setattr(main, "_valuation_cache", (0.0, None))
+
+
+def test_endpoint_values_holdings_at_current_prices(client, prices, fresh_valuation):
+    client.post("/invest", json={"coin": "bitcoin", "amount": 2})
+    prices.prices["bitcoin"] = 60000.0
+    main.price_cache.clear()
+    prices.calls.clear()
+
+    valuation = client.get("/portfolio/valuation").json()
+
+    assert valuation["coins"]["bitcoin"]["cost_basis_usd"] == 100000
+    assert valuation["coins"]["bitcoin"]["current_price_usd"] == 60000
+    assert valuation["total_unrealized_pnl_usd"] == 20000
+    assert prices.calls == [["bitcoin"]]  # one batched lookup
+
+
+def test_endpoint_result_is_reused_unless_reading_own_writes(client, fresh_valuation):
+    client.post("/invest", json={"coin": "bitcoin", "amount": 1})
+    first = client.get("/portfolio/valuation")
+    client.post("/invest", json={"coin": "ethereum", "amount": 1})
+
+    assert first.headers["Cache-Control"] == f"max-age={int(main.PORTFOLIO_CACHE_TTL)}"
+    assert client.get("/portfolio/valuation").json() == first.json()
+    fresh = client.get("/portfolio/valuation", headers={CONSISTENCY_TOKEN_HEADER: "0/0"}).json()
+    assert set(fresh["coins"]) == {"bitcoin", "ethereum"}
@@ -0,0 +1,167 @@
+"""PriceCache: single-flight, TTL, stale-while-revalidate and batched lookups"""
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from prices import PriceCache
+
+
+class FakeUpstream:
+    """Stand-in for fetch_crypto_price: counts calls, optionally slow or failing"""
+
+    def __init__(self, price: float = 100.0, delay: float = 0.0):
+        self.price = price
+        self.delay = delay
+        self.fail = False
+        self.calls = []
+
+    async def __call__(self, coin_name: str) -> float:
+        self.calls.append(coin_name)
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise HTTPException(status_code=503, detail="upstream down")
+        return self.price
+
+
+async def settle(cache: PriceCache):
+    """Wait for the background refreshes started by stale lookups"""
+    await asyncio.gather(*cache._flights.values(), return_exceptions=True)
+
+
+def age_entry(cache: PriceCache, coin_name: str, seconds: float):
+    """Pretend the cached price of a coin was fetched `seconds` ago"""
+    price, _ = cache._entries[coin_name]
+    cache._entries[coin_name] = (price, time.monotonic() - seconds)
+
+
+def test_concurrent_misses_share_one_upstream_call():
+    upstream = FakeUpstream(delay=0.05)
+    cache = PriceCache(upstream, ttl=30, stale_ttl=60)
+
+    async def run():
+        return await asyncio.gather(*(cache.get("bitcoin") for _ in range(50)))
+
+    assert asyncio.run(run()) == [100.0] * 50
+    assert upstream.calls == ["bitcoin"]
+    assert cache.upstream_calls == 1
+    assert cache.misses == 50
+
+
+def test_fresh_entry_is_served_without_upstream_call():
+    upstream = FakeUpstream()
+    cache = PriceCache(upstream, ttl=30, stale_ttl=60)
+
+    async def run():
+        await cache.get("bitcoin")
+        upstream.price = 200.0
+        return await cache.get("bitcoin")
+
+    assert asyncio.run(run()) == 100.0
+    assert len(upstream.calls) == 1
+    assert cache.hits == 1
+
+
+def test_expired_entry_is_fetched_again():
+    upstream = FakeUpstream()
+    cache = PriceCache(upstream, ttl=30, stale_ttl=60)
+
+    async def run():
+        await cache.get("bitcoin")
+        age_entry(cache, "bitcoin", 91)
+        upstream.price = 200.0
+        return await cache.get("bitcoin")
+
+    assert asyncio.run(run()) == 200.0
+    assert len(upstream.calls) == 2
+    assert cache.stale == 0
+
+
+def test_stale_entry_is_served_while_refreshing():
+    upstream = FakeUpstream()
+    cache = PriceCache(upstream, ttl=30, stale_ttl=60)
+
+    async def run():
+        await cache.get("bitcoin")
+        age_entry(cache, "bitcoin", 45)
+        upstream.price = 200.0
+        stale = await cache.get("bitcoin")
+        await settle(cache)
+        return stale, await cache.get("bitcoin")
+
+    assert asyncio.run(run()) == (100.0, 200.0)
+    assert cache.stale == 1
+    assert len(upstream.calls) == 2
+
+
+def test_stale_entry_survives_failing_upstream():
+    upstream = FakeUpstream()
+    cache = PriceCache(upstream, ttl=30, stale_ttl=60)
+
+    async def run():
+        await cache.get("bitcoin")
+        age_entry(cache, "bitcoin", 45)
+        upstream.fail = True
+        served = [await cache.get("bitcoin")]
+        await settle(cache)
+        served.append(await cache.get("bitcoin"))
+        await settle(cache)
+        return served
+
+    assert asyncio.run(run()) == [100.0, 100.0]
+    assert cache.upstream_errors == 2
+    assert cache.peek("bitcoin")[0] == 100.0
+
+
+def test_failing_upstream_without_usable_entry_raises():
+    upstream = FakeUpstream()
+    upstream.fail = True
+    cache = PriceCache(upstream, ttl=30, stale_ttl=60)
+
+    with pytest.raises(HTTPException):
+        asyncio.run(cache.get("bitcoin"))
+    assert cache.peek("bitcoin") is None
+
+
+def test_get_many_fetches_only_missing_coins():
+    requested = []
+
+    async def fetch_crypto_prices(coin_names):
+        requested.append(list(coin_names))
+        return {coin_name: 2.0 for coin_name in coin_names if coin_name != "unknown"}
+
+    cache = PriceCache(FakeUpstream(), ttl=30, stale_ttl=60, batch_fetcher=fetch_crypto_prices)
+    cache.put_many({"bitcoin": 1.0, "ethereum": 1.0})
+    age_entry(cache, "ethereum", 45)
+
+    result = asyncio.run(cache.get_many(["bitcoin", "ethereum", "solana", "unknown"]))
+
+    assert result == {"bitcoin": 1.0, "ethereum": 2.0, "solana": 2.0}
+    assert requested == [["ethereum", "solana", "unknown"]]
+    assert (cache.hits, cache.misses) == (1, 3)
+    assert asyncio.run(cache.get_many(["solana"])) == {"solana": 2.0}
+    assert len(requested) == 1
+
+
+def test_get_many_failure_is_counted_and_raised():
+    async def fetch_crypto_prices(coin_names):
+        raise HTTPException(status_code=503, detail="upstream down")
+
+    cache = PriceCache(FakeUpstream(), ttl=30, stale_ttl=60, batch_fetcher=fetch_crypto_prices)
+    cache.put_many({"bitcoin": 1.0})
+
+    with pytest.raises(HTTPException):
+        asyncio.run(cache.get_many(["bitcoin", "solana"]))
+    assert cache.upstream_errors == 1
+    assert asyncio.run(cache.get_many(["bitcoin"])) == {"bitcoin": 1.0}
+
+
+def test_api_prices_come_from_the_injected_fetchers(client, prices):
+    first = client.post("/invest", json={"coin": "bitcoin", "amount": 2})
+    again = client.post("/invest", json={"coin": "bitcoin", "amount": 1})
+
+    assert first.status_code == again.status_code == 200
+    assert first.json()["investment"]["price_per_coin_usd"] == 50000.0
+    assert prices.calls == [["bitcoin"]]
+    assert client.get("/prices/cache").json()["cache"]["hits"] >= 1
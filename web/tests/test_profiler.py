@@ -0,0 +1,85 @@
+"""QueryProfiler: statement normalization, slow-query log and EXPLAIN capture"""
+import asyncio
+import os
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from profiler import QueryProfiler, normalize_statement
+
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+
+def test_statements_differing_only_in_arguments_normalize_alike():
+    assert normalize_statement("SELECT * FROM t WHERE a = 'x''y' AND b = 42") == "SELECT * FROM t WHERE a = ? AND b = ?"
+    assert normalize_statement("SELECT * FROM t WHERE id IN ($1, $2, $3)") == "SELECT * FROM t WHERE id IN (...)"
+    assert (normalize_statement("INSERT INTO t (a, b) VALUES (?, ?), (?, ?)\n  RETURNING id")
+            == "INSERT INTO t (a, b) VALUES (...) RETURNING id")
+
+
+def run_statements(profiler, url, statements):
+    async def scenario():
+        engine = create_async_engine(url)
+        profiler.instrument(engine, "test")
+        try:
+            async with engine.connect() as conn:
+                for statement, params in statements:
+                    await conn.execute(text(statement), params)
+            # Plans are captured in the background
+            while any(entry.explaining for entry in profiler.statements.values()):
+                await asyncio.sleep(0.01)
+        finally:
+            await engine.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_executions_are_aggregated_per_statement(tmp_path):
+    profiler = QueryProfiler(threshold_ms=10_000)
+
+    run_statements(profiler, f"sqlite+aiosqlite:///{tmp_path / 'p.db'}",
+                   [("SELECT :n", {"n": n}) for n in range(3)] + [("SELECT 1, 2", {})])
+
+    report = profiler.report()
+    assert {entry["statement"]: entry["count"] for entry in report["statements"]} == {"SELECT ?": 3, "SELECT ?, ?": 1}
+    assert report["slow_queries"] == []
+
+
+def test_statements_over_the_threshold_are_logged_without_plan_on_sqlite(tmp_path):
+    profiler = QueryProfiler(threshold_ms=0, explain_sample=1)
+
+    run_statements(profiler, f"sqlite+aiosqlite:///{tmp_path / 'p.db'}", [("SELECT 1", {})])
+
+    assert profiler.report()["slow_queries"][0]["statement"] == "SELECT ?"
+    assert profiler.report()["statements"][0]["plan"] is None
+
+
+def test_statement_table_is_bounded():
+    profiler = QueryProfiler(max_statements=2)
+
+    for n in ("a", "b", "c"):
+        profiler.record(None, "test", f"SELECT {n} FROM t", None, False, 1.0)
+
+    assert len(profiler.statements) == 2
+    assert profiler.report()["untracked_executions"] == 1
+
+
+@pytest.mark.skipif(not TEST_POSTGRES_URL, reason="set TEST_POSTGRES_URL to a PostgreSQL database")
+def test_slow_select_gets_its_plan_captured():
+    profiler = QueryProfiler(threshold_ms=0, explain_sample=1)
+    url = TEST_POSTGRES_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+
+    run_statements(profiler, url, [("SELECT count(*) FROM generate_series(1, :n)", {"n": 1000})])
+
+    plans = [entry["plan"] for entry in profiler.report()["statements"] if entry["statement"].startswith("SELECT")]
+    assert plans and "Aggregate" in plans[0]
+
+
+def test_endpoint_reports_the_api_statements(client):
+    client.delete("/debug/queries")
+    client.post("/invest", json={"coin": "bitcoin", "amount": 1})
+
+    statements = [entry["statement"] for entry in client.get("/debug/queries", params={"limit": 500}).json()["statements"]]
+
+    assert any(statement.startswith("INSERT INTO investments") for statement in statements)
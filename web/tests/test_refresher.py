@@ -0,0 +1,90 @@
+"""PriceRefresher: batched refreshes of the tracked coins and the staleness limit"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from prices import PriceCache, PriceRefresher
+from test_prices import FakeUpstream, age_entry
+
+
+class FakeBatches:
+    """Stand-in for fetch_crypto_prices: records each batch, can fail chosen coins"""
+
+    def __init__(self, failing=()):
+        self.batches = []
+        self.failing = set(failing)
+
+    async def __call__(self, coin_names):
+        self.batches.append(list(coin_names))
+        if self.failing & set(coin_names):
+            raise HTTPException(status_code=503, detail="upstream down")
+        return {coin_name: float(len(coin_name)) for coin_name in coin_names}
+
+
+def test_refresh_fetches_every_tracked_coin_in_batches():
+    async def coin_source():
+        return ["cardano", "bitcoin"]
+
+    cache = PriceCache(FakeUpstream())
+    cache.put_many({"dogecoin": 1.0})  # seen by a reader since the last refresh
+    batches = FakeBatches()
+    refresher = PriceRefresher(cache, coin_source, static_coins=["bitcoin", "ethereum"],
+                               batch_fetcher=batches, batch_size=2)
+
+    asyncio.run(refresher.refresh())
+
+    assert batches.batches == [["bitcoin", "cardano"], ["dogecoin", "ethereum"]]
+    assert cache.peek("cardano")[0] == 7.0
+    assert refresher.stats()["refreshes"] == 1
+
+
+def test_failed_batch_does_not_stop_the_others():
+    cache = PriceCache(FakeUpstream())
+    refresher = PriceRefresher(cache, static_coins=["bitcoin", "ethereum", "solana"],
+                               batch_fetcher=FakeBatches(failing=["bitcoin"]), batch_size=1)
+
+    asyncio.run(refresher.refresh())
+
+    assert cache.peek("bitcoin") is None
+    assert cache.peek("solana")[0] == 6.0
+    assert refresher.refresh_errors == 1
+
+
+def test_coin_list_is_reloaded_only_after_its_interval():
+    loads = []
+
+    async def coin_source():
+        loads.append(1)
+        return []
+
+    refresher = PriceRefresher(PriceCache(FakeUpstream()), coin_source,
+                               batch_fetcher=FakeBatches(), coin_list_interval=60)
+
+    async def twice():
+        await refresher.refresh()
+        await refresher.refresh()
+
+    asyncio.run(twice())
+    assert len(loads) == 1
+
+
+def test_unknown_coin_is_fetched_once_and_tracked():
+    upstream = FakeUpstream(price=42.0)
+    refresher = PriceRefresher(PriceCache(upstream), batch_fetcher=FakeBatches())
+
+    assert asyncio.run(refresher.get("monero")) == 42.0
+    assert refresher.tracked_coins() == ["monero"]
+    assert upstream.calls == ["monero"]
+
+
+def test_snapshot_older_than_the_limit_is_refused():
+    cache = PriceCache(FakeUpstream(), ttl=1000, stale_ttl=1000)
+    cache.put_many({"bitcoin": 50000.0})
+    refresher = PriceRefresher(cache, batch_fetcher=FakeBatches(), max_staleness=30)
+
+    assert asyncio.run(refresher.get("bitcoin")) == 50000.0
+    age_entry(cache, "bitcoin", 31)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(refresher.get("bitcoin"))
+    assert error.value.status_code == 503
@@ -0,0 +1,112 @@
+"""ReplicaPool: least-outstanding balancing, lag ejection and master fallback"""
+import asyncio
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from replicas import ReplicaNode, ReplicaPool
+from test_replication import FakeEngine
+
+
+@pytest.fixture
+def sqlite_pool(tmp_path):
+    """Two SQLite "replicas" and a SQLite "master", each its own file"""
+    engines = {name: create_async_engine(f"sqlite+aiosqlite:///{tmp_path / name}.db")
+               for name in ("replica1", "replica2", "master")}
+    pool = ReplicaPool([ReplicaNode(name, engines[name]) for name in ("replica1", "replica2")],
+                       engines["master"])
+    yield pool
+    for engine in engines.values():
+        asyncio.run(engine.dispose())
+
+
+def test_pick_prefers_the_fewest_requests_in_flight(sqlite_pool):
+    first, second = sqlite_pool.replicas
+    first.outstanding = 3
+    assert sqlite_pool.pick() is second
+
+    second.healthy = False
+    assert sqlite_pool.pick() is first
+
+    first.healthy = False
+    assert sqlite_pool.pick() is None
+
+
+def test_concurrent_sessions_are_spread_over_replicas(sqlite_pool):
+    async def read():
+        async with sqlite_pool.session() as (db, source):
+            await db.execute(text("SELECT 1"))
+            await asyncio.sleep(0.01)
+            return source
+
+    async def scenario():
+        return await asyncio.gather(*(read() for _ in range(4)))
+
+    sources = asyncio.run(scenario())
+
+    assert sorted(sources) == ["replica1", "replica1", "replica2", "replica2"]
+    assert [node.outstanding for node in sqlite_pool.replicas] == [0, 0]
+    assert [node.served for node in sqlite_pool.replicas] == [2, 2]
+
+
+def test_reads_fall_back_to_the_master(sqlite_pool):
+    for node in sqlite_pool.replicas:
+        node.healthy = False
+
+    async def read():
+        async with sqlite_pool.session() as (db, source):
+            return source
+
+    assert asyncio.run(read()) == "master"
+    assert sqlite_pool.master_fallbacks == 1
+
+
+def test_lost_connection_takes_the_replica_out(sqlite_pool):
+    async def read():
+        async with sqlite_pool.session() as (db, source):
+            raise ConnectionResetError("replica went away")
+
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(read())
+    first, second = sqlite_pool.replicas
+    assert not first.healthy and "went away" in first.last_error
+    assert first.outstanding == 0 and second.healthy
+
+
+def lagging_pool(replica_rows, max_lag_bytes=0x1000):
+    master = FakeEngine([("0/5000",)])
+    replica = FakeEngine(replica_rows)
+    return ReplicaPool([ReplicaNode("replica", replica)], master, max_lag_bytes=max_lag_bytes,
+                       max_lag_seconds=30)
+
+
+def test_replica_over_the_byte_limit_is_ejected_and_readmitted():
+    pool = lagging_pool([("0/2000", 1.0), (0x3000,), ("0/4800", 0.5), (0x800,)])
+    node = pool.replicas[0]
+
+    asyncio.run(pool.check_all())
+    assert not node.healthy and node.lag_bytes == 0x3000
+
+    pool.master_engine.rows.append(("0/5000",))
+    asyncio.run(pool.check_all())
+    assert node.healthy and node.lag_bytes == 0x800
+
+
+def test_replica_over_the_time_limit_is_ejected():
+    pool = lagging_pool([("0/5000", 45.0), (0,)])
+
+    asyncio.run(pool.check_all())
+
+    assert not pool.replicas[0].healthy
+    assert pool.stats()["healthy"] == 0
+
+
+def test_unreachable_replica_is_ejected_with_unknown_lag():
+    pool = lagging_pool([ConnectionRefusedError("down")])
+
+    asyncio.run(pool.check_all())
+
+    node = pool.replicas[0]
+    assert not node.healthy
+    assert node.lag_bytes is None and node.lag_seconds is None
@@ -0,0 +1,95 @@
+"""ReplicationMonitor: lag points, percentiles and the /replication/lag endpoint"""
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from replication import ReplicationMonitor, distribution, lsn_to_int
+
+
+class FakeResult:
+    def __init__(self, row):
+        self.row = row
+
+    def one(self):
+        return self.row
+
+    def scalar(self):
+        return self.row[0]
+
+    def all(self):
+        return []
+
+
+class FakeEngine:
+    """Async engine whose every statement returns the next queued row"""
+
+    def __init__(self, rows, dialect="postgresql"):
+        self.rows = list(rows)
+        self.dialect = type("Dialect", (), {"name": dialect})()
+        self.connections = 0
+
+    @asynccontextmanager
+    async def connect(self):
+        self.connections += 1
+        engine = self
+
+        class Connection:
+            async def execute(self, statement, *args):
+                row = engine.rows.pop(0)
+                if isinstance(row, Exception):
+                    raise row
+                return FakeResult(row)
+
+        yield Connection()
+
+
+def test_lsn_to_int():
+    assert lsn_to_int("0/0") == 0
+    assert lsn_to_int("0/3000") == 0x3000
+    assert lsn_to_int("1/10") == (1 << 32) + 0x10
+
+
+def test_distribution():
+    assert distribution([]) is None
+    summary = distribution(list(range(1, 101)))
+    assert summary["mean"] == 50.5
+    assert summary["max"] == 100
+    assert summary["p50"] == pytest.approx(50.5)
+    assert summary["p99"] == pytest.approx(99.01)
+
+
+def test_every_sample_probes_each_replica():
+    master = FakeEngine([("0/3000",), None, ("0/5000",), None])
+    replica = FakeEngine([("0/3000", "0/2000", 0.25), ("0/5000", "0/4800", 0.5)])
+    monitor = ReplicationMonitor(master, [("replica", replica)], interval=1)
+
+    first, second = asyncio.run(monitor.sample()), asyncio.run(monitor.sample())
+
+    assert replica.connections == 2
+    assert first["replicas"]["replica"] == {"lag_bytes": 0x1000, "receive_lag_bytes": 0, "lag_seconds": 0.25}
+    assert second["replicas"]["replica"] == {"lag_bytes": 0x800, "receive_lag_bytes": 0, "lag_seconds": 0.5}
+    assert second["wal_rate_bytes_per_second"] is not None
+    summary = monitor.summary()
+    assert summary["samples"] == 2
+    assert summary["replicas"]["replica"]["lag_bytes"]["max"] == 0x1000
+
+
+def test_unreachable_replica_is_counted_as_error():
+    master = FakeEngine([("0/3000",), None])
+    replica = FakeEngine([ConnectionRefusedError("replica down")])
+    monitor = ReplicationMonitor(master, [("replica", replica)])
+
+    point = asyncio.run(monitor.sample())
+
+    assert "error" in point["replicas"]["replica"]
+    assert monitor.summary()["replicas"]["replica"]["errors"] == 1
+
+
+def test_monitor_requires_postgresql():
+    monitor = ReplicationMonitor(FakeEngine([], dialect="sqlite"), [])
+    assert monitor.stats()["mode"] == "unavailable"
+
+
+def test_endpoint_is_disabled_by_default(client):
+    assert client.get("/replication/lag").json()["mode"] == "disabled"
@@ -0,0 +1,69 @@
+"""
+Migrations: tables, indexes and the recorded schema version
+
+The PostgreSQL tests run only when TEST_POSTGRES_URL points to a throwaway
+database: they drop and recreate its tables.
+"""
+import os
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from models import Base, Investment
+from partitions import convert_to_partitioned, is_partitioned
+from schema import SCHEMA_VERSION, _index_names, migrate
+from shards import Shard, ShardSet
+
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+MODEL_INDEXES = {index.name for index in Investment.__table__.indexes}
+
+
+def single_shard(engine) -> ShardSet:
+    return ShardSet([Shard(0, "shard0", "test", lambda shard: engine, lambda shard: (None, None))])
+
+
+def test_migrate_twice_on_sqlite(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'schema.db'}")
+    shards = single_shard(engine)
+
+    assert migrate(shards) == {"shard0": True}
+    assert migrate(shards) == {"shard0": False}
+    with engine.connect() as conn:
+        assert conn.scalar(text("SELECT max(version) FROM schema_version")) == SCHEMA_VERSION
+
+
+@pytest.fixture
+def postgres():
+    if not TEST_POSTGRES_URL:
+        pytest.skip("set TEST_POSTGRES_URL to a throwaway PostgreSQL database")
+    engine = create_engine(TEST_POSTGRES_URL)
+    Base.metadata.drop_all(engine)
+    yield engine
+    Base.metadata.drop_all(engine)
+    engine.dispose()
+
+
+def test_migrate_twice_on_a_partitioned_table(postgres):
+    shards = single_shard(postgres)
+    migrate(shards)
+    with Session(postgres) as db:
+        convert_to_partitioned(db)
+        assert is_partitioned(db)
+
+    assert migrate(shards) == {"shard0": False}
+    assert MODEL_INDEXES <= _index_names(postgres)
+
+
+def test_missing_index_is_created_on_a_partitioned_table(postgres):
+    shards = single_shard(postgres)
+    migrate(shards)
+    with Session(postgres) as db:
+        convert_to_partitioned(db)
+    with postgres.begin() as conn:
+        conn.execute(text("DROP INDEX ix_investments_timestamp_brin"))
+
+    assert migrate(shards) == {"shard0": True}
+    assert MODEL_INDEXES <= _index_names(postgres)
+    assert migrate(shards) == {"shard0": False}
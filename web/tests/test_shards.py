@@ -0,0 +1,87 @@
+"""Merging per-shard results and the interleaved id sequences"""
+import asyncio
+from operator import itemgetter
+
+import pytest
+
+from shards import first_interleaved_id, merge_sorted, merge_streams
+
+
+async def stream(rows):
+    for row in rows:
+        await asyncio.sleep(0)
+        yield row
+
+
+async def collect(iterator):
+    return [row async for row in iterator]
+
+
+def test_merge_sorted_descending():
+    shard0 = [(9, "a"), (5, "b"), (1, "c")]
+    shard1 = [(8, "d"), (5, "e"), (2, "f")]
+
+    merged = merge_sorted([shard0, shard1], key=itemgetter(0), reverse=True)
+
+    assert [row[0] for row in merged] == [9, 8, 5, 5, 2, 1]
+
+
+def test_merge_sorted_single_shard_is_returned_as_is():
+    rows = [(3,), (2,), (1,)]
+    assert merge_sorted([rows], key=itemgetter(0), reverse=True) is rows
+
+
+@pytest.mark.parametrize("reverse", [False, True])
+def test_merge_streams_matches_merge_sorted(reverse):
+    shards = [
+        sorted([(n, "s0") for n in (1, 4, 5, 10, 12)], reverse=reverse),
+        sorted([(n, "s1") for n in (2, 3, 6, 11)], reverse=reverse),
+        [],
+        sorted([(n, "s3") for n in (0, 20)], reverse=reverse),
+    ]
+    expected = merge_sorted(shards, key=itemgetter(0), reverse=reverse)
+
+    merged = asyncio.run(collect(merge_streams([stream(rows) for rows in shards], key=itemgetter(0), reverse=reverse)))
+
+    assert merged == expected
+
+
+def test_merge_streams_stops_reading_when_closed_early():
+    read = []
+
+    async def tracked(rows):
+        for row in rows:
+            read.append(row)
+            yield row
+
+    async def first_three():
+        merged = merge_streams([tracked(range(100, 0, -2)), tracked(range(99, 0, -2))], key=lambda n: n, reverse=True)
+        rows = []
+        async for row in merged:
+            rows.append(row)
+            if len(rows) == 3:
+                break
+        await merged.aclose()
+        return rows
+
+    assert asyncio.run(first_three()) == [100, 99, 98]
+    assert len(read) <= 5  # one row buffered per stream beyond the ones returned
+
+
+@pytest.mark.parametrize("lowest", [1, 2, 7, 1000, 180991])
+@pytest.mark.parametrize("count", [1, 2, 3, 5])
+def test_first_interleaved_id(lowest, count):
+    for index in range(count):
+        next_id = first_interleaved_id(lowest, index, count)
+        assert lowest <= next_id < lowest + count
+        assert next_id % count == (index + 1) % count
+
+
+def test_interleaved_series_never_collide():
+    count, lowest = 3, 101
+    series = [
+        set(range(first_interleaved_id(lowest, index, count), lowest + 300, count))
+        for index in range(count)
+    ]
+    assert set.union(*series) == set(range(lowest, lowest + 300))
+    assert sum(len(ids) for ids in series) == 300
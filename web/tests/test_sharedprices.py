@@ -0,0 +1,135 @@
+"""SharedPriceSnapshot: seqlock slots shared by a leader and follower workers"""
+import asyncio
+
+import pytest
+
+import sharedprices
+from prices import PriceCache
+from sharedprices import SharedPriceSnapshot
+
+pytestmark = pytest.mark.skipif(sharedprices.fcntl is None, reason="the shared snapshot needs fcntl")
+
+
+class FakeUpstream:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, coin_name: str) -> float:
+        self.calls.append(coin_name)
+        return 7.0
+
+    async def many(self, coin_names) -> dict:
+        self.calls.extend(coin_names)
+        return {coin_name: 7.0 for coin_name in coin_names}
+
+
+@pytest.fixture
+def workers(tmp_path):
+    """Two mappings of one snapshot file, as two uvicorn workers would have"""
+    upstream = FakeUpstream()
+    path = str(tmp_path / "prices.snapshot")
+    snapshots = [
+        SharedPriceSnapshot(PriceCache(upstream, batch_fetcher=upstream.many), path=path, slots=8)
+        for _ in range(2)
+    ]
+    for snapshot in snapshots:
+        snapshot.open()
+    leader, follower = snapshots
+    assert leader.try_lead() and not follower.try_lead()
+    yield leader, follower, upstream
+    for snapshot in snapshots:
+        snapshot.close()
+
+
+def test_follower_reads_leader_prices(workers):
+    leader, follower, upstream = workers
+    leader.put_many({"bitcoin": 50000.0, "ethereum": 3000.0})
+
+    assert follower.peek("bitcoin")[0] == 50000.0
+    assert asyncio.run(follower.get_many(["bitcoin", "ethereum"])) == {"bitcoin": 50000.0, "ethereum": 3000.0}
+    assert upstream.calls == []
+
+
+def test_follower_ignores_slot_being_written(workers):
+    leader, follower, _ = workers
+    leader.put_many({"bitcoin": 50000.0})
+    offset = follower._slot_offset("bitcoin")
+    sequence = sharedprices._SEQUENCE.unpack_from(leader._mm, offset)[0]
+    sharedprices._SEQUENCE.pack_into(leader._mm, offset, sequence + 1)  # writer mid-update
+
+    assert follower.peek("bitcoin") is None
+    sharedprices._SEQUENCE.pack_into(leader._mm, offset, sequence + 2)
+    assert follower.peek("bitcoin")[0] == 50000.0
+
+
+def test_follower_miss_is_requested_from_leader(workers):
+    leader, follower, upstream = workers
+
+    assert asyncio.run(follower.get("solana")) == 7.0
+    assert upstream.calls == ["solana"]
+    assert "solana" in leader.coins()
+    leader.put_many({"solana": 8.0})
+    assert asyncio.run(follower.get("solana")) == 8.0
+
+
+@pytest.mark.parametrize("coin_name", ["x" * 55, "é" * 28, "x" * 53 + "é"])
+def test_name_longer_than_a_slot_is_not_shared(workers, coin_name):
+    leader, follower, upstream = workers
+
+    assert asyncio.run(follower.get(coin_name)) == 7.0
+    leader.put_many({coin_name: 8.0})
+
+    assert leader.coins() == follower.coins() == []
+    assert follower.too_long == 1 and leader.too_long == 1
+    assert asyncio.run(follower.get(coin_name)) == 7.0  # its own cache, no new upstream call
+    assert upstream.calls == [coin_name]
+
+
+def test_name_filling_a_slot_is_shared_whole(workers):
+    leader, follower, _ = workers
+    coin_name = "é" * 27  # 54 bytes
+    leader.put_many({coin_name: 1.5})
+
+    assert follower.peek(coin_name)[0] == 1.5
+    assert follower.coins() == [coin_name]
+
+
+def test_restarted_leader_reuses_slots(workers, tmp_path):
+    leader, follower, _ = workers
+    leader.put_many({"bitcoin": 1.0, "ethereum": 2.0})
+    leader.close()
+
+    restarted = SharedPriceSnapshot(PriceCache(), path=str(tmp_path / "prices.snapshot"), slots=8)
+    restarted.open()
+    try:
+        assert restarted.try_lead()
+        restarted.put_many({"bitcoin": 3.0})
+        assert restarted.stats()["slots_used"] == 2
+        assert follower.peek("bitcoin")[0] == 3.0
+    finally:
+        restarted.close()
+
+
+def test_other_slot_count_maps_its_own_file(workers, tmp_path):
+    leader, follower, _ = workers
+    leader.put_many({"bitcoin": 1.0})
+
+    resized = SharedPriceSnapshot(PriceCache(), path=str(tmp_path / "prices.snapshot"), slots=16)
+    resized.open()
+    try:
+        assert resized.path != leader.path
+        assert resized.coins() == []
+        assert follower.peek("bitcoin")[0] == 1.0  # the running workers' mapping is untouched
+    finally:
+        resized.close()
+
+
+def test_foreign_file_is_refused_not_truncated(tmp_path):
+    snapshot = SharedPriceSnapshot(PriceCache(), path=str(tmp_path / "prices.snapshot"), slots=8)
+    with open(snapshot.path, "wb") as other:
+        other.write(b"not a snapshot" * 100)
+
+    with pytest.raises(RuntimeError, match="not a price snapshot"):
+        snapshot.open()
+    with open(snapshot.path, "rb") as other:
+        assert other.read() == b"not a snapshot" * 100
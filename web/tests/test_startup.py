@@ -0,0 +1,91 @@
+"""Startup: no database work at import, the background schema check, deprecated aliases"""
+import asyncio
+import os
+import subprocess
+import sys
+import warnings
+
+import pytest
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import database
+from models import SchemaVersion
+from schema import SCHEMA_VERSION, SchemaCheck, create_schema
+from shards import Shard, ShardSet
+
+WEB = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_CHECK = """
+import sys
+import main
+from database import shards
+assert not any(shard.async_started for shard in shards), "async engines built at import"
+assert not any("engine_master" in vars(shard) for shard in shards), "sync engine built at import"
+assert "asyncpg" not in sys.modules and "psycopg2" not in sys.modules, "driver loaded at import"
+print("ok")
+"""
+
+
+def test_import_touches_no_database():
+    env = dict(os.environ,
+               DATABASE_MASTER_URL="postgresql://admin@127.0.0.1:9/unreachable",
+               DATABASE_REPLICA_URLS="postgresql://admin@127.0.0.1:9/unreachable")
+
+    result = subprocess.run([sys.executable, "-c", IMPORT_CHECK], cwd=WEB, env=env,
+                            capture_output=True, text=True, timeout=60)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().endswith("ok")
+
+
+@pytest.fixture
+def check_shard(tmp_path):
+    """One SQLite shard with a background SchemaCheck over it"""
+    url = f"sqlite:///{tmp_path / 'check.db'}"
+    engine = create_engine(url)
+    async_engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://", 1))
+    shards = ShardSet([Shard(0, "shard0", "test", lambda shard: engine, lambda shard: (async_engine, None))])
+    yield engine, SchemaCheck(shards, retry_interval=0.01)
+    asyncio.run(async_engine.dispose())
+
+
+def run_check(check: SchemaCheck) -> str:
+    async def scenario():
+        check.start()
+        await check._task
+    asyncio.run(scenario())
+    return check.state
+
+
+def test_schema_check_reports_missing_schema(check_shard):
+    _, check = check_shard
+    assert check.state == "pending"
+    assert run_check(check) == "missing"
+
+
+def test_schema_check_reports_current_and_outdated_schema(check_shard):
+    engine, check = check_shard
+    create_schema(engine)
+    assert run_check(check) == "ok"
+
+    with engine.begin() as conn:
+        conn.execute(SchemaVersion.__table__.delete())
+        conn.execute(insert(SchemaVersion).values(version=SCHEMA_VERSION - 1))
+    assert run_check(check) == "outdated"
+
+
+def test_health_and_startup_report(client):
+    assert client.get("/health").json()["schema"]["state"] == "ok"
+    phases = [phase["phase"] for phase in client.get("/debug/startup").json()["phases"]]
+    assert phases[:2] == ["import libraries", "import database"]
+
+
+def test_deprecated_replica_alias_warns():
+    with pytest.warns(DeprecationWarning, match="engine_replica"):
+        engine = database.engine_replica
+    assert engine.url.database == database.make_url(database.DATABASE_REPLICA_URL).database
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert database.engine_master is database.shards.shards[0].engine_master
@@ -0,0 +1,64 @@
+"""GET /stats: per-coin totals, coin filter and time windows"""
+from datetime import datetime
+
+from sqlalchemy import update
+
+from database import shards
+from models import Investment
+
+
+def invest(client, coin, amount):
+    return client.post("/invest", json={"coin": coin, "amount": amount}).json()["investment"]["id"]
+
+
+def move_to(investment_id, timestamp):
+    for shard in shards:
+        with shard.session_master() as db:
+            db.execute(update(Investment).where(Investment.id == investment_id).values(timestamp=timestamp))
+            db.commit()
+
+
+def test_empty_history(client):
+    assert client.get("/stats").json() == {"total_investments": 0, "total_value_usd": 0, "coins": []}
+
+
+def test_totals_per_coin(client):
+    invest(client, "bitcoin", 1)
+    invest(client, "bitcoin", 0.5)
+    invest(client, "ethereum", 2)
+
+    stats = client.get("/stats").json()
+
+    assert stats["total_investments"] == 3
+    assert stats["total_value_usd"] == 75000 + 6000
+    assert stats["coins"]["bitcoin"] == {"total_amount": 1.5, "total_value_usd": 75000, "count": 2}
+    assert client.get("/stats", params={"coin": " Ethereum"}).json()["coins"] == {
+        "ethereum": {"total_amount": 2, "total_value_usd": 6000, "count": 1}
+    }
+
+
+def test_window_aggregates_only_its_rows(client):
+    january = invest(client, "bitcoin", 1)
+    invest(client, "bitcoin", 2)
+    march = invest(client, "ethereum", 3)
+    move_to(january, datetime(2026, 1, 15))
+    move_to(march, datetime(2026, 3, 1))
+
+    window = client.get("/stats", params={"start": "2026-01-01T00:00:00", "end": "2026-03-01T00:00:00"}).json()
+    assert window["total_investments"] == 1
+    assert window["coins"] == {"bitcoin": {"total_amount": 1, "total_value_usd": 50000, "count": 1}}
+
+    since_march = client.get("/stats", params={"start": "2026-03-01T00:00:00"}).json()
+    assert since_march["total_investments"] == 2  # march and the row written now
+    assert set(since_march["coins"]) == {"bitcoin", "ethereum"}
+
+
+def test_window_and_totals_agree(client):
+    for coin, amount in [("bitcoin", 1), ("solana", 4), ("solana", 6)]:
+        invest(client, coin, amount)
+
+    totals = client.get("/stats").json()
+    window = client.get("/stats", params={"start": "2000-01-01T00:00:00"}).json()
+
+    assert window["coins"] == totals["coins"]
+    assert window["total_value_usd"] == totals["total_value_usd"]
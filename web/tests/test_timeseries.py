@@ -0,0 +1,68 @@
+"""GET /history/timeseries: buckets, running totals and the per-shard merge"""
+from datetime import datetime
+
+from main import merge_timeseries
+from test_stats import invest, move_to
+
+
+def seed(client):
+    """Five investments over two days: 50000 + 2x3000 on day 1, 100 + 50000 on day 2"""
+    placed = [
+        ("bitcoin", 1, datetime(2026, 5, 1, 9, 15)),
+        ("ethereum", 1, datetime(2026, 5, 1, 9, 45)),
+        ("ethereum", 1, datetime(2026, 5, 1, 11, 5)),
+        ("solana", 1, datetime(2026, 5, 2, 8, 0)),
+        ("bitcoin", 1, datetime(2026, 5, 2, 23, 59, 59)),
+    ]
+    for coin, amount, timestamp in placed:
+        move_to(invest(client, coin, amount), timestamp)
+
+
+def test_hourly_buckets_with_running_total(client):
+    seed(client)
+
+    series = client.get("/history/timeseries", params={"bucket": "1h"}).json()
+
+    assert series["bucket"] == "1h"
+    assert [(p["timestamp"], p["count"], p["invested_usd"], p["cumulative_usd"]) for p in series["points"]] == [
+        ("2026-05-01T09:00:00", 2, 53000, 53000),
+        ("2026-05-01T11:00:00", 1, 3000, 56000),
+        ("2026-05-02T08:00:00", 1, 100, 56100),
+        ("2026-05-02T23:00:00", 1, 50000, 106100),
+    ]
+
+
+def test_daily_buckets_for_one_coin(client):
+    seed(client)
+
+    series = client.get("/history/timeseries", params={"bucket": "1d", "coin": "Bitcoin"}).json()
+
+    assert series["coin"] == "bitcoin"
+    assert [(p["timestamp"], p["cumulative_usd"]) for p in series["points"]] == [
+        ("2026-05-01T00:00:00", 50000),
+        ("2026-05-02T00:00:00", 100000),
+    ]
+
+
+def test_running_total_starts_at_the_window(client):
+    seed(client)
+
+    points = client.get("/history/timeseries", params={"bucket": "1d", "start": "2026-05-02T00:00:00"}).json()["points"]
+
+    assert [(p["count"], p["cumulative_usd"]) for p in points] == [(2, 50100)]
+
+
+def test_unknown_bucket_is_422(client):
+    assert client.get("/history/timeseries", params={"bucket": "5m"}).status_code == 422
+
+
+def test_shard_series_are_summed_by_bucket():
+    shard0 = [("2026-05-01 09:00:00", 2, 10.0, 10.0), ("2026-05-01 11:00:00", 1, 5.0, 15.0)]
+    shard1 = [("2026-05-01 10:00:00", 1, 1.0, 1.0), ("2026-05-01 11:00:00", 3, 2.0, 3.0)]
+
+    assert merge_timeseries([shard0, shard1]) == [
+        ("2026-05-01 09:00:00", 2, 10.0, 10.0),
+        ("2026-05-01 10:00:00", 1, 1.0, 11.0),
+        ("2026-05-01 11:00:00", 4, 7.0, 18.0),
+    ]
+    assert merge_timeseries([shard0]) is shard0
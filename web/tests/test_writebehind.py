@@ -0,0 +1,109 @@
+"""GroupCommitWriter: grouping, deadline, backpressure and per-shard metrics"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from metrics import GROUP_COMMIT_QUEUE_DEPTH, GROUP_COMMIT_REJECTED, GROUP_COMMIT_ROWS
+from writebehind import GroupCommitWriter
+
+
+class FakeFlush:
+    """Records each group and hands out sequential ids"""
+
+    def __init__(self, gate: asyncio.Event = None):
+        self.groups = []
+        self.gate = gate
+        self.next_id = 1
+
+    async def __call__(self, rows):
+        if self.gate is not None:
+            await self.gate.wait()
+        self.groups.append([row["n"] for row in rows])
+        ids = list(range(self.next_id, self.next_id + len(rows)))
+        self.next_id += len(rows)
+        return ids, "token"
+
+
+def test_rows_arriving_within_the_deadline_share_one_commit():
+    async def scenario():
+        flush = FakeFlush()
+        writer = GroupCommitWriter(flush, name="deadline", max_rows=100, max_delay=0.2)
+        writer.start()
+        first = asyncio.ensure_future(writer.submit({"n": 0}))
+        await asyncio.sleep(0.05)  # later than the first row, inside its deadline
+        rest = [writer.submit({"n": n}) for n in (1, 2)]
+        results = await asyncio.gather(first, *rest)
+        await writer.stop()
+        return flush, results
+
+    flush, results = asyncio.run(scenario())
+
+    assert flush.groups == [[0, 1, 2]]
+    assert results == [(1, "token"), (2, "token"), (3, "token")]
+
+
+def test_group_is_cut_at_max_rows_and_after_the_deadline():
+    async def scenario():
+        flush = FakeFlush()
+        writer = GroupCommitWriter(flush, name="cut", max_rows=2, max_delay=0.01)
+        writer.start()
+        await asyncio.gather(*(writer.submit({"n": n}) for n in range(3)))
+        await asyncio.sleep(0.05)
+        await writer.submit({"n": 3})
+        await writer.stop()
+        return flush
+
+    assert asyncio.run(scenario()).groups == [[0, 1], [2], [3]]
+
+
+def test_full_queue_is_refused_with_503_per_shard():
+    async def scenario():
+        gate = asyncio.Event()
+        writer = GroupCommitWriter(FakeFlush(gate), name="full", max_rows=1, max_delay=0,
+                                   queue_size=1, enqueue_timeout=0.05)
+        writer.start()
+        held = asyncio.ensure_future(writer.submit({"n": 0}))  # taken by the writer, blocked on the gate
+        await asyncio.sleep(0.01)
+        queued = asyncio.ensure_future(writer.submit({"n": 1}))  # fills the queue
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as error:
+            await writer.submit({"n": 2})
+        gate.set()
+        await asyncio.gather(held, queued)
+        await writer.stop()
+        return error.value
+
+    rejected = GROUP_COMMIT_REJECTED.value("full")
+    error = asyncio.run(scenario())
+
+    assert error.status_code == 503 and error.headers["Retry-After"] == "1"
+    assert GROUP_COMMIT_REJECTED.value("full") == rejected + 1
+    assert GROUP_COMMIT_REJECTED.value("cut") == 0
+
+
+def test_metrics_are_labelled_by_shard():
+    async def scenario():
+        writers = [GroupCommitWriter(FakeFlush(), name=name, max_delay=0) for name in ("shard-a", "shard-b")]
+        for writer in writers:
+            writer.start()
+        await writers[0].submit({"n": 0})
+        await asyncio.gather(*(writers[1].submit({"n": n}) for n in range(2)))
+        for writer in writers:
+            await writer.stop()
+
+    asyncio.run(scenario())
+
+    assert GROUP_COMMIT_ROWS.count("shard-a") == 1
+    assert GROUP_COMMIT_ROWS.count("shard-b") >= 1
+    assert GROUP_COMMIT_QUEUE_DEPTH.value("shard-a") == 0
+
+
+def test_stopped_writer_refuses_rows():
+    async def scenario():
+        writer = GroupCommitWriter(FakeFlush())
+        await writer.submit({"n": 0})
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(scenario())
+    assert error.value.status_code == 503
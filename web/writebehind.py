@@ -0,0 +1,205 @@
+"""
+Group commit for POST /invest.
+
+With INVEST_GROUP_COMMIT=1, validated and priced investments are put on a
+bounded in-process queue instead of being committed one by one. A single
+writer task drains the queue in groups (up to GROUP_COMMIT_MAX_ROWS rows, or
+whatever arrived within GROUP_COMMIT_MAX_DELAY of the first one) and writes
+each group in one transaction, so the master pays one fsync per group
+instead of one per investment. Every request still waits for its own row:
+submit() returns only after the group holding it has committed, with the
+row's id. When the queue stays full, requests fail fast with 503.
+"""
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from metrics import (
+    GROUP_COMMIT_DURATION, GROUP_COMMIT_QUEUE_DEPTH, GROUP_COMMIT_REJECTED,
+    GROUP_COMMIT_ROWS, GROUP_COMMIT_WAIT
+)
+
+# ============================================
+# CONFIGURATION
+# ============================================
+# Route POST /invest through the group-commit writer
+INVEST_GROUP_COMMIT = os.getenv("INVEST_GROUP_COMMIT", "0") == "1"
+
+# Largest group written in one transaction
+GROUP_COMMIT_MAX_ROWS = int(os.getenv("GROUP_COMMIT_MAX_ROWS", "500"))
+
+# Seconds the writer waits for more rows after the first one of a group
+GROUP_COMMIT_MAX_DELAY = float(os.getenv("GROUP_COMMIT_MAX_DELAY", "0.005"))
+
+# Investments waiting to be written, per worker
+GROUP_COMMIT_QUEUE_SIZE = int(os.getenv("GROUP_COMMIT_QUEUE_SIZE", "10000"))
+
+# Seconds a request waits for room in a full queue before getting 503
+GROUP_COMMIT_ENQUEUE_TIMEOUT = float(os.getenv("GROUP_COMMIT_ENQUEUE_TIMEOUT", "1"))
+
+# Writes one group (a list of Investment column dicts) and commits it;
+# returns the new ids in input order and the consistency token
+FlushFunction = Callable[[List[dict]], Awaitable[Tuple[List[int], Optional[str]]]]
+
+
+class GroupCommitWriter:
+    """Bounded queue of pending investments drained by one writer task"""
+
+    def __init__(self, flush: FlushFunction, name: str = "default",
+                 max_rows: int = GROUP_COMMIT_MAX_ROWS,
+                 max_delay: float = GROUP_COMMIT_MAX_DELAY,
+                 queue_size: int = GROUP_COMMIT_QUEUE_SIZE,
+                 enqueue_timeout: float = GROUP_COMMIT_ENQUEUE_TIMEOUT):
+        self.flush = flush
+        self.name = name
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.queue_size = queue_size
+        self.enqueue_timeout = enqueue_timeout
+        self.groups = 0
+        self.rows = 0
+        self.failed_groups = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    # ---------- lifecycle ----------
+    def start(self):
+        """Start the writer task on the running event loop"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(self.queue_size)
+        self._closing = False
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self, timeout: float = 10):
+        """Stop accepting rows, write what is queued (up to timeout) and stop"""
+        self._closing = True
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️  Group commit stopped with {self.depth()} investment(s) unwritten")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    # ---------- producers ----------
+    async def submit(self, values: dict) -> Tuple[int, Optional[str]]:
+        """
+        Queue one investment and wait until its group has committed
+
+        Args:
+            values: Investment column values (coin_name, amount,
+                purchase_price_usd, timestamp)
+
+        Returns:
+            (new investment id, consistency token of its group's commit)
+
+        Raises:
+            HTTPException: 503 if the writer is not running or the queue
+                stayed full for GROUP_COMMIT_ENQUEUE_TIMEOUT seconds
+        """
+        if not self.running or self._closing:
+            raise HTTPException(status_code=503, detail="Write queue is not accepting investments")
+
+        future = asyncio.get_running_loop().create_future()
+        item = (values, future, time.perf_counter())
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self._queue.put(item), self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                GROUP_COMMIT_REJECTED.inc(self.name)
+                raise HTTPException(
+                    status_code=503,
+                    detail="Write queue is full, retry later",
+                    headers={"Retry-After": "1"}
+                )
+        GROUP_COMMIT_QUEUE_DEPTH.set(self.name, value=self.depth())
+        return await future
+
+    # ---------- writer ----------
+    async def _next_group(self) -> list:
+        """Block for the first item, then gather more until full or the deadline passes"""
+        group = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(group) < self.max_rows:
+            try:
+                group.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                group.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return group
+
+    async def _loop(self):
+        while True:
+            group = await self._next_group()
+            GROUP_COMMIT_QUEUE_DEPTH.set(self.name, value=self.depth())
+            try:
+                await self._write(group)
+            finally:
+                for _ in group:
+                    self._queue.task_done()
+
+    async def _write(self, group: list):
+        # Requests cancelled while queued (client gone) are not written
+        pending = [(values, future, queued) for values, future, queued in group if not future.done()]
+        if not pending:
+            return
+
+        started = time.perf_counter()
+        try:
+            ids, token = await self.flush([values for values, _, _ in pending])
+        except Exception as e:
+            self.failed_groups += 1
+            print(f"⚠️  Group commit of {len(pending)} investment(s) failed: {e!r}")
+            for _, future, _ in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        finished = time.perf_counter()
+        self.groups += 1
+        self.rows += len(pending)
+        GROUP_COMMIT_ROWS.observe(len(pending), self.name)
+        GROUP_COMMIT_DURATION.observe(finished - started, self.name)
+        for (_, future, queued), investment_id in zip(pending, ids):
+            GROUP_COMMIT_WAIT.observe(finished - queued, self.name)
+            if not future.done():
+                future.set_result((investment_id, token))
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.running,
+            "queue_depth": self.depth(),
+            "queue_size": self.queue_size,
+            "max_rows": self.max_rows,
+            "max_delay_seconds": self.max_delay,
+            "groups": self.groups,
+            "rows": self.rows,
+            "failed_groups": self.failed_groups,
+            "avg_group_size": round(self.rows / self.groups, 2) if self.groups else None,
+        }